@@ -1,12 +1,60 @@
+import time
+from typing import Dict
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.config import settings
 
-engine = create_async_engine(settings.database_url, echo=settings.debug)
+engine = create_async_engine(
+    settings.database_url,
+    echo=settings.debug,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_seconds,
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
+
+class _PoolUsage:
+    """Checkout counters for /metrics (peak connections held and hold times)."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.max_checked_out = 0
+        self.hold_seconds = 0.0
+        self.max_hold_seconds = 0.0
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts += 1
+        self.max_checked_out = max(self.max_checked_out, engine.pool.checkedout())
+        connection_record.info["checked_out_at"] = time.monotonic()
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            held = time.monotonic() - started
+            self.hold_seconds += held
+            self.max_hold_seconds = max(self.max_hold_seconds, held)
+
+    def stats(self) -> Dict[str, object]:
+        pool = engine.pool
+        return {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "checked_out": pool.checkedout(),
+            "max_checked_out": self.max_checked_out,
+            "checkouts": self.checkouts,
+            "hold_avg_ms": round(self.hold_seconds / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+            "hold_max_ms": round(self.max_hold_seconds * 1000, 2),
+        }
+
+
+pool_usage = _PoolUsage()
+event.listen(engine.sync_engine.pool, "checkout", pool_usage.on_checkout)
+event.listen(engine.sync_engine.pool, "checkin", pool_usage.on_checkin)
+
 async def get_db():
     async with async_session() as session:
         try:
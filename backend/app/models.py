@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Text, Boolean, Integer, Numeric, ARRAY, ForeignKey, DateTime, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Text, Boolean, Integer, BigInteger, Float, Numeric, Date, ARRAY, ForeignKey, DateTime, CheckConstraint, Computed
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from app.database import Base
 
 class Project(Base):
@@ -11,16 +11,24 @@ class Project(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String(255), nullable=False)
     description = Column(Text)
-    username = Column(String(100), nullable=False, unique=True)
+    # Unique among live projects (partial index in init.sql)
+    username = Column(String(100), nullable=False)
     password_hash = Column(String(255), nullable=False)
+    # Limits for all of the project's API keys together; NULL uses the app default
+    rate_limit_rps = Column(Float)
+    daily_token_quota = Column(BigInteger)
+    # Chat history older than this is removed by partition maintenance; NULL keeps it forever
+    history_retention_days = Column(Integer)
+    # Set while a background deletion job removes the project; hidden from then on
+    deleted_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    api_keys = relationship("ProjectAPIKey", back_populates="project", cascade="all, delete-orphan")
-    agents = relationship("Agent", back_populates="project", cascade="all, delete-orphan")
-    chat_history = relationship("ChatHistory", back_populates="project", cascade="all, delete-orphan")
-    model_profiles = relationship("ModelProfile", back_populates="project", cascade="all, delete-orphan")
+    # Relationships (children are removed by ON DELETE CASCADE, never loaded to be deleted)
+    api_keys = relationship("ProjectAPIKey", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+    agents = relationship("Agent", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+    chat_history = relationship("ChatHistory", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
+    model_profiles = relationship("ModelProfile", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
 
 class ProjectAPIKey(Base):
     __tablename__ = "project_api_keys"
@@ -30,12 +38,15 @@ class ProjectAPIKey(Base):
     name = Column(String(100), nullable=False)
     api_key = Column(String(255), nullable=False, unique=True)
     is_active = Column(Boolean, default=True)
+    # Per-key limits; NULL uses the app default
+    rate_limit_rps = Column(Float)
+    daily_token_quota = Column(BigInteger)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     last_used_at = Column(DateTime(timezone=True))
     
     # Relationships
     project = relationship("Project", back_populates="api_keys")
-    chat_history = relationship("ChatHistory", back_populates="api_key")
+    chat_history = relationship("ChatHistory", back_populates="api_key", passive_deletes=True)
 
 
 class ModelProfile(Base):
@@ -60,12 +71,21 @@ class Agent(Base):
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
+    deleted_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     project = relationship("Project", back_populates="agents")
-    versions = relationship("AgentVersion", back_populates="agent", cascade="all, delete-orphan", order_by="AgentVersion.version_number.desc()")
+    # Versions being deleted in the background are left out
+    versions = relationship(
+        "AgentVersion",
+        back_populates="agent",
+        primaryjoin="and_(Agent.id == AgentVersion.agent_id, AgentVersion.deleted_at.is_(None))",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="AgentVersion.version_number.desc()",
+    )
 
 class AgentVersion(Base):
     __tablename__ = "agent_versions"
@@ -74,6 +94,9 @@ class AgentVersion(Base):
     agent_id = Column(UUID(as_uuid=True), ForeignKey("agents.id", ondelete="CASCADE"), nullable=False)
     version_number = Column(Integer, nullable=False)
     system_prompt = Column(Text, nullable=False)
+    # system_prompt compiled at creation: [literal, var, literal, ...] and its variables
+    prompt_segments = Column(JSONB)
+    prompt_variables = Column(ARRAY(Text))
     model_name = Column(String(100), nullable=False)
     api_key_encrypted = Column(Text, nullable=False)
     model_profile_id = Column(UUID(as_uuid=True), ForeignKey("model_profiles.id", ondelete="SET NULL"))
@@ -84,13 +107,19 @@ class AgentVersion(Base):
     frequency_penalty = Column(Numeric(3, 2), default=0.0)
     presence_penalty = Column(Numeric(3, 2), default=0.0)
     stop_sequences = Column(ARRAY(Text))
+    # Conversation window policy; NULL means use the application default
+    history_max_turns = Column(Integer)
+    history_max_tokens = Column(Integer)
+    # Serve identical requests from the response cache (only when temperature is 0)
+    response_cache_enabled = Column(Boolean, default=False)
     is_active = Column(Boolean, default=False)
+    deleted_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     notes = Column(Text)
     
     # Relationships
     agent = relationship("Agent", back_populates="versions")
-    chat_history = relationship("ChatHistory", back_populates="agent_version", cascade="all, delete-orphan")
+    chat_history = relationship("ChatHistory", back_populates="agent_version", cascade="all, delete-orphan", passive_deletes=True)
     model_profile = relationship("ModelProfile", back_populates="agent_versions")
 
 class ChatHistory(Base):
@@ -106,13 +135,176 @@ class ChatHistory(Base):
     tokens_used = Column(Integer)
     prompt_tokens = Column(Integer)
     completion_tokens = Column(Integer)
-    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    # Monthly range partition key, hence part of the primary key
+    created_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, default=datetime.utcnow)
+    # Full-text search document, computed by Postgres on insert (GIN-indexed);
+    # capped so an oversized message cannot exceed tsvector's 1 MB limit
+    content_tsv = deferred(Column(
+        TSVECTOR, Computed("to_tsvector('simple'::regconfig, left(content, 100000))", persisted=True)
+    ))
     
     __table_args__ = (
         CheckConstraint(role.in_(['user', 'assistant', 'system']), name='check_role'),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
     
     # Relationships
     project = relationship("Project", back_populates="chat_history")
     agent_version = relationship("AgentVersion", back_populates="chat_history")
     api_key = relationship("ProjectAPIKey", back_populates="chat_history")
+
+
+class ApiKeyUsageDaily(Base):
+    """Requests and tokens per API key per UTC day, reconciled from every worker."""
+    __tablename__ = "api_key_usage_daily"
+
+    api_key_id = Column(UUID(as_uuid=True), ForeignKey("project_api_keys.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    request_count = Column(BigInteger, nullable=False, default=0)
+    tokens_used = Column(BigInteger, nullable=False, default=0)
+
+
+class ChatSession(Base):
+    """Per-session aggregates, maintained in the same transaction as chat_history inserts."""
+    __tablename__ = "chat_sessions"
+
+    session_id = Column(UUID(as_uuid=True), primary_key=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    # Version of the latest message; NULL once that version is deleted
+    agent_version_id = Column(UUID(as_uuid=True), ForeignKey("agent_versions.id", ondelete="SET NULL"))
+    message_count = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(BigInteger)
+    total_prompt_tokens = Column(BigInteger)
+    total_completion_tokens = Column(BigInteger)
+    first_message_at = Column(DateTime(timezone=True), nullable=False)
+    last_message_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class LLMResponseCacheEntry(Base):
+    """Postgres backend of the exact-match response cache."""
+    __tablename__ = "llm_response_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    agent_version_id = Column(UUID(as_uuid=True), ForeignKey("agent_versions.id", ondelete="CASCADE"), nullable=False)
+    response = Column(Text, nullable=False)
+    tokens_used = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class EvalJob(Base):
+    """Offline evaluation run of a dataset against one or more agent versions."""
+    __tablename__ = "eval_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    agent_version_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    concurrency = Column(Integer, nullable=False, default=4)
+    total_items = Column(Integer, nullable=False, default=0)
+    total_results = Column(Integer, nullable=False, default=0)
+    succeeded_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    # Owned by whichever process holds an unexpired lease; expired leases are resumed
+    lease_expires_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        CheckConstraint(
+            status.in_(['pending', 'running', 'completed', 'cancelled', 'failed']),
+            name='check_eval_job_status'
+        ),
+    )
+
+
+class EvalJobItem(Base):
+    __tablename__ = "eval_job_items"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("eval_jobs.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    input = Column(Text, nullable=False)
+    variables = Column(JSONB)
+
+
+class EvalResult(Base):
+    __tablename__ = "eval_results"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("eval_jobs.id", ondelete="CASCADE"), nullable=False)
+    item_id = Column(UUID(as_uuid=True), ForeignKey("eval_job_items.id", ondelete="CASCADE"), nullable=False)
+    agent_version_id = Column(UUID(as_uuid=True), ForeignKey("agent_versions.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False)
+    output = Column(Text)
+    error = Column(Text)
+    tokens_used = Column(Integer)
+    prompt_tokens = Column(Integer)
+    completion_tokens = Column(Integer)
+    latency_ms = Column(Integer)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint(status.in_(['succeeded', 'failed']), name='check_eval_result_status'),
+    )
+
+
+class DeletionJob(Base):
+    """Background removal of a large project, agent or agent version.
+
+    project_id is deliberately not a foreign key: the job outlives a deleted project.
+    """
+    __tablename__ = "deletion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    project_id = Column(UUID(as_uuid=True), nullable=False)
+    target_type = Column(String(20), nullable=False)
+    target_id = Column(UUID(as_uuid=True), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    # chat_history rows, estimated from chat_sessions when the job was created
+    estimated_rows = Column(BigInteger, nullable=False, default=0)
+    rows_deleted = Column(BigInteger, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    lease_expires_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        CheckConstraint(target_type.in_(['project', 'agent', 'agent_version']), name='check_deletion_target_type'),
+        CheckConstraint(status.in_(['pending', 'running', 'completed', 'failed']), name='check_deletion_job_status'),
+    )
+
+
+class UsageRollup(Base):
+    """Messages and tokens per agent version and API key, per hour and per UTC day.
+
+    Upserted in the same transaction as the chat_history rows it counts.
+    api_key_id is the nil UUID for chats made without an API key. Neither it
+    nor agent_version_id / agent_id has a foreign key, so past usage outlives
+    a deleted key, agent or version.
+    """
+    __tablename__ = "usage_rollups"
+
+    granularity = Column(String(4), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    agent_version_id = Column(UUID(as_uuid=True), primary_key=True)
+    api_key_id = Column(UUID(as_uuid=True), primary_key=True)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    agent_id = Column(UUID(as_uuid=True), nullable=False)
+    message_count = Column(BigInteger, nullable=False, default=0)
+    request_count = Column(BigInteger, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        CheckConstraint(granularity.in_(['hour', 'day']), name='check_usage_granularity'),
+    )
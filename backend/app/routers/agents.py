@@ -8,11 +8,15 @@ from app.database import get_db
 from app.models import Project, Agent, AgentVersion, ModelProfile
 from app.schemas import (
     AgentCreate, AgentUpdate, AgentResponse, AgentWithVersions,
-    AgentVersionCreate, AgentVersionResponse, AgentVersionCompare
+    AgentVersionCreate, AgentVersionResponse, AgentVersionCompare, DeletionJobResponse
 )
 from app.utils.auth import get_current_project
+from app.services.agent_cache import agent_versions
+from app.services.session_cache import session_cache
+from app.services.deletions import delete_target
+from app.routers.deletion_jobs import deletion_result
 from app.utils.encryption import encrypt_api_key
-from app.utils.prompt_variables import extract_variables
+from app.utils.prompt_variables import extract_variables, compile_prompt, compiled_variables
 
 router = APIRouter(prefix="/agents", tags=["Agents"])
 
@@ -23,7 +27,10 @@ def _version_to_response(version: AgentVersion) -> AgentVersionResponse:
         profile_name = version.model_profile.name
     resp = AgentVersionResponse.from_orm(version)
     resp.model_profile_name = profile_name
-    resp.variables = extract_variables(version.system_prompt)
+    if version.prompt_variables is not None:
+        resp.variables = list(version.prompt_variables)
+    else:
+        resp.variables = extract_variables(version.system_prompt)
     return resp
 
 @router.post("", response_model=AgentResponse, status_code=status.HTTP_201_CREATED)
@@ -37,7 +44,8 @@ async def create_agent(
     result = await db.execute(
         select(Agent).where(
             Agent.project_id == project.id,
-            Agent.name == agent.name
+            Agent.name == agent.name,
+            Agent.deleted_at.is_(None)
         )
     )
     if result.scalar_one_or_none():
@@ -65,7 +73,7 @@ async def list_agents(
     """List all agents for the project with their versions"""
     result = await db.execute(
         select(Agent)
-        .where(Agent.project_id == project.id)
+        .where(Agent.project_id == project.id, Agent.deleted_at.is_(None))
         .options(selectinload(Agent.versions).selectinload(AgentVersion.model_profile))
         .order_by(Agent.created_at.desc())
     )
@@ -93,7 +101,7 @@ async def get_agent(
     """Get a specific agent with versions"""
     result = await db.execute(
         select(Agent)
-        .where(Agent.id == agent_id, Agent.project_id == project.id)
+        .where(Agent.id == agent_id, Agent.project_id == project.id, Agent.deleted_at.is_(None))
         .options(selectinload(Agent.versions).selectinload(AgentVersion.model_profile))
     )
     agent = result.scalar_one_or_none()
@@ -122,7 +130,7 @@ async def update_agent(
 ):
     """Update agent info (name/description only)"""
     result = await db.execute(
-        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id)
+        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id, Agent.deleted_at.is_(None))
     )
     agent = result.scalar_one_or_none()
     
@@ -138,7 +146,8 @@ async def update_agent(
             select(Agent).where(
                 Agent.project_id == project.id,
                 Agent.name == update.name,
-                Agent.id != agent_id
+                Agent.id != agent_id,
+                Agent.deleted_at.is_(None)
             )
         )
         if existing.scalar_one_or_none():
@@ -152,6 +161,7 @@ async def update_agent(
         agent.description = update.description
     
     await db.commit()
+    agent_versions.invalidate_project(project.id)
     await db.refresh(agent)
     
     return AgentResponse.model_validate(agent)
@@ -168,7 +178,7 @@ async def create_agent_version(
     """Create a new version for an agent (immutable once created)"""
     # Verify agent exists and belongs to project
     result = await db.execute(
-        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id)
+        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id, Agent.deleted_at.is_(None))
     )
     agent = result.scalar_one_or_none()
     
@@ -210,10 +220,15 @@ async def create_agent_version(
     if not encrypted_api_key:
         encrypted_api_key = encrypt_api_key(version.api_key)
 
+    # Versions are immutable, so compile the prompt template once here
+    prompt_segments = compile_prompt(version.system_prompt)
+
     db_version = AgentVersion(
         agent_id=agent_id,
         version_number=next_version,
         system_prompt=version.system_prompt,
+        prompt_segments=prompt_segments,
+        prompt_variables=compiled_variables(prompt_segments),
         model_name=version.model_name,
         api_key_encrypted=encrypted_api_key,
         model_profile_id=model_profile_id,
@@ -224,11 +239,15 @@ async def create_agent_version(
         frequency_penalty=version.frequency_penalty,
         presence_penalty=version.presence_penalty,
         stop_sequences=version.stop_sequences,
+        history_max_turns=version.history_max_turns,
+        history_max_tokens=version.history_max_tokens,
+        response_cache_enabled=version.response_cache_enabled,
         notes=version.notes,
         is_active=False  # New versions are not active by default
     )
     db.add(db_version)
     await db.commit()
+    agent_versions.invalidate_project(project.id)
     await db.refresh(db_version)
 
     return _version_to_response(db_version)
@@ -242,7 +261,7 @@ async def list_agent_versions(
     """List all versions for an agent"""
     # Verify agent belongs to project
     agent_result = await db.execute(
-        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id)
+        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id, Agent.deleted_at.is_(None))
     )
     if not agent_result.scalar_one_or_none():
         raise HTTPException(
@@ -252,7 +271,7 @@ async def list_agent_versions(
     
     result = await db.execute(
         select(AgentVersion)
-        .where(AgentVersion.agent_id == agent_id)
+        .where(AgentVersion.agent_id == agent_id, AgentVersion.deleted_at.is_(None))
         .options(selectinload(AgentVersion.model_profile))
         .order_by(AgentVersion.version_number.desc())
     )
@@ -276,7 +295,9 @@ async def compare_versions(
         .where(
             AgentVersion.agent_id == agent_id,
             AgentVersion.version_number == version1,
-            Agent.project_id == project.id
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
         )
         .options(selectinload(AgentVersion.model_profile))
     )
@@ -288,7 +309,9 @@ async def compare_versions(
         .where(
             AgentVersion.agent_id == agent_id,
             AgentVersion.version_number == version2,
-            Agent.project_id == project.id
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
         )
         .options(selectinload(AgentVersion.model_profile))
     )
@@ -304,7 +327,8 @@ async def compare_versions(
     differences = {}
     compare_fields = ['system_prompt', 'model_name', 'base_url', 'temperature', 
                       'max_tokens', 'top_p', 'frequency_penalty', 'presence_penalty', 
-                      'stop_sequences', 'notes']
+                      'stop_sequences', 'history_max_turns', 'history_max_tokens',
+                      'response_cache_enabled', 'notes']
     
     for field in compare_fields:
         val1 = getattr(v1, field)
@@ -335,7 +359,9 @@ async def get_agent_version(
         .where(
             AgentVersion.id == version_id,
             AgentVersion.agent_id == agent_id,
-            Agent.project_id == project.id
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
         )
         .options(selectinload(AgentVersion.model_profile))
     )
@@ -363,7 +389,9 @@ async def activate_version(
         .where(
             AgentVersion.id == version_id,
             AgentVersion.agent_id == agent_id,
-            Agent.project_id == project.id
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
         )
         .options(selectinload(AgentVersion.model_profile))
     )
@@ -385,6 +413,7 @@ async def activate_version(
     # Activate this version
     version.is_active = True
     await db.commit()
+    agent_versions.invalidate_project(project.id)
 
     # Pastikan relasi model_profile tetap tersedia tanpa lazy load
     refreshed = await db.execute(
@@ -396,21 +425,31 @@ async def activate_version(
 
     return _version_to_response(version_loaded)
 
-@router.delete("/{agent_id}/versions/{version_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{agent_id}/versions/{version_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"model": DeletionJobResponse}}
+)
 async def delete_version(
     agent_id: UUID,
     version_id: UUID,
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
-    """Delete a specific version (not the entire agent)"""
+    """Delete a specific version (not the entire agent).
+
+    A version with a lot of chat history is hidden right away and deleted by
+    a background job (202 with the job), otherwise 204.
+    """
     result = await db.execute(
         select(AgentVersion)
         .join(Agent)
         .where(
             AgentVersion.id == version_id,
             AgentVersion.agent_id == agent_id,
-            Agent.project_id == project.id
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
         )
     )
     version = result.scalar_one_or_none()
@@ -423,7 +462,10 @@ async def delete_version(
     
     # Check if this is the only version
     count_result = await db.execute(
-        select(func.count(AgentVersion.id)).where(AgentVersion.agent_id == agent_id)
+        select(func.count(AgentVersion.id)).where(
+            AgentVersion.agent_id == agent_id,
+            AgentVersion.deleted_at.is_(None)
+        )
     )
     count = count_result.scalar()
     
@@ -433,18 +475,24 @@ async def delete_version(
             detail="Cannot delete the only version. Delete the agent instead."
         )
     
-    await db.delete(version)
-    await db.commit()
+    job = await delete_target(db, project.id, "agent_version", version.id)
+    agent_versions.invalidate_project(project.id)
+    session_cache.invalidate_project(project.id)
+    return deletion_result(job)
 
-@router.delete("/{agent_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{agent_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"model": DeletionJobResponse}}
+)
 async def delete_agent(
     agent_id: UUID,
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
-    """Delete an agent and all its versions"""
+    """Delete an agent and all its versions (202 with a deletion job when large)"""
     result = await db.execute(
-        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id)
+        select(Agent).where(Agent.id == agent_id, Agent.project_id == project.id, Agent.deleted_at.is_(None))
     )
     agent = result.scalar_one_or_none()
     
@@ -454,5 +502,7 @@ async def delete_agent(
             detail="Agent not found"
         )
     
-    await db.delete(agent)
-    await db.commit()
+    job = await delete_target(db, project.id, "agent", agent.id)
+    agent_versions.invalidate_project(project.id)
+    session_cache.invalidate_project(project.id)
+    return deletion_result(job)
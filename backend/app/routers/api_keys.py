@@ -5,8 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.database import get_db
 from app.models import Project, ProjectAPIKey
-from app.schemas import APIKeyCreate, APIKeyResponse, APIKeyMasked
-from app.utils.auth import get_current_project
+from app.schemas import APIKeyCreate, APIKeyResponse, APIKeyMasked, APIKeyLimitsUpdate
+from app.utils.auth import get_current_project, invalidate_api_key
 from app.utils.encryption import generate_api_key, mask_api_key
 
 router = APIRouter(prefix="/api-keys", tags=["API Keys"])
@@ -23,7 +23,9 @@ async def create_api_key(
     db_api_key = ProjectAPIKey(
         project_id=project.id,
         name=api_key_data.name,
-        api_key=new_key
+        api_key=new_key,
+        rate_limit_rps=api_key_data.rate_limit_rps,
+        daily_token_quota=api_key_data.daily_token_quota
     )
     db.add(db_api_key)
     await db.commit()
@@ -51,6 +53,8 @@ async def list_api_keys(
             name=key.name,
             api_key_masked=mask_api_key(key.api_key),
             is_active=key.is_active,
+            rate_limit_rps=key.rate_limit_rps,
+            daily_token_quota=key.daily_token_quota,
             created_at=key.created_at,
             last_used_at=key.last_used_at
         )
@@ -85,6 +89,8 @@ async def reveal_api_key(
         api_key_masked=mask_api_key(api_key.api_key),
         api_key=api_key.api_key,
         is_active=api_key.is_active,
+        rate_limit_rps=api_key.rate_limit_rps,
+        daily_token_quota=api_key.daily_token_quota,
         created_at=api_key.created_at,
         last_used_at=api_key.last_used_at
     )
@@ -112,6 +118,7 @@ async def toggle_api_key(
     
     api_key.is_active = not api_key.is_active
     await db.commit()
+    invalidate_api_key(api_key.project_id, api_key.id)
     await db.refresh(api_key)
     
     return APIKeyMasked(
@@ -120,6 +127,48 @@ async def toggle_api_key(
         name=api_key.name,
         api_key_masked=mask_api_key(api_key.api_key),
         is_active=api_key.is_active,
+        rate_limit_rps=api_key.rate_limit_rps,
+        daily_token_quota=api_key.daily_token_quota,
+        created_at=api_key.created_at,
+        last_used_at=api_key.last_used_at
+    )
+
+@router.patch("/{key_id}/limits", response_model=APIKeyMasked)
+async def update_api_key_limits(
+    key_id: UUID,
+    limits: APIKeyLimitsUpdate,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Set or clear the key's request rate limit and daily token quota"""
+    result = await db.execute(
+        select(ProjectAPIKey).where(
+            ProjectAPIKey.id == key_id,
+            ProjectAPIKey.project_id == project.id
+        )
+    )
+    api_key = result.scalar_one_or_none()
+    
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+    
+    for field in limits.model_fields_set:
+        setattr(api_key, field, getattr(limits, field))
+    await db.commit()
+    invalidate_api_key(api_key.project_id, api_key.id)
+    await db.refresh(api_key)
+    
+    return APIKeyMasked(
+        id=api_key.id,
+        project_id=api_key.project_id,
+        name=api_key.name,
+        api_key_masked=mask_api_key(api_key.api_key),
+        is_active=api_key.is_active,
+        rate_limit_rps=api_key.rate_limit_rps,
+        daily_token_quota=api_key.daily_token_quota,
         created_at=api_key.created_at,
         last_used_at=api_key.last_used_at
     )
@@ -147,3 +196,4 @@ async def delete_api_key(
     
     await db.delete(api_key)
     await db.commit()
+    invalidate_api_key(api_key.project_id, api_key.id)
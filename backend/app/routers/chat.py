@@ -1,81 +1,50 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from uuid import UUID
 import uuid
 from datetime import datetime
-import json
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
-from app.database import get_db
-from app.models import Project, Agent, AgentVersion, ChatHistory, ProjectAPIKey
-from app.schemas import ChatRequest, ChatResponse, ChatHistoryResponse, ChatHistoryItem
-from app.utils.auth import get_project_with_api_key, get_current_project
-from app.services.langchain_service import LangChainService
-from app.utils.prompt_variables import extract_variables, render_prompt
+from sqlalchemy import select, func, and_, or_, exists, literal, literal_column, delete, tuple_, Float, column, values
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from app.database import get_db, async_session
+from app.models import Project, Agent, AgentVersion, ChatHistory, ChatSession, ProjectAPIKey
+from app.config import settings
+from app.schemas import (
+    ChatRequest, ChatResponse, ChatHistoryResponse, ChatHistoryItem, ChatHistorySession, ChatSearchResult,
+    ChatBatchRequest, ChatBatchResponse, ChatBatchItemResult
+)
+from app.utils.auth import (
+    get_project_with_api_key, get_project_with_api_key_unmetered, get_current_project, enforce_rate_limit
+)
+from app.services.langchain_service import LangChainService, BatchChatItem, release_connection
+from app.services.provider_limiter import ProviderOverloadedError
+from app.services.rate_limits import rate_limits
+from app.services.agent_cache import agent_versions, ResolvedAgentVersion
+from app.services.session_cache import session_cache
+from app.services.chat_writer import chat_writer
+from app.utils.prompt_variables import render_compiled
+from app.utils.sse import coalesce_tokens, sse_event
+from app.utils.pagination import (
+    NEXT_CURSOR_HEADER, encode_cursor, decode_cursor, encode_ranked_cursor, decode_ranked_cursor
+)
+from app.utils.export import FORMATS as EXPORT_FORMATS, encode_rows, format_available as export_format_available
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-@router.post("", response_model=ChatResponse)
-async def send_message(
-    chat_request: ChatRequest,
-    project_api_ctx=Depends(get_project_with_api_key),
-    db: AsyncSession = Depends(get_db)
-):
-    """Send a chat message to an agent"""
-    project, api_key = project_api_ctx
-    if api_key is None:
-        # If bearer was JWT, reject: chat must use project API key bearer for tracking
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Chat API requires Project API Key as bearer token"
-        )
-    # Verify agent belongs to project
-    result = await db.execute(
-        select(Agent)
-        .where(
-            Agent.project_id == project.id,
-            func.lower(Agent.name) == func.lower(chat_request.agent_name)
-        )
-        .options(selectinload(Agent.versions))
-    )
-    agent = result.scalar_one_or_none()
-    
-    if not agent:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Agent not found in this project"
-        )
-    
-    # Get the version to use
-    if chat_request.version_number is not None:
-        version_result = await db.execute(
-            select(AgentVersion).where(
-                AgentVersion.agent_id == agent.id,
-                AgentVersion.version_number == chat_request.version_number
-            )
-        )
-        agent_version = version_result.scalar_one_or_none()
-        if not agent_version:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Version not found for this agent"
-            )
-    else:
-        version_result = await db.execute(
-            select(AgentVersion).where(
-                AgentVersion.agent_id == agent.id,
-                AgentVersion.is_active == True
-            )
-        )
-        agent_version = version_result.scalar_one_or_none()
-        if not agent_version:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No active version found for this agent. Please activate a version first."
-            )
 
+async def _resolve_chat_request(
+    db: AsyncSession,
+    project_id: UUID,
+    chat_request: ChatRequest
+) -> Tuple[ResolvedAgentVersion, Optional[UUID]]:
+    """Resolve agent version and validate session_id for a chat request.
+
+    Warm requests are served from the agent version cache; a cold request
+    resolves agent, version and session existence in a single statement. The
+    session's message count is read along with its existence, so a cached
+    history another process has appended to since is dropped.
+    """
     session_uuid: Optional[UUID] = None
     if chat_request.session_id:
         try:
@@ -86,30 +55,253 @@ async def send_message(
                 detail="Invalid session_id format"
             )
 
-        session_exists = await db.execute(
-            select(ChatHistory.id).where(
-                ChatHistory.session_id == session_uuid,
-                ChatHistory.project_id == project.id
+    session_exists = literal(True)
+    session_messages = literal(None)
+    if session_uuid is not None:
+        # A new session's first turn may still be queued for write-behind
+        await chat_writer.wait_session(session_uuid)
+        session_exists = exists().where(
+            ChatHistory.session_id == session_uuid,
+            ChatHistory.project_id == project_id
+        )
+        session_messages = select(ChatSession.message_count).where(
+            ChatSession.session_id == session_uuid
+        ).scalar_subquery()
+
+    agent_version = agent_versions.get(project_id, chat_request.agent_name, chat_request.version_number)
+    if agent_version is None:
+        generation = agent_versions.generation(project_id)
+        if chat_request.version_number is not None:
+            version_match = AgentVersion.version_number == chat_request.version_number
+        else:
+            version_match = AgentVersion.is_active == True
+
+        result = await db.execute(
+            select(
+                Agent.name,
+                AgentVersion,
+                session_exists.label("session_exists"),
+                session_messages.label("message_count")
+            )
+            .outerjoin(AgentVersion, and_(
+                AgentVersion.agent_id == Agent.id, version_match, AgentVersion.deleted_at.is_(None)
+            ))
+            .where(
+                Agent.project_id == project_id,
+                func.lower(Agent.name) == func.lower(chat_request.agent_name),
+                Agent.deleted_at.is_(None)
             )
+            .limit(1)
         )
-        if session_exists.first() is None:
+        row = result.first()
+        if row is None:
             raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Agent not found in this project"
+            )
+        if row.AgentVersion is None:
+            if chat_request.version_number is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Version not found for this agent"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No active version found for this agent. Please activate a version first."
+            )
+
+        agent_version = ResolvedAgentVersion.from_orm(row.AgentVersion, row.name)
+        agent_versions.set(
+            project_id, chat_request.agent_name, chat_request.version_number, agent_version, generation
+        )
+    elif session_uuid is not None:
+        row = (await db.execute(
+            select(session_exists.label("session_exists"), session_messages.label("message_count"))
+        )).first()
+    else:
+        row = None
+
+    found = row is None or row.session_exists
+    if session_uuid is not None and found:
+        session_cache.validate(project_id, session_uuid, row.message_count)
+
+    if not found:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Session ID not found"
+        )
+    return agent_version, session_uuid
+
+
+async def _resolve_chat_requests(
+    db: AsyncSession,
+    project_id: UUID,
+    chat_requests: List[ChatRequest]
+) -> List[Union[Tuple[ResolvedAgentVersion, Optional[UUID]], HTTPException]]:
+    """_resolve_chat_request for the items of a batch, with set-based lookups.
+
+    Agent versions missing from the cache are resolved in one statement and
+    the sessions' existence and message counts in another, instead of a
+    round trip per item. Returns, per item, what _resolve_chat_request would return or the
+    HTTPException it would raise.
+    """
+    resolved: List[Optional[Union[Tuple[ResolvedAgentVersion, Optional[UUID]], HTTPException]]] = \
+        [None] * len(chat_requests)
+    session_ids: List[Optional[UUID]] = []
+    for index, chat_request in enumerate(chat_requests):
+        session_uuid = None
+        if chat_request.session_id:
+            try:
+                session_uuid = UUID(chat_request.session_id)
+            except ValueError:
+                resolved[index] = HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid session_id format"
+                )
+        session_ids.append(session_uuid)
+
+    # (lower-cased agent name, version number or None for the active one) -> snapshot or error
+    versions: Dict[Tuple[str, Optional[int]], Union[ResolvedAgentVersion, HTTPException]] = {}
+    generation = agent_versions.generation(project_id)
+    for chat_request in chat_requests:
+        key = (chat_request.agent_name.lower(), chat_request.version_number)
+        if key not in versions:
+            cached = agent_versions.get(project_id, chat_request.agent_name, chat_request.version_number)
+            if cached is not None:
+                versions[key] = cached
+    missing = {
+        (chat_request.agent_name.lower(), chat_request.version_number)
+        for chat_request in chat_requests
+    } - set(versions)
+    if missing:
+        numbers = {number for _, number in missing if number is not None}
+        version_match = AgentVersion.is_active == True
+        if numbers:
+            version_match = or_(version_match, AgentVersion.version_number.in_(numbers))
+        result = await db.execute(
+            select(Agent.name, AgentVersion)
+            .outerjoin(AgentVersion, and_(
+                AgentVersion.agent_id == Agent.id, version_match, AgentVersion.deleted_at.is_(None)
+            ))
+            .where(
+                Agent.project_id == project_id,
+                func.lower(Agent.name).in_({name for name, _ in missing}),
+                Agent.deleted_at.is_(None)
+            )
+        )
+        agents_found = set()
+        found: Dict[Tuple[str, Optional[int]], ResolvedAgentVersion] = {}
+        for row in result:
+            name = row.name.lower()
+            agents_found.add(name)
+            if row.AgentVersion is None:
+                continue
+            keys = [(name, row.AgentVersion.version_number)]
+            if row.AgentVersion.is_active:
+                keys.append((name, None))
+            for key in keys:
+                if key in missing and key not in found:
+                    found[key] = ResolvedAgentVersion.from_orm(row.AgentVersion, row.name)
+        for key in missing:
+            name, version_number = key
+            if key in found:
+                versions[key] = found[key]
+                agent_versions.set(project_id, name, version_number, found[key], generation)
+            elif name not in agents_found:
+                versions[key] = HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Agent not found in this project"
+                )
+            elif version_number is not None:
+                versions[key] = HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Version not found for this agent"
+                )
+            else:
+                versions[key] = HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="No active version found for this agent. Please activate a version first."
+                )
+
+    sessions = []
+    for index, session_uuid in enumerate(session_ids):
+        if session_uuid is None or resolved[index] is not None:
+            continue
+        # A new session's first turn may still be queued for write-behind
+        await chat_writer.wait_session(session_uuid)
+        sessions.append(session_uuid)
+    existing = set()
+    if sessions:
+        wanted = values(column("session_id", PGUUID(as_uuid=True)), name="wanted").data(
+            [(session_uuid,) for session_uuid in sessions]
+        )
+        result = await db.execute(
+            select(wanted.c.session_id, ChatSession.message_count)
+            .select_from(wanted.outerjoin(ChatSession, ChatSession.session_id == wanted.c.session_id))
+            .where(exists().where(
+                ChatHistory.session_id == wanted.c.session_id,
+                ChatHistory.project_id == project_id
+            ))
+        )
+        for row in result:
+            existing.add(row.session_id)
+            session_cache.validate(project_id, row.session_id, row.message_count)
+
+    for index, chat_request in enumerate(chat_requests):
+        if resolved[index] is not None:
+            continue
+        agent_version = versions[(chat_request.agent_name.lower(), chat_request.version_number)]
+        session_uuid = session_ids[index]
+        if isinstance(agent_version, HTTPException):
+            resolved[index] = agent_version
+        elif session_uuid is not None and session_uuid not in existing:
+            resolved[index] = HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Session ID not found"
             )
-    
+        else:
+            resolved[index] = (agent_version, session_uuid)
+    return resolved
+
+
+def _overloaded_exception(error: ProviderOverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(max(int(error.retry_after + 0.5), 1))}
+    )
+
+
+def _render_system_prompt(agent_version: ResolvedAgentVersion, chat_request: ChatRequest) -> str:
     # Resolve prompt variables if any (optional; missing values are kept as-is)
-    prompt_variables = extract_variables(agent_version.system_prompt)
     resolved_prompt = agent_version.system_prompt
-    if prompt_variables:
+    if agent_version.prompt_variables:
         provided = chat_request.variables or {}
         try:
-            resolved_prompt = render_prompt(agent_version.system_prompt, provided, strict=False)
+            resolved_prompt = render_compiled(agent_version.prompt_segments, provided, strict=False)
         except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=str(e)
             )
+    return resolved_prompt
+
+@router.post("", response_model=ChatResponse)
+async def send_message(
+    chat_request: ChatRequest,
+    project_api_ctx=Depends(get_project_with_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """Send a chat message to an agent"""
+    project, api_key = project_api_ctx
+    if api_key is None:
+        # If bearer was JWT, reject: chat must use project API key bearer for tracking
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Chat API requires Project API Key as bearer token"
+        )
+    agent_version, session_uuid = await _resolve_chat_request(db, project.id, chat_request)
+    resolved_prompt = _render_system_prompt(agent_version, chat_request)
 
     # Process with LangChain
     try:
@@ -122,20 +314,18 @@ async def send_message(
             project_api_key_id=api_key.id,
             system_prompt=resolved_prompt
         )
+    except ProviderOverloadedError as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
-
-    # Mark key as used after successful processing
-    api_key.last_used_at = datetime.utcnow()
-    await db.commit()
-    await db.refresh(api_key)
+    rate_limits.record_tokens(project.id, api_key.id, response.get("tokens_used"))
 
     return ChatResponse(
         **response,
-        agent_name=agent.name
+        agent_name=agent_version.agent_name
     )
 
 @router.post("/stream")
@@ -152,81 +342,8 @@ async def stream_message(
             detail="Chat API requires Project API Key as bearer token"
         )
 
-    result = await db.execute(
-        select(Agent)
-        .where(
-            Agent.project_id == project.id,
-            func.lower(Agent.name) == func.lower(chat_request.agent_name)
-        )
-        .options(selectinload(Agent.versions))
-    )
-    agent = result.scalar_one_or_none()
-    if not agent:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Agent not found in this project"
-        )
-
-    if chat_request.version_number is not None:
-        version_result = await db.execute(
-            select(AgentVersion).where(
-                AgentVersion.agent_id == agent.id,
-                AgentVersion.version_number == chat_request.version_number
-            )
-        )
-        agent_version = version_result.scalar_one_or_none()
-        if not agent_version:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Version not found for this agent"
-            )
-    else:
-        version_result = await db.execute(
-            select(AgentVersion).where(
-                AgentVersion.agent_id == agent.id,
-                AgentVersion.is_active == True
-            )
-        )
-        agent_version = version_result.scalar_one_or_none()
-        if not agent_version:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No active version found for this agent. Please activate a version first."
-            )
-
-    session_uuid: Optional[UUID] = None
-    if chat_request.session_id:
-        try:
-            session_uuid = UUID(chat_request.session_id)
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid session_id format"
-            )
-
-        session_exists = await db.execute(
-            select(ChatHistory.id).where(
-                ChatHistory.session_id == session_uuid,
-                ChatHistory.project_id == project.id
-            )
-        )
-        if session_exists.first() is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session ID not found"
-            )
-
-    prompt_variables = extract_variables(agent_version.system_prompt)
-    resolved_prompt = agent_version.system_prompt
-    if prompt_variables:
-        provided = chat_request.variables or {}
-        try:
-            resolved_prompt = render_prompt(agent_version.system_prompt, provided, strict=False)
-        except ValueError as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e)
-            )
+    agent_version, session_uuid = await _resolve_chat_request(db, project.id, chat_request)
+    resolved_prompt = _render_system_prompt(agent_version, chat_request)
 
     async def event_generator():
         try:
@@ -242,22 +359,24 @@ async def stream_message(
 
             start_payload = {
                 "session_id": str(meta["session_id"]),
-                "agent_name": agent.name,
+                "agent_name": agent_version.agent_name,
                 "version_number": meta["version_number"],
                 "model_name": meta["model_name"],
             }
-            yield f"event: start\ndata: {json.dumps(start_payload)}\n\n"
+            yield sse_event("start", start_payload)
 
-            async for token in token_stream:
-                yield f"event: token\ndata: {json.dumps({'token': token})}\n\n"
-
-            api_key.last_used_at = datetime.utcnow()
-            await db.commit()
-            await db.refresh(api_key)
+            # Optionally merge tokens into fewer, larger frames to cut per-frame overhead
+            async for token in coalesce_tokens(
+                token_stream,
+                settings.sse_coalesce_ms / 1000,
+                settings.sse_coalesce_chars
+            ):
+                yield sse_event("token", {"token": token})
+            rate_limits.record_tokens(project.id, api_key.id, stats.get("tokens_used"))
 
             done_payload = {
                 "session_id": str(meta["session_id"]),
-                "agent_name": agent.name,
+                "agent_name": agent_version.agent_name,
                 "version_number": meta["version_number"],
                 "model_name": meta["model_name"],
                 "tokens_used": stats.get("tokens_used"),
@@ -265,11 +384,12 @@ async def stream_message(
                 "completion_tokens": stats.get("completion_tokens"),
                 "total_tokens": stats.get("total_tokens"),
                 "total_prompt_tokens": stats.get("total_prompt_tokens"),
-                "total_completion_tokens": stats.get("total_completion_tokens")
+                "total_completion_tokens": stats.get("total_completion_tokens"),
+                "history_turns_dropped": meta["history_turns_dropped"]
             }
-            yield f"event: done\ndata: {json.dumps(done_payload)}\n\n"
+            yield sse_event("done", done_payload)
         except Exception as e:
-            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+            yield sse_event("error", {"detail": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -280,71 +400,297 @@ async def stream_message(
         }
     )
 
+@router.post("/batch", response_model=ChatBatchResponse)
+async def send_batch(
+    batch_request: ChatBatchRequest,
+    project_api_ctx=Depends(get_project_with_api_key_unmetered),
+    db: AsyncSession = Depends(get_db)
+):
+    """Send many independent chat messages in one request.
+
+    Items are answered concurrently (bounded by ``concurrency``) and each gets
+    its own result or error; one item failing does not fail the batch.
+    """
+    project, api_key = project_api_ctx
+    if api_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Chat API requires Project API Key as bearer token"
+        )
+    if len(batch_request.items) > settings.chat_batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {settings.chat_batch_max_items} items"
+        )
+    session_ids = [item.session_id for item in batch_request.items if item.session_id]
+    if len(session_ids) != len(set(session_ids)):
+        # Turns of one session depend on each other and cannot run concurrently
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each session_id may appear at most once per batch"
+        )
+    # Every item is an LLM call. Charged in one go: a batch larger than the
+    # burst capacity is then admitted from a full bucket instead of never
+    enforce_rate_limit(project, api_key, len(batch_request.items))
+    concurrency = min(
+        batch_request.concurrency or settings.chat_batch_default_concurrency,
+        settings.chat_batch_max_concurrency
+    )
+
+    results: List[Optional[ChatBatchItemResult]] = [None] * len(batch_request.items)
+    pending: List[Tuple[int, BatchChatItem]] = []
+    resolved = await _resolve_chat_requests(db, project.id, batch_request.items)
+    for index, (chat_request, outcome) in enumerate(zip(batch_request.items, resolved)):
+        try:
+            if isinstance(outcome, HTTPException):
+                raise outcome
+            agent_version, session_uuid = outcome
+            resolved_prompt = _render_system_prompt(agent_version, chat_request)
+        except HTTPException as e:
+            results[index] = ChatBatchItemResult(index=index, status_code=e.status_code, error=e.detail)
+            continue
+        pending.append((index, BatchChatItem(
+            agent_version=agent_version,
+            message=chat_request.message,
+            session_id=session_uuid,
+            system_prompt=resolved_prompt
+        )))
+
+    try:
+        outcomes = await LangChainService.get_batch_responses(
+            db=db,
+            items=[item for _, item in pending],
+            project_id=project.id,
+            project_api_key_id=api_key.id,
+            concurrency=concurrency
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+    for (index, item), outcome in zip(pending, outcomes):
+        if isinstance(outcome, BaseException):
+            results[index] = ChatBatchItemResult(
+                index=index,
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+                if isinstance(outcome, ProviderOverloadedError)
+                else status.HTTP_500_INTERNAL_SERVER_ERROR,
+                error=str(outcome)
+            )
+        else:
+            rate_limits.record_tokens(project.id, api_key.id, outcome.get("tokens_used"))
+            results[index] = ChatBatchItemResult(
+                index=index,
+                status_code=status.HTTP_200_OK,
+                response=ChatResponse(**outcome, agent_name=item.agent_version.agent_name)
+            )
+
+    succeeded = sum(1 for r in results if r.error is None)
+    return ChatBatchResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+MAX_PREVIEW_CHARS = 10000
+MAX_BATCH_SESSIONS = 100
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, UUID]]:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _content_columns(preview_chars: Optional[int]) -> list:
+    """chat_history.content, or with preview_chars its first characters plus
+    a truncated flag, cut in SQL so full message bodies never leave the database."""
+    if preview_chars is None:
+        return [ChatHistory.content]
+    return [
+        func.left(ChatHistory.content, preview_chars).label("content"),
+        (func.length(ChatHistory.content) > preview_chars).label("truncated"),
+    ]
+
+
+def _history_columns(preview_chars: Optional[int]) -> list:
+    return [
+        ChatHistory.id,
+        ChatHistory.session_id,
+        ChatHistory.project_api_key_id,
+        ChatHistory.role,
+        ChatHistory.tokens_used,
+        ChatHistory.created_at,
+        *_content_columns(preview_chars),
+    ]
+
+
+def _history_response(row) -> ChatHistoryResponse:
+    return ChatHistoryResponse(
+        id=row.id,
+        session_id=row.session_id,
+        project_api_key_id=row.project_api_key_id,
+        role=row.role,
+        content=row.content,
+        tokens_used=row.tokens_used,
+        created_at=row.created_at,
+        truncated=row._mapping.get("truncated")
+    )
+
+
+def _history_listing(
+    project_id: UUID,
+    content_columns: list,
+    agent_id: Optional[UUID],
+    version_number: Optional[int],
+    api_key_id: Optional[UUID],
+    session_id: Optional[UUID],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Unordered /chat/history query (ChatHistoryItem columns) with its filters."""
+    query = (
+        select(
+            ChatHistory.id,
+            ChatHistory.session_id,
+            Agent.name.label("agent_name"),
+            AgentVersion.version_number,
+            AgentVersion.model_name,
+            ChatHistory.project_api_key_id.label("api_key_id"),
+            ChatHistory.role,
+            *content_columns,
+            ChatHistory.tokens_used,
+            ChatHistory.prompt_tokens,
+            ChatHistory.completion_tokens,
+            ChatHistory.created_at
+        )
+        .join(AgentVersion, AgentVersion.id == ChatHistory.agent_version_id)
+        .join(Agent, Agent.id == AgentVersion.agent_id)
+        .where(
+            ChatHistory.project_id == project_id,
+            # Agents and versions being deleted in the background
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
+        )
+    )
+    if agent_id:
+        query = query.where(Agent.id == agent_id)
+    if version_number is not None:
+        query = query.where(AgentVersion.version_number == version_number)
+    if api_key_id:
+        query = query.where(ChatHistory.project_api_key_id == api_key_id)
+    if session_id:
+        query = query.where(ChatHistory.session_id == session_id)
+    # Also prunes chat_history partitions outside the range
+    if start is not None:
+        query = query.where(ChatHistory.created_at >= start)
+    if end is not None:
+        query = query.where(ChatHistory.created_at < end)
+    return query
+
+
+@router.get("/history/batch", response_model=List[ChatHistorySession])
+async def get_chat_history_batch(
+    session_id: List[UUID] = Query(...),
+    preview_chars: Optional[int] = Query(None, ge=1, le=MAX_PREVIEW_CHARS),
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the chat history of several sessions in one query.
+
+    Sessions are returned in request order; unknown sessions come back with
+    no messages.
+    """
+    session_ids = list(dict.fromkeys(session_id))
+    if len(session_ids) > MAX_BATCH_SESSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_SESSIONS} sessions per request"
+        )
+    for sid in session_ids:
+        await chat_writer.wait_session(sid)
+
+    result = await db.execute(
+        select(*_history_columns(preview_chars))
+        .where(
+            ChatHistory.session_id.in_(session_ids),
+            ChatHistory.project_id == project.id
+        )
+        .order_by(ChatHistory.session_id, ChatHistory.created_at)
+    )
+    messages = {sid: [] for sid in session_ids}
+    for row in result:
+        messages[row.session_id].append(_history_response(row))
+
+    return [ChatHistorySession(session_id=sid, messages=messages[sid]) for sid in session_ids]
+
 @router.get("/history/{session_id}", response_model=List[ChatHistoryResponse])
 async def get_chat_history(
     session_id: UUID,
+    preview_chars: Optional[int] = Query(None, ge=1, le=MAX_PREVIEW_CHARS),
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
     """Get chat history for a session"""
+    await chat_writer.wait_session(session_id)
     result = await db.execute(
-        select(ChatHistory)
+        select(*_history_columns(preview_chars))
         .where(
             ChatHistory.session_id == session_id,
             ChatHistory.project_id == project.id
         )
         .order_by(ChatHistory.created_at)
     )
-    history = result.scalars().all()
     
-    return [ChatHistoryResponse.model_validate(h) for h in history]
+    return [_history_response(row) for row in result]
 
 @router.get("/history", response_model=List[ChatHistoryItem])
 async def list_chat_history(
+    response: Response,
     agent_id: Optional[UUID] = None,
     version_number: Optional[int] = None,
     api_key_id: Optional[UUID] = None,
     session_id: Optional[UUID] = None,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    preview_chars: Optional[int] = Query(None, ge=1, le=MAX_PREVIEW_CHARS),
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
-    """List chat history with optional filters."""
+    """List chat history with optional filters, newest first.
+
+    When more rows exist the X-Next-Cursor response header holds the
+    ``cursor`` for the next page.
+    """
     limit = min(max(limit, 1), 500)
+    after = _parse_cursor(cursor)
+    await chat_writer.wait_project(project.id)
 
     query = (
-        select(
-            ChatHistory.id,
-            ChatHistory.session_id,
-            ChatHistory.role,
-            ChatHistory.content,
-            ChatHistory.tokens_used,
-            ChatHistory.prompt_tokens,
-            ChatHistory.completion_tokens,
-            ChatHistory.created_at,
-            Agent.name.label("agent_name"),
-            AgentVersion.version_number,
-            AgentVersion.model_name,
-            ChatHistory.project_api_key_id.label("api_key_id")
+        _history_listing(
+            project.id, _content_columns(preview_chars),
+            agent_id, version_number, api_key_id, session_id
         )
-        .join(AgentVersion, AgentVersion.id == ChatHistory.agent_version_id)
-        .join(Agent, Agent.id == AgentVersion.agent_id)
-        .where(ChatHistory.project_id == project.id)
-        .order_by(ChatHistory.created_at.desc())
-        .limit(limit)
+        # id breaks ties between messages written in the same transaction
+        .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc())
+        .limit(limit + 1)
     )
-
-    if agent_id:
-        query = query.where(Agent.id == agent_id)
-    if version_number is not None:
-        query = query.where(AgentVersion.version_number == version_number)
-    if api_key_id:
-        query = query.where(ChatHistory.project_api_key_id == api_key_id)
-    if session_id:
-        query = query.where(ChatHistory.session_id == session_id)
+    if after is not None:
+        query = query.where(tuple_(ChatHistory.created_at, ChatHistory.id) < tuple_(*after))
 
     result = await db.execute(query)
     rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].created_at, rows[-1].id)
     return [
         ChatHistoryItem(
             id=row.id,
@@ -358,40 +704,205 @@ async def list_chat_history(
             tokens_used=row.tokens_used,
             prompt_tokens=row.prompt_tokens,
             completion_tokens=row.completion_tokens,
-            created_at=row.created_at
+            created_at=row.created_at,
+            truncated=row._mapping.get("truncated")
         )
         for row in rows
     ]
 
+EXPORT_COLUMNS = (
+    ("id", "string"),
+    ("session_id", "string"),
+    ("agent_name", "string"),
+    ("version_number", "int"),
+    ("model_name", "string"),
+    ("api_key_id", "string"),
+    ("role", "string"),
+    ("content", "string"),
+    ("tokens_used", "int"),
+    ("prompt_tokens", "int"),
+    ("completion_tokens", "int"),
+    ("created_at", "timestamp"),
+)
+
+@router.get("/export")
+async def export_chat_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    gzip: bool = False,
+    agent_id: Optional[UUID] = None,
+    version_number: Optional[int] = None,
+    api_key_id: Optional[UUID] = None,
+    session_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream chat history (oldest first) as NDJSON, CSV or Parquet.
+
+    Takes the /chat/history filters plus a ``start``/``end`` time range.
+    Rows are read through a server-side cursor and encoded batch by batch,
+    so memory use does not depend on the size of the export.
+    """
+    if not export_format_available(format):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet export requires pyarrow on the server"
+        )
+    if gzip and format == "parquet":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet is already compressed; gzip applies to ndjson and csv"
+        )
+    await chat_writer.wait_project(project.id)
+
+    query = _history_listing(
+        project.id, [ChatHistory.content], agent_id, version_number, api_key_id, session_id, start, end
+    ).order_by(ChatHistory.created_at, ChatHistory.id)
+
+    async def batches():
+        # Own session for the cursor; it stays open for the whole download
+        async with async_session() as export_db:
+            result = await export_db.stream(query.execution_options(yield_per=settings.chat_export_batch_size))
+            async for rows in result.partitions():
+                yield rows
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"chat-history-{datetime.utcnow():%Y%m%dT%H%M%S}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
+    # The request session (auth lookup) is only cleaned up after the response
+    # has finished streaming; don't let it sit idle in a transaction until then
+    await release_connection(db)
+    return StreamingResponse(
+        encode_rows(batches(), format, EXPORT_COLUMNS, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _search_match(mode: str, q: str):
+    """(WHERE clause, rank) for /chat/search; both can use a GIN index on chat_history."""
+    if mode == "trigram":
+        # q <% content: q is similar to some stretch of words in content
+        # (pg_trgm.word_similarity_threshold, 0.6 by default)
+        return literal(q).bool_op("<%")(ChatHistory.content), func.word_similarity(q, ChatHistory.content, type_=Float)
+    # Same text search configuration as the generated content_tsv column
+    query = func.websearch_to_tsquery(literal_column("'simple'::regconfig"), q)
+    return ChatHistory.content_tsv.bool_op("@@")(query), func.ts_rank(ChatHistory.content_tsv, query, type_=Float)
+
+
+@router.get("/search", response_model=List[ChatSearchResult])
+async def search_chat_history(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500),
+    mode: str = Query("fulltext", pattern="^(fulltext|trigram)$"),
+    agent_id: Optional[UUID] = None,
+    version_number: Optional[int] = None,
+    api_key_id: Optional[UUID] = None,
+    session_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    preview_chars: Optional[int] = Query(None, ge=1, le=MAX_PREVIEW_CHARS),
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Search message content, best matches first.
+
+    ``mode=fulltext`` matches words (web-search syntax: quoted phrases, ``or``,
+    ``-word``) against the content_tsv column; ``mode=trigram`` finds similar
+    spellings and fragments via pg_trgm. Takes the /chat/export filters and is
+    paginated like /chat/history, with the cursor in X-Next-Cursor.
+    """
+    limit = min(max(limit, 1), 200)
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_ranked_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    await chat_writer.wait_project(project.id)
+
+    match, rank = _search_match(mode, q)
+    query = (
+        _history_listing(
+            project.id, _content_columns(preview_chars),
+            agent_id, version_number, api_key_id, session_id, start, end
+        )
+        .add_columns(rank.label("rank"))
+        .where(match)
+        .order_by(rank.desc(), ChatHistory.created_at.desc(), ChatHistory.id.desc())
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(tuple_(rank, ChatHistory.created_at, ChatHistory.id) < tuple_(*after))
+
+    result = await db.execute(query)
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_ranked_cursor(last.rank, last.created_at, last.id)
+    # The listing's column labels are the ChatSearchResult field names
+    return [ChatSearchResult(**row._mapping) for row in rows]
+
 @router.get("/sessions", response_model=List[dict])
 async def list_chat_sessions(
+    response: Response,
     agent_id: Optional[UUID] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
-    """List all chat sessions for the project"""
+    """List chat sessions for the project, most recently active first.
+
+    Paged like /chat/history: pass X-Next-Cursor back as ``cursor``.
+    """
+    limit = min(max(limit, 1), 500)
+    after = _parse_cursor(cursor)
+    await chat_writer.wait_project(project.id)
     query = select(
-        ChatHistory.session_id,
-        ChatHistory.agent_version_id,
-        ChatHistory.created_at
-    ).where(ChatHistory.project_id == project.id)
+        ChatSession.session_id,
+        ChatSession.agent_version_id,
+        ChatSession.message_count,
+        ChatSession.total_tokens,
+        ChatSession.first_message_at,
+        ChatSession.last_message_at
+    ).where(ChatSession.project_id == project.id)
     
+    if after is not None:
+        query = query.where(
+            tuple_(ChatSession.last_message_at, ChatSession.session_id) < tuple_(*after)
+        )
     if agent_id:
-        query = query.join(AgentVersion).where(AgentVersion.agent_id == agent_id)
+        query = query.join(AgentVersion, AgentVersion.id == ChatSession.agent_version_id).where(
+            AgentVersion.agent_id == agent_id
+        )
     
-    query = query.distinct(ChatHistory.session_id).order_by(
-        ChatHistory.session_id,
-        ChatHistory.created_at.desc()
-    )
+    query = query.order_by(
+        ChatSession.last_message_at.desc(), ChatSession.session_id.desc()
+    ).limit(limit + 1)
     
     result = await db.execute(query)
     sessions = result.all()
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        last = sessions[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.last_message_at, last.session_id)
     
     return [
         {
             "session_id": str(s.session_id),
-            "agent_version_id": str(s.agent_version_id),
-            "last_message_at": s.created_at.isoformat()
+            "agent_version_id": str(s.agent_version_id) if s.agent_version_id else None,
+            "message_count": s.message_count,
+            "total_tokens": s.total_tokens,
+            "first_message_at": s.first_message_at.isoformat(),
+            "last_message_at": s.last_message_at.isoformat()
         }
         for s in sessions
     ]
@@ -403,15 +914,19 @@ async def delete_chat_history(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete chat history for a session"""
-    result = await db.execute(
-        select(ChatHistory).where(
+    await chat_writer.wait_session(session_id)
+    # One set-based DELETE over the (session_id, created_at) index, no rows loaded
+    await db.execute(
+        delete(ChatHistory).where(
             ChatHistory.session_id == session_id,
             ChatHistory.project_id == project.id
         )
     )
-    history = result.scalars().all()
-    
-    for h in history:
-        await db.delete(h)
-    
+    await db.execute(
+        delete(ChatSession).where(
+            ChatSession.session_id == session_id,
+            ChatSession.project_id == project.id
+        )
+    )
     await db.commit()
+    session_cache.invalidate(project.id, session_id)
@@ -0,0 +1,68 @@
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.database import get_db
+from app.models import Project, DeletionJob
+from app.schemas import DeletionJobResponse
+from app.utils.auth import get_current_project
+
+router = APIRouter(prefix="/deletion-jobs", tags=["Deletion Jobs"])
+
+
+def job_response(job: DeletionJob) -> DeletionJobResponse:
+    response = DeletionJobResponse.model_validate(job)
+    if job.status == "completed":
+        response.progress = 1.0
+    elif job.estimated_rows:
+        # The estimate comes from chat_sessions and can be a little off
+        response.progress = round(min(job.rows_deleted / job.estimated_rows, 0.99), 4)
+    return response
+
+
+def deletion_result(job: Optional[DeletionJob]) -> Response:
+    """204 when the target is already gone, else 202 with the queued job."""
+    if job is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job_response(job).model_dump(mode="json")
+    )
+
+
+@router.get("", response_model=List[DeletionJobResponse])
+async def list_deletion_jobs(
+    limit: int = 50,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """List the project's deletion jobs, newest first."""
+    limit = min(max(limit, 1), 200)
+    result = await db.execute(
+        select(DeletionJob)
+        .where(DeletionJob.project_id == project.id)
+        .order_by(DeletionJob.created_at.desc())
+        .limit(limit)
+    )
+    return [job_response(job) for job in result.scalars().all()]
+
+
+@router.get("/{job_id}", response_model=DeletionJobResponse)
+async def get_deletion_job(
+    job_id: UUID,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a deletion job's status and progress."""
+    result = await db.execute(
+        select(DeletionJob).where(DeletionJob.id == job_id, DeletionJob.project_id == project.id)
+    )
+    job = result.scalar_one_or_none()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deletion job not found"
+        )
+    return job_response(job)
@@ -0,0 +1,215 @@
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, func
+from app.config import settings
+from app.database import get_db
+from app.models import Project, Agent, AgentVersion, EvalJob, EvalJobItem, EvalResult
+from app.schemas import EvalJobCreate, EvalJobResponse, EvalResultResponse
+from app.utils.auth import get_current_project
+from app.services.eval_jobs import eval_jobs, ACTIVE_STATUSES
+
+router = APIRouter(prefix="/eval-jobs", tags=["Evaluation Jobs"])
+
+
+def _job_response(job: EvalJob) -> EvalJobResponse:
+    response = EvalJobResponse.model_validate(job)
+    if job.total_results:
+        response.progress = round((job.succeeded_count + job.failed_count) / job.total_results, 4)
+    return response
+
+
+async def _get_job(db: AsyncSession, project_id: UUID, job_id: UUID) -> EvalJob:
+    result = await db.execute(
+        select(EvalJob).where(EvalJob.id == job_id, EvalJob.project_id == project_id)
+    )
+    job = result.scalar_one_or_none()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Evaluation job not found"
+        )
+    return job
+
+
+@router.post("", response_model=EvalJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_eval_job(
+    job_data: EvalJobCreate,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a dataset to be run against one or more agent versions in the background."""
+    if len(job_data.items) > settings.eval_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"An evaluation job may contain at most {settings.eval_max_items} items"
+        )
+    version_ids = list(dict.fromkeys(job_data.agent_version_ids))
+    result = await db.execute(
+        select(func.count(AgentVersion.id))
+        .join(Agent, Agent.id == AgentVersion.agent_id)
+        .where(
+            AgentVersion.id.in_(version_ids),
+            Agent.project_id == project.id,
+            AgentVersion.deleted_at.is_(None),
+            Agent.deleted_at.is_(None)
+        )
+    )
+    if result.scalar() != len(version_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agent version not found in this project"
+        )
+
+    job = EvalJob(
+        project_id=project.id,
+        name=job_data.name,
+        status="pending",
+        agent_version_ids=version_ids,
+        concurrency=min(job_data.concurrency, settings.eval_max_job_concurrency),
+        total_items=len(job_data.items),
+        total_results=len(job_data.items) * len(version_ids),
+        succeeded_count=0,
+        failed_count=0,
+    )
+    db.add(job)
+    await db.flush()
+    await db.execute(
+        insert(EvalJobItem),
+        [
+            {"job_id": job.id, "position": position, "input": item.input, "variables": item.variables}
+            for position, item in enumerate(job_data.items)
+        ]
+    )
+    await db.commit()
+    await eval_jobs.wake()
+    await db.refresh(job)
+    return _job_response(job)
+
+
+@router.get("", response_model=List[EvalJobResponse])
+async def list_eval_jobs(
+    limit: int = 50,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """List the project's evaluation jobs, newest first."""
+    limit = min(max(limit, 1), 200)
+    result = await db.execute(
+        select(EvalJob)
+        .where(EvalJob.project_id == project.id)
+        .order_by(EvalJob.created_at.desc())
+        .limit(limit)
+    )
+    return [_job_response(job) for job in result.scalars().all()]
+
+
+@router.get("/{job_id}", response_model=EvalJobResponse)
+async def get_eval_job(
+    job_id: UUID,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a job's status and progress."""
+    return _job_response(await _get_job(db, project.id, job_id))
+
+
+@router.get("/{job_id}/results", response_model=List[EvalResultResponse])
+async def list_eval_results(
+    job_id: UUID,
+    after_position: Optional[int] = None,
+    limit: int = 100,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """List results in dataset order; pass the last seen position as ``after_position``."""
+    await _get_job(db, project.id, job_id)
+    limit = min(max(limit, 1), 1000)
+    query = (
+        select(
+            EvalResult.item_id,
+            EvalJobItem.position,
+            EvalJobItem.input,
+            EvalResult.agent_version_id,
+            EvalResult.status,
+            EvalResult.output,
+            EvalResult.error,
+            EvalResult.tokens_used,
+            EvalResult.prompt_tokens,
+            EvalResult.completion_tokens,
+            EvalResult.latency_ms,
+            EvalResult.created_at,
+        )
+        .join(EvalJobItem, EvalJobItem.id == EvalResult.item_id)
+        .where(EvalResult.job_id == job_id)
+        .order_by(EvalJobItem.position, EvalResult.agent_version_id)
+        .limit(limit)
+    )
+    if after_position is not None:
+        query = query.where(EvalJobItem.position > after_position)
+
+    result = await db.execute(query)
+    return [EvalResultResponse(**row._mapping) for row in result.all()]
+
+
+@router.post("/{job_id}/cancel", response_model=EvalJobResponse)
+async def cancel_eval_job(
+    job_id: UUID,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stop a pending or running job; results produced so far are kept."""
+    job = await _get_job(db, project.id, job_id)
+    if job.status not in ACTIVE_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is already {job.status}"
+        )
+    await db.execute(
+        update(EvalJob)
+        .where(EvalJob.id == job_id)
+        .values(status="cancelled", finished_at=func.now(), lease_expires_at=None)
+    )
+    await db.commit()
+    # Another process owning the job notices at its next lease renewal
+    eval_jobs.cancel(job_id)
+    await db.refresh(job)
+    return _job_response(job)
+
+
+@router.post("/{job_id}/resume", response_model=EvalJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def resume_eval_job(
+    job_id: UUID,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Requeue a cancelled or failed job; only missing results are produced."""
+    job = await _get_job(db, project.id, job_id)
+    if job.status not in ("cancelled", "failed"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Only cancelled or failed jobs can be resumed (job is {job.status})"
+        )
+    await db.execute(
+        update(EvalJob)
+        .where(EvalJob.id == job_id)
+        .values(status="pending", error=None, finished_at=None, lease_expires_at=None)
+    )
+    await db.commit()
+    await eval_jobs.wake()
+    await db.refresh(job)
+    return _job_response(job)
+
+
+@router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_eval_job(
+    job_id: UUID,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete a job with its items and results."""
+    job = await _get_job(db, project.id, job_id)
+    await db.delete(job)
+    await db.commit()
+    eval_jobs.cancel(job_id)
@@ -8,13 +8,17 @@ from app.database import get_db
 from app.models import Project, Agent, ProjectAPIKey
 from app.schemas import (
     ProjectCreate, ProjectLogin, ProjectUpdate, ProjectResponse, 
-    ProjectWithStats, Token
+    ProjectWithStats, Token, DeletionJobResponse
 )
 from app.utils.auth import (
     get_password_hash, verify_password, create_access_token,
-    get_current_project
+    get_current_project, invalidate_project
 )
 from app.config import settings
+from app.services.agent_cache import agent_versions
+from app.services.session_cache import session_cache
+from app.services.deletions import delete_target
+from app.routers.deletion_jobs import deletion_result
 
 router = APIRouter(prefix="/projects", tags=["Projects"])
 
@@ -22,7 +26,9 @@ router = APIRouter(prefix="/projects", tags=["Projects"])
 async def register_project(project: ProjectCreate, db: AsyncSession = Depends(get_db)):
     """Register a new project with credentials"""
     # Check if username already exists
-    result = await db.execute(select(Project).where(Project.username == project.username))
+    result = await db.execute(
+        select(Project).where(Project.username == project.username, Project.deleted_at.is_(None))
+    )
     if result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,7 +61,9 @@ async def register_project(project: ProjectCreate, db: AsyncSession = Depends(ge
 @router.post("/login", response_model=Token)
 async def login_project(credentials: ProjectLogin, db: AsyncSession = Depends(get_db)):
     """Login to a project"""
-    result = await db.execute(select(Project).where(Project.username == credentials.username))
+    result = await db.execute(
+        select(Project).where(Project.username == credentials.username, Project.deleted_at.is_(None))
+    )
     project = result.scalar_one_or_none()
     
     if not project or not verify_password(credentials.password, project.password_hash):
@@ -83,7 +91,7 @@ async def get_current_project_info(
     """Get current project info with stats"""
     # Get agents count
     agents_result = await db.execute(
-        select(func.count(Agent.id)).where(Agent.project_id == project.id)
+        select(func.count(Agent.id)).where(Agent.project_id == project.id, Agent.deleted_at.is_(None))
     )
     agents_count = agents_result.scalar()
     
@@ -110,17 +118,33 @@ async def update_current_project(
         project.name = update.name
     if update.description is not None:
         project.description = update.description
+    # Limits and retention may be cleared with an explicit null (defaults apply then)
+    for field in ("rate_limit_rps", "daily_token_quota", "history_retention_days"):
+        if field in update.model_fields_set:
+            setattr(project, field, getattr(update, field))
     
     await db.commit()
+    invalidate_project(project.id)
     await db.refresh(project)
     
     return ProjectResponse.model_validate(project)
 
-@router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/me",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"model": DeletionJobResponse}}
+)
 async def delete_current_project(
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
 ):
-    """Delete current project (requires authentication)"""
-    await db.delete(project)
-    await db.commit()
+    """Delete current project (requires authentication).
+
+    A project with a lot of chat history is disabled right away (login and
+    API keys stop working) and removed by a background job: 202 with the job.
+    """
+    job = await delete_target(db, project.id, "project", project.id)
+    agent_versions.invalidate_project(project.id)
+    session_cache.invalidate_project(project.id)
+    invalidate_project(project.id)
+    return deletion_result(job)
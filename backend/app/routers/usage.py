@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from app.database import get_db
+from app.models import Project, UsageRollup
+from app.schemas import UsageBucket, UsageResponse, UsageTotals
+from app.utils.auth import get_current_project
+from app.services.usage_rollups import COUNTERS, NIL_API_KEY, bucket_start
+
+router = APIRouter(prefix="/usage", tags=["Usage"])
+
+GROUP_BY = ("agent", "agent_version", "api_key")
+# Longest range per request, so a response stays a bounded number of buckets
+MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+
+def _utc(moment: datetime) -> datetime:
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+@router.get("", response_model=UsageResponse)
+async def get_usage(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: List[str] = Query([]),
+    agent_id: Optional[UUID] = None,
+    agent_version_id: Optional[UUID] = None,
+    api_key_id: Optional[UUID] = None,
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """Messages, requests and tokens per hour or UTC day, read from the usage rollups.
+
+    ``start`` is rounded down to its bucket; ``end`` is exclusive. Without
+    ``group_by`` each bucket is the project's total; with it buckets are split
+    by agent, agent version and/or API key (``api_key_id`` is null for chats
+    made without an API key).
+    """
+    unknown = [g for g in group_by if g not in GROUP_BY]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown group_by: {', '.join(unknown)} (allowed: {', '.join(GROUP_BY)})"
+        )
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = bucket_start(start if start else end - DEFAULT_RANGE[granularity], granularity)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    if end - start > MAX_RANGE[granularity]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too large for {granularity} buckets (max {MAX_RANGE[granularity].days} days)"
+        )
+
+    dimensions = []
+    if "agent" in group_by:
+        dimensions.append(UsageRollup.agent_id)
+    if "agent_version" in group_by:
+        dimensions.append(UsageRollup.agent_version_id)
+    if "api_key" in group_by:
+        dimensions.append(UsageRollup.api_key_id)
+
+    query = (
+        select(
+            UsageRollup.bucket_start,
+            *dimensions,
+            *(func.sum(getattr(UsageRollup, counter)).label(counter) for counter in COUNTERS)
+        )
+        .where(
+            UsageRollup.project_id == project.id,
+            UsageRollup.granularity == granularity,
+            UsageRollup.bucket_start >= start,
+            UsageRollup.bucket_start < end
+        )
+        .group_by(UsageRollup.bucket_start, *dimensions)
+        .order_by(UsageRollup.bucket_start, *dimensions)
+    )
+    if agent_id:
+        query = query.where(UsageRollup.agent_id == agent_id)
+    if agent_version_id:
+        query = query.where(UsageRollup.agent_version_id == agent_version_id)
+    if api_key_id:
+        query = query.where(UsageRollup.api_key_id == api_key_id)
+
+    result = await db.execute(query)
+    buckets = []
+    totals = UsageTotals()
+    for row in result:
+        counts = {counter: int(getattr(row, counter)) for counter in COUNTERS}
+        key_id = row._mapping.get("api_key_id")
+        buckets.append(UsageBucket(
+            bucket_start=row.bucket_start,
+            agent_id=row._mapping.get("agent_id"),
+            agent_version_id=row._mapping.get("agent_version_id"),
+            api_key_id=None if key_id == NIL_API_KEY else key_id,
+            **counts
+        ))
+        for counter, value in counts.items():
+            setattr(totals, counter, getattr(totals, counter) + value)
+
+    return UsageResponse(
+        granularity=granularity,
+        start=start,
+        end=end,
+        group_by=[g for g in GROUP_BY if g in group_by],
+        buckets=buckets,
+        totals=totals
+    )
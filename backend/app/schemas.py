@@ -18,12 +18,18 @@ class ProjectLogin(BaseModel):
 class ProjectUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
+    rate_limit_rps: Optional[float] = Field(None, gt=0)
+    daily_token_quota: Optional[int] = Field(None, ge=0)
+    history_retention_days: Optional[int] = Field(None, gt=0)
 
 class ProjectResponse(BaseModel):
     id: UUID
     name: str
     description: Optional[str]
     username: str
+    rate_limit_rps: Optional[float] = None
+    daily_token_quota: Optional[int] = None
+    history_retention_days: Optional[int] = None
     created_at: datetime
     updated_at: datetime
     
@@ -38,6 +44,13 @@ class ProjectWithStats(ProjectResponse):
 
 class APIKeyCreate(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
+    rate_limit_rps: Optional[float] = Field(None, gt=0)
+    daily_token_quota: Optional[int] = Field(None, ge=0)
+
+class APIKeyLimitsUpdate(BaseModel):
+    # Omitted fields are left unchanged; null clears the limit (settings defaults apply)
+    rate_limit_rps: Optional[float] = Field(None, gt=0)
+    daily_token_quota: Optional[int] = Field(None, ge=0)
 
 class APIKeyResponse(BaseModel):
     id: UUID
@@ -45,6 +58,8 @@ class APIKeyResponse(BaseModel):
     name: str
     api_key: str
     is_active: bool
+    rate_limit_rps: Optional[float] = None
+    daily_token_quota: Optional[int] = None
     created_at: datetime
     last_used_at: Optional[datetime]
     
@@ -58,6 +73,8 @@ class APIKeyMasked(BaseModel):
     api_key_masked: str
     api_key: Optional[str] = None
     is_active: bool
+    rate_limit_rps: Optional[float] = None
+    daily_token_quota: Optional[int] = None
     created_at: datetime
     last_used_at: Optional[datetime]
 
@@ -96,6 +113,10 @@ class AgentVersionCreate(BaseModel):
     frequency_penalty: float = Field(default=0.0, ge=-2, le=2)
     presence_penalty: float = Field(default=0.0, ge=-2, le=2)
     stop_sequences: Optional[List[str]] = None
+    history_max_turns: Optional[int] = Field(default=None, ge=1)
+    history_max_tokens: Optional[int] = Field(default=None, ge=1)
+    # Only takes effect for temperature 0
+    response_cache_enabled: bool = False
     notes: Optional[str] = None
 
     @model_validator(mode="after")
@@ -120,6 +141,9 @@ class AgentVersionResponse(BaseModel):
     frequency_penalty: float
     presence_penalty: float
     stop_sequences: Optional[List[str]]
+    history_max_turns: Optional[int] = None
+    history_max_tokens: Optional[int] = None
+    response_cache_enabled: bool = False
     is_active: bool
     created_at: datetime
     notes: Optional[str]
@@ -192,6 +216,24 @@ class ChatResponse(BaseModel):
     total_tokens: Optional[int] = None
     total_prompt_tokens: Optional[int] = None
     total_completion_tokens: Optional[int] = None
+    history_turns_dropped: int = 0
+    cached: bool = False
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1)
+    # Max LLM calls in flight for this batch; defaults to the server setting
+    concurrency: Optional[int] = Field(None, ge=1)
+
+class ChatBatchItemResult(BaseModel):
+    index: int
+    status_code: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchItemResult]
+    succeeded: int
+    failed: int
 
 class ChatHistoryResponse(BaseModel):
     id: UUID
@@ -201,10 +243,16 @@ class ChatHistoryResponse(BaseModel):
     content: str
     tokens_used: Optional[int]
     created_at: datetime
+    # Set only with preview_chars: whether content was cut
+    truncated: Optional[bool] = None
     
     class Config:
         from_attributes = True
 
+class ChatHistorySession(BaseModel):
+    session_id: UUID
+    messages: List[ChatHistoryResponse]
+
 class ChatHistoryItem(BaseModel):
     id: UUID
     session_id: UUID
@@ -218,6 +266,11 @@ class ChatHistoryItem(BaseModel):
     prompt_tokens: Optional[int] = None
     completion_tokens: Optional[int] = None
     created_at: datetime
+    truncated: Optional[bool] = None
+
+class ChatSearchResult(ChatHistoryItem):
+    # ts_rank for mode=fulltext, word_similarity for mode=trigram; higher is better
+    rank: float
 
 # ============ Auth Schemas ============
 
@@ -228,3 +281,91 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     project_id: Optional[UUID] = None
+
+# ============ Evaluation Job Schemas ============
+
+class EvalJobItemCreate(BaseModel):
+    input: str = Field(..., min_length=1)
+    variables: Optional[Dict[str, str]] = None
+
+class EvalJobCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    agent_version_ids: List[UUID] = Field(..., min_length=1)
+    items: List[EvalJobItemCreate] = Field(..., min_length=1)
+    # Parallel LLM calls for this job (capped by EVAL_MAX_JOB_CONCURRENCY)
+    concurrency: int = Field(4, ge=1)
+
+class EvalJobResponse(BaseModel):
+    id: UUID
+    name: str
+    status: str
+    agent_version_ids: List[UUID]
+    concurrency: int
+    total_items: int
+    total_results: int
+    succeeded_count: int
+    failed_count: int
+    progress: float = 0.0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class EvalResultResponse(BaseModel):
+    item_id: UUID
+    position: int
+    input: str
+    agent_version_id: UUID
+    status: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+    tokens_used: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    latency_ms: Optional[int] = None
+    created_at: datetime
+
+# ============ Deletion Job Schemas ============
+
+class DeletionJobResponse(BaseModel):
+    id: UUID
+    target_type: str
+    target_id: UUID
+    status: str
+    estimated_rows: int
+    rows_deleted: int
+    progress: float = 0.0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# ============ Usage Schemas ============
+
+class UsageTotals(BaseModel):
+    message_count: int = 0
+    request_count: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+class UsageBucket(UsageTotals):
+    bucket_start: datetime
+    # Filled only for the dimensions listed in group_by
+    agent_id: Optional[UUID] = None
+    agent_version_id: Optional[UUID] = None
+    api_key_id: Optional[UUID] = None
+
+class UsageResponse(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    group_by: List[str]
+    buckets: List[UsageBucket]
+    totals: UsageTotals
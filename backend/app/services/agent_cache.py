@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, Union
+from uuid import UUID
+from app.config import settings
+from app.models import AgentVersion
+from app.utils.cache import TTLCache
+from app.utils.encryption import decrypt_api_key
+from app.utils.prompt_variables import compile_prompt, compiled_variables
+
+ACTIVE = "active"
+
+
+@dataclass(frozen=True)
+class ResolvedAgentVersion:
+    """Immutable snapshot of everything the chat path needs from an agent version."""
+
+    id: UUID
+    agent_id: UUID
+    agent_name: str
+    version_number: int
+    system_prompt: str
+    prompt_segments: Tuple[str, ...]
+    prompt_variables: Tuple[str, ...]
+    model_name: str
+    api_key_encrypted: str
+    model_profile_id: Optional[UUID]
+    base_url: Optional[str]
+    temperature: float
+    max_tokens: int
+    top_p: Optional[float]
+    frequency_penalty: float
+    presence_penalty: float
+    stop_sequences: Optional[Tuple[str, ...]]
+    history_max_turns: Optional[int]
+    history_max_tokens: Optional[int]
+    response_cache_enabled: bool
+
+    @classmethod
+    def from_orm(cls, version: AgentVersion, agent_name: str) -> "ResolvedAgentVersion":
+        # Versions created before prompts were precompiled are compiled here once
+        segments = version.prompt_segments or compile_prompt(version.system_prompt)
+        return cls(
+            id=version.id,
+            agent_id=version.agent_id,
+            agent_name=agent_name,
+            version_number=version.version_number,
+            system_prompt=version.system_prompt,
+            prompt_segments=tuple(segments),
+            prompt_variables=tuple(compiled_variables(segments)),
+            model_name=version.model_name,
+            api_key_encrypted=version.api_key_encrypted,
+            model_profile_id=version.model_profile_id,
+            base_url=version.base_url,
+            temperature=float(version.temperature),
+            max_tokens=version.max_tokens,
+            top_p=float(version.top_p) if version.top_p is not None else None,
+            frequency_penalty=float(version.frequency_penalty or 0),
+            presence_penalty=float(version.presence_penalty or 0),
+            stop_sequences=tuple(version.stop_sequences) if version.stop_sequences else None,
+            history_max_turns=version.history_max_turns,
+            history_max_tokens=version.history_max_tokens,
+            response_cache_enabled=bool(version.response_cache_enabled),
+        )
+
+    @property
+    def api_key(self) -> str:
+        # Decryption is served from the key ring's secret cache after the first call
+        return decrypt_api_key(self.api_key_encrypted)
+
+
+class AgentVersionCache:
+    """Per-project cache of (agent name, version number | "active") -> snapshot.
+
+    Projects are evicted LRU once ``max_projects`` is reached and each project
+    holds a bounded TTL cache, so memory stays bounded. Any write to a project's
+    agents or versions drops the whole project. A lookup records the
+    generation (a counter bumped by every invalidation) it started at, and its
+    result is not stored if the project was invalidated since. Only the last
+    ``max_projects`` invalidations are remembered per project; forgetting one
+    raises a global floor instead, as does ``clear``, so lookups older than
+    that are never stored. Invalidations are passed to ``publish`` (set by the
+    cache invalidation bus) so other API processes drop the project too.
+    """
+
+    def __init__(self, max_projects: int, max_entries_per_project: int, ttl: int):
+        self.max_projects = max_projects
+        self.max_entries_per_project = max_entries_per_project
+        self.ttl = ttl
+        self._projects: "OrderedDict[UUID, TTLCache]" = OrderedDict()
+        self._generation = 0
+        # project -> generation of its last invalidation, oldest first
+        self._invalidated: "OrderedDict[UUID, int]" = OrderedDict()
+        # Lookups that started before this generation are never stored
+        self._floor = 0
+        self.publish: Optional[Callable[[UUID], None]] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(agent_name: str, version_number: Optional[int]) -> Tuple[str, Union[int, str]]:
+        return agent_name.lower(), ACTIVE if version_number is None else version_number
+
+    def generation(self, project_id: UUID) -> int:
+        return self._generation
+
+    def get(
+        self, project_id: UUID, agent_name: str, version_number: Optional[int]
+    ) -> Optional[ResolvedAgentVersion]:
+        entries = self._projects.get(project_id)
+        snapshot = entries.get(self._key(agent_name, version_number)) if entries else None
+        if snapshot is None:
+            self.misses += 1
+            return None
+        self._projects.move_to_end(project_id)
+        self.hits += 1
+        return snapshot
+
+    def set(
+        self,
+        project_id: UUID,
+        agent_name: str,
+        version_number: Optional[int],
+        snapshot: ResolvedAgentVersion,
+        generation: int,
+    ) -> None:
+        if generation < self._floor or self._invalidated.get(project_id, -1) > generation:
+            return
+        entries = self._projects.get(project_id)
+        if entries is None:
+            entries = TTLCache(self.max_entries_per_project, self.ttl)
+            self._projects[project_id] = entries
+            while len(self._projects) > self.max_projects:
+                self._projects.popitem(last=False)
+        self._projects.move_to_end(project_id)
+        entries.set(self._key(agent_name, version_number), snapshot)
+
+    def invalidate_project(self, project_id: UUID, broadcast: bool = True) -> None:
+        self._generation += 1
+        self._invalidated[project_id] = self._generation
+        self._invalidated.move_to_end(project_id)
+        while len(self._invalidated) > self.max_projects:
+            _, forgotten = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, forgotten)
+        self._projects.pop(project_id, None)
+        if broadcast and self.publish is not None:
+            self.publish(project_id)
+
+    def clear(self) -> None:
+        """Drop everything (e.g. after invalidations from other processes may have been missed)."""
+        self._generation += 1
+        self._floor = self._generation
+        self._invalidated.clear()
+        self._projects.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "projects": len(self._projects),
+            "entries": sum(len(e) for e in self._projects.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+agent_versions = AgentVersionCache(
+    max_projects=settings.agent_cache_max_projects,
+    max_entries_per_project=settings.agent_cache_max_entries_per_project,
+    ttl=settings.agent_cache_ttl_seconds,
+)
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Dict, Optional
+from uuid import UUID
+from sqlalchemy import update, values, column, or_, DateTime
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from app.config import settings
+from app.database import async_session
+from app.models import ProjectAPIKey
+from app.services.background import PeriodicWorker
+
+
+class ApiKeyUsageRecorder(PeriodicWorker):
+    """Write-behind buffer for ProjectAPIKey.last_used_at.
+
+    Requests only record a timestamp in memory; every interval the latest
+    timestamp per key is written with a single UPDATE ... FROM (VALUES ...).
+    """
+
+    name = "api-key-usage-flusher"
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self._pending: Dict[UUID, datetime] = {}
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, api_key_id: UUID, used_at: Optional[datetime] = None) -> None:
+        self._pending[api_key_id] = used_at or datetime.utcnow()
+
+    async def run_once(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        usage = values(
+            column("id", PGUUID(as_uuid=True)),
+            column("used_at", DateTime(timezone=True)),
+            name="usage",
+        ).data(list(batch.items()))
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(ProjectAPIKey)
+                    .where(
+                        ProjectAPIKey.id == usage.c.id,
+                        or_(
+                            ProjectAPIKey.last_used_at.is_(None),
+                            ProjectAPIKey.last_used_at < usage.c.used_at
+                        )
+                    )
+                    .values(last_used_at=usage.c.used_at)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except BaseException:
+            # Put the batch back (keeping newer timestamps) and retry next interval;
+            # also on cancellation, since rewriting a timestamp is harmless
+            for key_id, used_at in batch.items():
+                if key_id not in self._pending or self._pending[key_id] < used_at:
+                    self._pending[key_id] = used_at
+            raise
+        self.flushes += 1
+        self.rows_written += len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+api_key_usage = ApiKeyUsageRecorder(interval=settings.api_key_usage_flush_seconds)
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """Run ``run_once`` every ``interval`` seconds on the event loop.
+
+    ``stop`` cancels the loop and then calls ``run_once`` a final time so
+    buffered work is flushed on graceful shutdown. A flush already running
+    when ``stop`` is called is allowed to finish rather than cancelled after
+    it has taken its batch.
+    """
+
+    name = "periodic-worker"
+    # Workers with nothing buffered can skip the final run on shutdown
+    run_on_stop = True
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._running: Optional[asyncio.Future] = None
+
+    async def run_once(self) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._running is not None and not self._running.done():
+            try:
+                await self._running
+            except Exception:
+                logger.exception("%s failed", self.name)
+        self._running = None
+        if self.run_on_stop:
+            await self.run_once()
+
+    async def _tick(self) -> None:
+        """One ``run_once`` from the loop; errors are logged, not raised."""
+        try:
+            if self.run_on_stop:
+                # Shielded: cancelling the loop must not interrupt a flush halfway
+                self._running = asyncio.ensure_future(self.run_once())
+                await asyncio.shield(self._running)
+            else:
+                await self.run_once()
+        except Exception:
+            logger.exception("%s failed", self.name)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._tick()
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict, List, Optional
+from uuid import UUID
+import asyncpg
+from sqlalchemy import text
+from app.config import settings
+from app.database import engine
+from app.services.agent_cache import agent_versions
+from app.services.background import PeriodicWorker
+from app.services.session_cache import session_cache
+from app.utils import auth
+
+logger = logging.getLogger(__name__)
+
+_MAX_OUTBOX = 10000
+
+
+class CacheInvalidationBus(PeriodicWorker):
+    """Spreads cache invalidations between API processes over Postgres LISTEN/NOTIFY.
+
+    The agent version, session history and API key authentication caches live
+    in each process. When one process changes an agent, deletes history, or
+    disables a key or project, it notifies the others, which drop their copy.
+    New chat turns are not broadcast; each turn checks its cached session
+    against chat_sessions instead (SessionHistoryCache.validate).
+    Outgoing notifications are batched on a pooled connection as soon as they
+    are queued; incoming ones arrive on a dedicated asyncpg connection. If that
+    connection was lost (and notifications may have been missed), all three
+    caches are cleared once it is back. The caches' TTLs remain the upper bound
+    on staleness.
+    """
+
+    name = "cache-invalidation-bus"
+
+    def __init__(self, interval: float, channel: str, enabled: bool):
+        super().__init__(interval)
+        self.channel = channel
+        self.enabled = enabled
+        # Lets a process ignore its own notifications
+        self.origin = uuid.uuid4().hex
+        self._outbox: List[str] = []
+        self._due = asyncio.Event()
+        self._listener: Optional[asyncpg.Connection] = None
+        self.sent = 0
+        self.dropped = 0
+        self.received = 0
+        self.reconnects = 0
+        if enabled:
+            agent_versions.publish = lambda project_id: self._queue("agents", project_id)
+            session_cache.publish = lambda project_id, session_id: self._queue("sessions", project_id, session_id)
+            auth.publish_invalidation = lambda project_id, api_key_id: self._queue("auth", project_id, api_key_id)
+
+    def _queue(self, kind: str, project_id: UUID, item_id: Optional[UUID] = None) -> None:
+        # item_id is a session (kind "sessions") or API key (kind "auth"); None means the whole project
+        if self._task is None:
+            # Not running (scripts, or disabled): no other process is told anything
+            return
+        if len(self._outbox) >= _MAX_OUTBOX:
+            # The database is unreachable; the other processes' TTLs take over
+            self.dropped += 1
+            return
+        self._outbox.append(json.dumps({
+            "origin": self.origin,
+            "kind": kind,
+            "project_id": str(project_id),
+            "id": str(item_id) if item_id else None,
+        }))
+        self._due.set()
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            if message["origin"] == self.origin:
+                return
+            project_id = UUID(message["project_id"])
+            item_id = UUID(message["id"]) if message.get("id") else None
+            if message["kind"] == "agents":
+                agent_versions.invalidate_project(project_id, broadcast=False)
+            elif message["kind"] == "auth":
+                if item_id:
+                    auth.invalidate_api_key(project_id, item_id, broadcast=False)
+                else:
+                    auth.invalidate_project(project_id, broadcast=False)
+            elif item_id:
+                session_cache.invalidate(project_id, item_id, broadcast=False)
+            else:
+                session_cache.invalidate_project(project_id, broadcast=False)
+            self.received += 1
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed cache invalidation: %r", payload)
+
+    async def _listen(self) -> None:
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        try:
+            connection = await asyncpg.connect(dsn)
+            await connection.add_listener(self.channel, self._on_notify)
+        except Exception:
+            logger.exception("%s could not listen on %s", self.name, self.channel)
+            return
+        # Whatever other processes sent while nobody was listening is lost
+        agent_versions.clear()
+        session_cache.clear()
+        auth.clear_auth_cache()
+        if self._listener is not None:
+            self.reconnects += 1
+        self._listener = connection
+
+    def start(self) -> None:
+        if self.enabled:
+            super().start()
+
+    async def _loop(self) -> None:
+        while True:
+            if self._listener is None or self._listener.is_closed():
+                await self._listen()
+            try:
+                await asyncio.wait_for(self._due.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._due.clear()
+            await self._tick()
+
+    async def run_once(self) -> None:
+        if not self._outbox:
+            return
+        batch, self._outbox = self._outbox, []
+        try:
+            async with engine.connect() as connection:
+                await connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    [{"channel": self.channel, "payload": payload} for payload in batch],
+                )
+                await connection.commit()
+        except Exception:
+            self._outbox[:0] = batch
+            raise
+        self.sent += len(batch)
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "listening": self._listener is not None and not self._listener.is_closed(),
+            "pending": len(self._outbox),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+cache_bus = CacheInvalidationBus(
+    interval=settings.cache_invalidation_reconnect_seconds,
+    channel=settings.cache_invalidation_channel,
+    enabled=settings.cache_invalidation_enabled,
+)
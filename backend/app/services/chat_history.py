@@ -0,0 +1,276 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import column, select, true, values
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import ChatHistory, ChatSession
+from app.services.agent_cache import ResolvedAgentVersion
+from app.services.chat_writer import chat_writer
+from app.services.session_cache import HistoryMessage, session_cache
+from app.utils.token_counter import count_message_tokens
+
+
+@dataclass
+class HistoryWindow:
+    messages: List[HistoryMessage] = field(default_factory=list)  # oldest first
+    turns_dropped: int = 0
+
+
+def history_policy(agent_version: ResolvedAgentVersion) -> Tuple[Optional[int], Optional[int]]:
+    """Return (max_turns, max_tokens) for a version, falling back to app defaults."""
+    max_turns = agent_version.history_max_turns or settings.chat_history_default_max_turns
+    max_tokens = agent_version.history_max_tokens or settings.chat_history_default_max_tokens
+    return max_turns, max_tokens
+
+
+def _split_turns(items_newest_first: List[tuple]) -> List[List[tuple]]:
+    """Group messages into turns (a user message plus the replies after it), newest first."""
+    turns: List[List[tuple]] = []
+    current: List[tuple] = []
+    for item in items_newest_first:
+        current.append(item)
+        if item[0] == "user":
+            turns.append(list(reversed(current)))
+            current = []
+    if current:
+        # Replies without a preceding user message (oldest edge of the session)
+        turns.append(list(reversed(current)))
+    return turns
+
+
+def _select_turns(
+    items_newest_first: List[tuple],
+    max_turns: Optional[int],
+    budget: Optional[int],
+    model_name: Optional[str] = None,
+) -> Tuple[List[HistoryMessage], bool]:
+    # items are (role, content, tokens); tokens left as None are counted lazily
+    kept: List[List[tuple]] = []
+    used = 0
+    turns = _split_turns(items_newest_first)
+    for turn in turns:
+        if max_turns is not None and len(kept) >= max_turns:
+            break
+        if budget is not None:
+            cost = sum(
+                item[2] if item[2] is not None else count_message_tokens(item[1], model_name)
+                for item in turn
+            )
+            if used + cost > budget:
+                break
+            used += cost
+        kept.append(turn)
+
+    window = [(item[0], item[1]) for turn in reversed(kept) for item in turn]
+    return window, len(kept) < len(turns)
+
+
+def _token_budget(
+    agent_version: ResolvedAgentVersion,
+    max_tokens: Optional[int],
+    system_prompt: str,
+    message: str,
+) -> Optional[int]:
+    if max_tokens is None:
+        return None
+    # The system prompt and the new user message are always sent
+    return max_tokens - count_message_tokens(system_prompt, agent_version.model_name) \
+        - count_message_tokens(message, agent_version.model_name)
+
+
+def apply_window(
+    messages_newest_first: List[HistoryMessage],
+    agent_version: ResolvedAgentVersion,
+    system_prompt: str,
+    message: str,
+) -> Tuple[List[HistoryMessage], bool]:
+    """Keep the newest whole turns allowed by the version's policy.
+
+    Returns (messages oldest first, truncated).
+    """
+    max_turns, max_tokens = history_policy(agent_version)
+    budget = _token_budget(agent_version, max_tokens, system_prompt, message)
+    items = [(role, content, None) for role, content in messages_newest_first]
+    return _select_turns(items, max_turns, budget, agent_version.model_name)
+
+
+def _dropped_turns(total_messages: int, window: List[HistoryMessage]) -> int:
+    # Roughly one user + one assistant message per turn
+    return max((total_messages - len(window) + 1) // 2, 1)
+
+
+def _cached_window(
+    project_id: UUID,
+    session_id: UUID,
+    agent_version: ResolvedAgentVersion,
+    system_prompt: str,
+    message: str,
+) -> Optional[HistoryWindow]:
+    cached = session_cache.get(project_id, session_id)
+    if cached is None:
+        return None
+    window, truncated = apply_window(
+        list(reversed(cached.messages)), agent_version, system_prompt, message
+    )
+    # A partially cached session is only usable if the window ends inside it
+    if not truncated and cached.omitted:
+        return None
+    turns_dropped = _dropped_turns(cached.message_count, window) if truncated else 0
+    return HistoryWindow(messages=window, turns_dropped=turns_dropped)
+
+
+async def load_history_window(
+    db: AsyncSession,
+    project_id: UUID,
+    session_id: UUID,
+    agent_version: ResolvedAgentVersion,
+    system_prompt: str,
+    message: str,
+) -> HistoryWindow:
+    """Fetch only the tail of a session's history that fits the version's policy.
+
+    Warm sessions are served from the session history cache; otherwise the
+    tail is read from chat_history and the cache is populated with it.
+    """
+    window = _cached_window(project_id, session_id, agent_version, system_prompt, message)
+    if window is not None:
+        return window
+
+    # Turns still queued for write-behind must be visible to the read below
+    await chat_writer.wait_session(session_id)
+    query = (
+        select(ChatHistory.role, ChatHistory.content)
+        .where(
+            ChatHistory.session_id == session_id,
+            ChatHistory.project_id == project_id
+        )
+        .order_by(ChatHistory.created_at.desc())
+    )
+    max_turns, max_tokens = history_policy(agent_version)
+    if max_turns is None and max_tokens is None:
+        result = await db.execute(query)
+        history = [(r.role, r.content) for r in reversed(result.all())]
+        session_cache.put(project_id, session_id, history)
+        return HistoryWindow(messages=history)
+
+    # Walk the (session_id, created_at) index newest-first and stop as soon as
+    # the window is full, so long sessions are never read in full.
+    budget = _token_budget(agent_version, max_tokens, system_prompt, message)
+    fetched: List[tuple] = []
+    window: List[HistoryMessage] = []
+    truncated = False
+    result = await db.stream(query.execution_options(yield_per=settings.chat_history_fetch_batch))
+    try:
+        async for partition in result.partitions():
+            fetched.extend(
+                (r.role, r.content, count_message_tokens(r.content, agent_version.model_name) if budget is not None else None)
+                for r in partition
+            )
+            window, truncated = _select_turns(fetched, max_turns, budget)
+            if truncated:
+                break
+    finally:
+        await result.close()
+
+    total_messages = len(fetched)
+    turns_dropped = 0
+    if truncated:
+        count_result = await db.execute(
+            select(ChatSession.message_count).where(ChatSession.session_id == session_id)
+        )
+        total_messages = max(count_result.scalar() or 0, len(fetched))
+        turns_dropped = _dropped_turns(total_messages, window)
+    session_cache.put(
+        project_id,
+        session_id,
+        [(item[0], item[1]) for item in reversed(fetched)],
+        omitted=total_messages - len(fetched),
+    )
+    return HistoryWindow(messages=window, turns_dropped=turns_dropped)
+
+
+@dataclass
+class HistoryRequest:
+    session_id: UUID
+    agent_version: ResolvedAgentVersion
+    system_prompt: str
+    message: str
+
+
+async def load_history_windows(
+    db: AsyncSession,
+    project_id: UUID,
+    requests: List[HistoryRequest],
+) -> List[HistoryWindow]:
+    """load_history_window for several sessions of a project (session ids unique).
+
+    Warm sessions come from the session history cache. The newest messages
+    of every cold session (up to the cache's per-session cap) are read in one
+    statement, together with its message count; only a session whose window
+    needs more than that is read on its own.
+    """
+    windows: List[Optional[HistoryWindow]] = [
+        _cached_window(project_id, r.session_id, r.agent_version, r.system_prompt, r.message)
+        for r in requests
+    ]
+    cold = [r.session_id for r, window in zip(requests, windows) if window is None]
+    if not cold:
+        return windows
+
+    for session_id in cold:
+        # Turns still queued for write-behind must be visible to the read below
+        await chat_writer.wait_session(session_id)
+    limit = max(settings.session_cache_max_messages, 1)
+    wanted = values(column("session_id", PGUUID(as_uuid=True)), name="wanted").data(
+        [(session_id,) for session_id in cold]
+    )
+    tail = (
+        select(ChatHistory.role, ChatHistory.content, ChatHistory.created_at)
+        .where(
+            ChatHistory.session_id == wanted.c.session_id,
+            ChatHistory.project_id == project_id
+        )
+        .order_by(ChatHistory.created_at.desc())
+        .limit(limit)
+        .lateral("tail")
+    )
+    result = await db.execute(
+        select(wanted.c.session_id, ChatSession.message_count, tail.c.role, tail.c.content)
+        .select_from(
+            wanted
+            .outerjoin(ChatSession, ChatSession.session_id == wanted.c.session_id)
+            .join(tail, true())
+        )
+        .order_by(wanted.c.session_id, tail.c.created_at.desc())
+    )
+    fetched: Dict[UUID, List[HistoryMessage]] = {}
+    counts: Dict[UUID, int] = {}
+    for row in result:
+        fetched.setdefault(row.session_id, []).append((row.role, row.content))
+        counts[row.session_id] = row.message_count or 0
+
+    for index, r in enumerate(requests):
+        if windows[index] is not None:
+            continue
+        newest_first = fetched.get(r.session_id, [])
+        window, truncated = apply_window(newest_first, r.agent_version, r.system_prompt, r.message)
+        if not truncated and len(newest_first) >= limit:
+            # The window may reach further back than the batch read
+            windows[index] = await load_history_window(
+                db, project_id, r.session_id, r.agent_version, r.system_prompt, r.message
+            )
+            continue
+        total_messages = max(counts.get(r.session_id, 0), len(newest_first))
+        session_cache.put(
+            project_id,
+            r.session_id,
+            list(reversed(newest_first)),
+            omitted=total_messages - len(newest_first) if len(newest_first) >= limit else 0,
+        )
+        windows[index] = HistoryWindow(
+            messages=window,
+            turns_dropped=_dropped_turns(total_messages, window) if truncated else 0,
+        )
+    return windows
@@ -0,0 +1,56 @@
+from typing import Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import ChatSession
+
+_TOKEN_COLUMNS = ("total_tokens", "total_prompt_tokens", "total_completion_tokens")
+
+
+async def record_messages_bulk(
+    db: AsyncSession,
+    rows: List[Dict[str, object]],
+) -> Dict[UUID, Dict[str, Optional[int]]]:
+    """Upsert several sessions' aggregate rows in one statement.
+
+    Each row carries the ChatSession columns for one session (session ids must
+    be unique within the call). Returns the running totals keyed by session_id.
+    Token totals stay NULL until a message actually reports usage, matching
+    what SUM() over chat_history used to return.
+    """
+    if not rows:
+        return {}
+    stmt = insert(ChatSession).values(rows)
+    updates = {
+        "agent_version_id": stmt.excluded.agent_version_id,
+        "message_count": ChatSession.message_count + stmt.excluded.message_count,
+        "last_message_at": func.greatest(ChatSession.last_message_at, stmt.excluded.last_message_at),
+    }
+    for column in _TOKEN_COLUMNS:
+        # NULL usage leaves the running total untouched
+        current = getattr(ChatSession, column)
+        updates[column] = func.coalesce(
+            func.coalesce(current, 0) + stmt.excluded[column], current
+        )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChatSession.session_id],
+        set_=updates,
+    ).returning(
+        ChatSession.session_id,
+        ChatSession.message_count,
+        ChatSession.total_tokens,
+        ChatSession.total_prompt_tokens,
+        ChatSession.total_completion_tokens,
+    )
+    result = await db.execute(stmt)
+    return {
+        row.session_id: {
+            "message_count": row.message_count,
+            "total_tokens": row.total_tokens,
+            "total_prompt_tokens": row.total_prompt_tokens,
+            "total_completion_tokens": row.total_completion_tokens,
+        }
+        for row in result
+    }
+
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import async_session
+from app.models import ChatHistory
+from app.services.background import PeriodicWorker
+from app.services.chat_sessions import record_messages_bulk
+from app.services.usage_rollups import record_usage
+
+logger = logging.getLogger(__name__)
+
+SessionTotals = Dict[str, Optional[int]]
+
+# A turn whose rows are rejected (not a connectivity problem) is dropped after this many attempts
+_MAX_ATTEMPTS = 3
+_REJECTED = (IntegrityError, DataError)
+
+
+@dataclass
+class _Turn:
+    rows: List[Dict[str, object]]  # chat_history rows
+    session: Dict[str, object]     # ChatSession delta, as for record_messages_bulk
+    future: asyncio.Future
+    attempts: int = 0
+
+
+def session_delta(
+    *,
+    project_id: UUID,
+    agent_version_id: UUID,
+    session_id: UUID,
+    message_count: int,
+    first_message_at: datetime,
+    last_message_at: datetime,
+    tokens_used: Optional[int] = None,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+) -> Dict[str, object]:
+    return {
+        "session_id": session_id,
+        "project_id": project_id,
+        "agent_version_id": agent_version_id,
+        "message_count": message_count,
+        "total_tokens": tokens_used,
+        "total_prompt_tokens": prompt_tokens,
+        "total_completion_tokens": completion_tokens,
+        "first_message_at": first_message_at,
+        "last_message_at": last_message_at,
+    }
+
+
+def _add_tokens(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    # NULL means "no usage reported", as in record_messages_bulk
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _merge_sessions(turns: List[_Turn]) -> List[Dict[str, object]]:
+    """One delta per session, since the upsert cannot touch a row twice."""
+    merged: Dict[UUID, Dict[str, object]] = {}
+    for turn in turns:
+        delta = turn.session
+        current = merged.get(delta["session_id"])
+        if current is None:
+            merged[delta["session_id"]] = dict(delta)
+            continue
+        current["agent_version_id"] = delta["agent_version_id"]
+        current["message_count"] += delta["message_count"]
+        for column in ("total_tokens", "total_prompt_tokens", "total_completion_tokens"):
+            current[column] = _add_tokens(current[column], delta[column])
+        current["first_message_at"] = min(current["first_message_at"], delta["first_message_at"])
+        current["last_message_at"] = max(current["last_message_at"], delta["last_message_at"])
+    return list(merged.values())
+
+
+async def _write(db: AsyncSession, rows: List[Dict[str, object]], sessions: List[Dict[str, object]]):
+    # executemany: rendered as multi-row INSERT ... VALUES batches
+    await db.execute(insert(ChatHistory), rows)
+    await record_usage(db, rows)
+    return await record_messages_bulk(db, sessions)
+
+
+class ChatHistoryWriter(PeriodicWorker):
+    """Optional write-behind path for chat turns (CHAT_HISTORY_WRITE_BEHIND).
+
+    Turns are queued and written every interval (or as soon as a batch is
+    full) as one multi-row chat_history INSERT plus one chat_sessions upsert
+    in a single transaction, instead of one commit per turn. Callers that
+    report session totals await their batch (group commit); others return
+    immediately. Reads of a session (or a project's listings) first wait for
+    its queued turns, so every request sees its own earlier writes. A full
+    queue makes submitters wait, and ``stop`` drains the queue on shutdown.
+    """
+
+    name = "chat-history-writer"
+
+    def __init__(self, enabled: bool, interval: float, batch_size: int, max_queue: int):
+        super().__init__(interval)
+        self.enabled = enabled
+        self.batch_size = max(batch_size, 1)
+        self.max_queue = max(max_queue, self.batch_size)
+        self._queue: Deque[_Turn] = deque()
+        self._lock = asyncio.Lock()
+        self._due = asyncio.Event()
+        self._not_full = asyncio.Event()
+        # Last queued turn per session / project, for read-your-writes
+        self._last_by_session: Dict[UUID, asyncio.Future] = {}
+        self._last_by_project: Dict[UUID, asyncio.Future] = {}
+        self.turns_written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.max_queue_depth = 0
+
+    def start(self) -> None:
+        if self.enabled:
+            super().start()
+
+    async def persist(
+        self,
+        db: Optional[AsyncSession],
+        rows: List[Dict[str, object]],
+        session: Dict[str, object],
+        wait: bool = True,
+    ) -> Optional[SessionTotals]:
+        """Persist one turn's chat_history rows and its session delta.
+
+        Returns the session's running totals, or None when ``wait`` is False
+        and the turn was queued. Without write-behind the turn is written and
+        committed right away on ``db`` (or a new session if None).
+        """
+        if not self.enabled:
+            if db is None:
+                async with async_session() as own_db:
+                    totals = await _write(own_db, rows, [session])
+                    await own_db.commit()
+            else:
+                totals = await _write(db, rows, [session])
+                await db.commit()
+            return totals[session["session_id"]]
+
+        if len(self._queue) >= self.max_queue:
+            self.backpressure_waits += 1
+        while len(self._queue) >= self.max_queue:
+            self._due.set()
+            self._not_full.clear()
+            await self._not_full.wait()
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may await a fire-and-forget turn; failures are logged on flush
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._queue.append(_Turn(rows=rows, session=session, future=future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._track(self._last_by_session, session["session_id"], future)
+        self._track(self._last_by_project, session["project_id"], future)
+        if len(self._queue) >= self.batch_size:
+            self._due.set()
+        if not wait:
+            return None
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _track(index: Dict[UUID, asyncio.Future], key: UUID, future: asyncio.Future) -> None:
+        index[key] = future
+        future.add_done_callback(lambda f: index.get(key) is f and index.pop(key))
+
+    async def _wait(self, future: Optional[asyncio.Future]) -> None:
+        if future is None or future.done():
+            return
+        self._due.set()
+        try:
+            await asyncio.shield(future)
+        except Exception:
+            # The writer failed this turn; the reader simply does not see it
+            pass
+
+    async def wait_session(self, session_id: UUID) -> None:
+        """Wait until the session's queued turns are committed."""
+        await self._wait(self._last_by_session.get(session_id))
+
+    async def wait_project(self, project_id: UUID) -> None:
+        """Wait until the project's queued turns are committed."""
+        await self._wait(self._last_by_project.get(project_id))
+
+    async def _loop(self) -> None:
+        # Flush every interval, or early once a batch is full or a reader waits
+        while True:
+            try:
+                await asyncio.wait_for(self._due.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._due.clear()
+            await self._tick()
+
+    async def run_once(self) -> None:
+        async with self._lock:
+            while self._queue:
+                # Turns rejected before are retried on their own so one bad row
+                # cannot hold back (or take down) the rest of a batch
+                size = 1 if self._queue[0].attempts else self.batch_size
+                batch = [self._queue.popleft() for _ in range(min(size, len(self._queue)))]
+                self._not_full.set()
+                try:
+                    async with async_session() as db:
+                        totals = await _write(
+                            db,
+                            [row for turn in batch for row in turn.rows],
+                            _merge_sessions(batch),
+                        )
+                        await db.commit()
+                except Exception as e:
+                    self.failures += 1
+                    retry = []
+                    for turn in batch:
+                        if not isinstance(e, _REJECTED):
+                            # Database unavailable: keep everything and retry next interval
+                            retry.append(turn)
+                            continue
+                        turn.attempts += 1
+                        if turn.attempts >= _MAX_ATTEMPTS:
+                            self.dropped += 1
+                            logger.error("Dropping chat turn of session %s: %s", turn.session["session_id"], e)
+                            turn.future.set_exception(e)
+                        else:
+                            retry.append(turn)
+                    self._queue.extendleft(reversed(retry))
+                    raise
+                self.flushes += 1
+                self.turns_written += len(batch)
+                for turn in batch:
+                    if not turn.future.done():
+                        turn.future.set_result(totals[turn.session["session_id"]])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "turns_written": self.turns_written,
+            "flushes": self.flushes,
+            "avg_batch": round(self.turns_written / self.flushes, 2) if self.flushes else 0.0,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+
+chat_writer = ChatHistoryWriter(
+    enabled=settings.chat_history_write_behind,
+    interval=settings.chat_history_flush_ms / 1000,
+    batch_size=settings.chat_history_batch_size,
+    max_queue=settings.chat_history_queue_size,
+)
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+from uuid import UUID
+from sqlalchemy import delete, exists, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import async_session
+from app.models import Agent, AgentVersion, ChatHistory, ChatSession, DeletionJob, Project
+from app.services.agent_cache import agent_versions
+from app.services.background import PeriodicWorker
+from app.services.session_cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+TARGET_MODELS = {"project": Project, "agent": Agent, "agent_version": AgentVersion}
+ACTIVE_STATUSES = ("pending", "running")
+
+# A job failing this many times in a row is marked failed (its target stays hidden)
+_MAX_ATTEMPTS = 5
+
+
+def _rows_of(model, target_type: str, target_id: UUID):
+    """Filter on chat_history / chat_sessions rows belonging to a target."""
+    if target_type == "project":
+        return model.project_id == target_id
+    if target_type == "agent":
+        return model.agent_version_id.in_(
+            select(AgentVersion.id).where(AgentVersion.agent_id == target_id)
+        )
+    return model.agent_version_id == target_id
+
+
+async def estimate_rows(db: AsyncSession, target_type: str, target_id: UUID) -> int:
+    """chat_history rows of a target, from chat_sessions instead of counting messages."""
+    result = await db.execute(
+        select(func.coalesce(func.sum(ChatSession.message_count), 0))
+        .where(_rows_of(ChatSession, target_type, target_id))
+    )
+    return result.scalar()
+
+
+async def drop_emptied_sessions(db: AsyncSession, project_id: UUID) -> None:
+    """Remove sessions whose latest version was deleted and that have no
+    chat_history left; sessions that still have messages of other versions
+    stay listed (with agent_version_id NULL)."""
+    await db.execute(
+        delete(ChatSession)
+        .where(
+            ChatSession.project_id == project_id,
+            ChatSession.agent_version_id.is_(None),
+            ~exists().where(ChatHistory.session_id == ChatSession.session_id),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def delete_target(
+    db: AsyncSession,
+    project_id: UUID,
+    target_type: str,
+    target_id: UUID,
+) -> Optional[DeletionJob]:
+    """Delete a project, agent or agent version and everything under it.
+
+    Small targets are removed right away by one DELETE of the parent row
+    (children go through ON DELETE CASCADE) and None is returned. Larger
+    ones are hidden (deleted_at) and handed to the background runner, which
+    deletes their chat history in bounded batches; the queued job is
+    returned. Commits in both cases.
+    """
+    model = TARGET_MODELS[target_type]
+    estimated = await estimate_rows(db, target_type, target_id)
+    if estimated <= settings.deletion_sync_max_rows:
+        await db.execute(delete(model).where(model.id == target_id))
+        if target_type != "project":
+            await drop_emptied_sessions(db, project_id)
+        await db.commit()
+        return None
+
+    await db.execute(update(model).where(model.id == target_id).values(deleted_at=func.now()))
+    job = DeletionJob(
+        project_id=project_id,
+        target_type=target_type,
+        target_id=target_id,
+        estimated_rows=estimated,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    deletion_runner.wake()
+    return job
+
+
+class DeletionJobRunner(PeriodicWorker):
+    """Runs queued deletion jobs one batch per transaction.
+
+    A project's sessions go first (so they leave the listings), then
+    chat_history ``deletion_batch_size`` rows at a time with a short pause in
+    between, and finally the parent row, whose remaining children are small
+    enough for ON DELETE CASCADE. Sessions of an agent or version may also
+    hold other versions' messages; they are only dropped once empty. Each
+    batch renews the job's lease; a job left behind by a stopped process is
+    resumed once its lease expires.
+    """
+
+    name = "deletion-job-runner"
+    run_on_stop = False
+
+    def __init__(self, interval: float, batch_size: int, batch_pause: float, lease_seconds: int):
+        super().__init__(interval)
+        self.batch_size = max(batch_size, 1)
+        self.batch_pause = batch_pause
+        self.lease_seconds = lease_seconds
+        self._due = asyncio.Event()
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.rows_deleted = 0
+
+    def wake(self) -> None:
+        """Start on a newly queued job without waiting for the next poll."""
+        self._due.set()
+
+    def _lease_until(self):
+        return func.now() + timedelta(seconds=self.lease_seconds)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._due.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._due.clear()
+            await self._tick()
+
+    async def run_once(self) -> None:
+        while True:
+            job = await self._claim()
+            if job is None:
+                return
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.exception("Deletion job %s failed", job.id)
+                await self._record_failure(job, e)
+                # Retried on the next poll rather than straight away
+                return
+
+    async def _claim(self) -> Optional[DeletionJob]:
+        async with async_session() as db:
+            claimable = (
+                select(DeletionJob.id)
+                .where(
+                    DeletionJob.status.in_(ACTIVE_STATUSES),
+                    or_(DeletionJob.lease_expires_at.is_(None), DeletionJob.lease_expires_at < func.now()),
+                )
+                .order_by(DeletionJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            result = await db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == claimable.scalar_subquery())
+                .values(
+                    status="running",
+                    lease_expires_at=self._lease_until(),
+                    started_at=func.coalesce(DeletionJob.started_at, func.now()),
+                )
+                .returning(DeletionJob)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.scalar_one_or_none()
+            await db.commit()
+            return job
+
+    async def _delete_batch(self, job: DeletionJob, model, keys, counted: bool) -> int:
+        """Delete up to batch_size of the target's rows from ``model`` and record
+        the progress (and renewed lease) in the same transaction."""
+        batch = select(*keys).where(_rows_of(model, job.target_type, job.target_id)).limit(self.batch_size)
+        async with async_session() as db:
+            result = await db.execute(
+                delete(model)
+                .where(tuple_(*keys).in_(batch))
+                .execution_options(synchronize_session=False)
+            )
+            deleted = result.rowcount
+            await db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == job.id)
+                .values(
+                    rows_deleted=DeletionJob.rows_deleted + (deleted if counted else 0),
+                    lease_expires_at=self._lease_until(),
+                )
+            )
+            await db.commit()
+        return deleted
+
+    async def _run(self, job: DeletionJob) -> None:
+        if job.target_type == "project":
+            # Sessions are cheap (one row each) and take the conversations out of listings
+            while await self._delete_batch(job, ChatSession, (ChatSession.session_id,), False) >= self.batch_size:
+                pass
+            session_cache.invalidate_project(job.project_id)
+
+        while True:
+            deleted = await self._delete_batch(job, ChatHistory, (ChatHistory.id, ChatHistory.created_at), True)
+            self.rows_deleted += deleted
+            if deleted < self.batch_size:
+                break
+            # Leave room for chat traffic, autovacuum and replicas between batches
+            await asyncio.sleep(self.batch_pause)
+
+        model = TARGET_MODELS[job.target_type]
+        async with async_session() as db:
+            await db.execute(delete(model).where(model.id == job.target_id))
+            if job.target_type != "project":
+                await drop_emptied_sessions(db, job.project_id)
+            await db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == job.id)
+                .values(status="completed", finished_at=func.now(), lease_expires_at=None, error=None)
+            )
+            await db.commit()
+        self.jobs_completed += 1
+        agent_versions.invalidate_project(job.project_id)
+        session_cache.invalidate_project(job.project_id)
+        logger.info("Deletion job %s removed %s %s", job.id, job.target_type, job.target_id)
+
+    async def _record_failure(self, job: DeletionJob, error: Exception) -> None:
+        failed = job.attempts + 1 >= _MAX_ATTEMPTS
+        if failed:
+            self.jobs_failed += 1
+        async with async_session() as db:
+            # Releasing the lease lets the next poll retry it
+            await db.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == job.id)
+                .values(
+                    attempts=DeletionJob.attempts + 1,
+                    error=str(error)[:2000],
+                    lease_expires_at=None,
+                    status="failed" if failed else "running",
+                    finished_at=func.now() if failed else None,
+                )
+            )
+            await db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "rows_deleted": self.rows_deleted,
+        }
+
+
+deletion_runner = DeletionJobRunner(
+    interval=settings.deletion_poll_seconds,
+    batch_size=settings.deletion_batch_size,
+    batch_pause=settings.deletion_batch_pause_ms / 1000,
+    lease_seconds=settings.deletion_lease_seconds,
+)
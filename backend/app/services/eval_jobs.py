@@ -0,0 +1,360 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select, update, or_, func
+from sqlalchemy.dialects.postgresql import insert
+from app.config import settings
+from app.database import async_session
+from app.models import Agent, AgentVersion, EvalJob, EvalJobItem, EvalResult
+from app.services.agent_cache import ResolvedAgentVersion
+from app.services.background import PeriodicWorker
+from app.services.chat_history import HistoryWindow
+from app.services.langchain_service import LangChainService
+from app.services.provider_limiter import ProviderOverloadedError
+from app.utils.prompt_variables import render_compiled
+
+logger = logging.getLogger(__name__)
+
+# Versions (and agents) queued for deletion are not evaluated
+_LIVE_VERSION = (AgentVersion.deleted_at.is_(None), Agent.deleted_at.is_(None))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+# Items are scanned for missing results this many at a time
+_ITEM_PAGE_SIZE = 500
+
+
+class _ResultWriter:
+    """Buffers a job's results and writes them in batches with its progress counters."""
+
+    def __init__(self, job_id: UUID, batch_size: int, lease_seconds: int):
+        self.job_id = job_id
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.written = 0
+        self._rows: List[dict] = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            async with async_session() as db:
+                # A pair finished by a previous owner of the job is not counted twice
+                result = await db.execute(
+                    insert(EvalResult)
+                    .values(rows)
+                    .on_conflict_do_nothing(index_elements=[EvalResult.item_id, EvalResult.agent_version_id])
+                    .returning(EvalResult.status)
+                )
+                statuses = list(result.scalars())
+                succeeded = statuses.count("succeeded")
+                await db.execute(
+                    update(EvalJob)
+                    .where(EvalJob.id == self.job_id)
+                    .values(
+                        succeeded_count=EvalJob.succeeded_count + succeeded,
+                        failed_count=EvalJob.failed_count + (len(statuses) - succeeded),
+                        lease_expires_at=func.now() + timedelta(seconds=self.lease_seconds),
+                    )
+                )
+                await db.commit()
+            self.written += len(statuses)
+
+
+class EvalJobRunner(PeriodicWorker):
+    """Claims evaluation jobs and runs them on bounded asyncio worker pools.
+
+    Every interval the runner renews the leases of the jobs it owns, stops
+    jobs that were cancelled through the API, and claims pending jobs or
+    running jobs whose lease expired (their process restarted). A resumed job
+    only produces the (item, version) results that are still missing. A job
+    fails once one of its agents or versions is deleted, before or while it
+    runs.
+    """
+
+    name = "eval-job-runner"
+
+    def __init__(
+        self,
+        interval: float,
+        lease_seconds: int,
+        max_running_jobs: int,
+        max_inflight_calls: int,
+        batch_size: int,
+    ):
+        super().__init__(interval)
+        self.lease_seconds = lease_seconds
+        self.max_running_jobs = max_running_jobs
+        self.batch_size = batch_size
+        self._llm_slots = asyncio.Semaphore(max_inflight_calls)
+        self._jobs: Dict[UUID, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self.calls_in_flight = 0
+        self.results_written = 0
+
+    def _lease_until(self):
+        return func.now() + timedelta(seconds=self.lease_seconds)
+
+    async def run_once(self) -> None:
+        async with self._lock:
+            if self._stopping:
+                await self._release()
+                return
+            async with async_session() as db:
+                owned = list(self._jobs)
+                if owned:
+                    result = await db.execute(
+                        update(EvalJob)
+                        .where(EvalJob.id.in_(owned), EvalJob.status == "running")
+                        .values(lease_expires_at=self._lease_until())
+                        .returning(EvalJob.id)
+                    )
+                    # Cancelled or deleted since the last tick
+                    for job_id in set(owned) - set(result.scalars()):
+                        self.cancel(job_id)
+
+                claimed: List[UUID] = []
+                slots = self.max_running_jobs - len(self._jobs)
+                if slots > 0:
+                    claimable = (
+                        select(EvalJob.id)
+                        .where(
+                            EvalJob.status.in_(ACTIVE_STATUSES),
+                            or_(EvalJob.lease_expires_at.is_(None), EvalJob.lease_expires_at < func.now()),
+                        )
+                        .order_by(EvalJob.created_at)
+                        .limit(slots)
+                        .with_for_update(skip_locked=True)
+                    )
+                    result = await db.execute(
+                        update(EvalJob)
+                        .where(EvalJob.id.in_(claimable.scalar_subquery()))
+                        .values(
+                            status="running",
+                            lease_expires_at=self._lease_until(),
+                            started_at=func.coalesce(EvalJob.started_at, func.now()),
+                        )
+                        .returning(EvalJob.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    claimed = list(result.scalars())
+                await db.commit()
+
+            for job_id in claimed:
+                self._jobs[job_id] = asyncio.get_running_loop().create_task(
+                    self._run_job(job_id), name=f"eval-job-{job_id}"
+                )
+
+    async def stop(self) -> None:
+        self._stopping = True
+        await super().stop()
+
+    async def _release(self) -> None:
+        # Let another process resume our jobs right away instead of after the lease
+        tasks = list(self._jobs.values())
+        owned = list(self._jobs)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if owned:
+            async with async_session() as db:
+                await db.execute(
+                    update(EvalJob)
+                    .where(EvalJob.id.in_(owned), EvalJob.status == "running")
+                    .values(lease_expires_at=None)
+                )
+                await db.commit()
+
+    async def wake(self) -> None:
+        """Claim newly submitted work now instead of at the next tick."""
+        try:
+            await self.run_once()
+        except Exception:
+            logger.exception("%s failed", self.name)
+
+    def cancel(self, job_id: UUID) -> None:
+        task = self._jobs.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def _run_job(self, job_id: UUID) -> None:
+        writer = _ResultWriter(job_id, self.batch_size, self.lease_seconds)
+        try:
+            async with async_session() as db:
+                job = await db.get(EvalJob, job_id)
+                result = await db.execute(
+                    select(Agent.name, AgentVersion)
+                    .join(Agent, Agent.id == AgentVersion.agent_id)
+                    .where(
+                        AgentVersion.id.in_(job.agent_version_ids),
+                        Agent.project_id == job.project_id,
+                        *_LIVE_VERSION
+                    )
+                )
+                versions = [ResolvedAgentVersion.from_orm(row.AgentVersion, row.name) for row in result]
+            if len(versions) != len(set(job.agent_version_ids)):
+                raise ValueError("One or more agent versions of this job no longer exist")
+
+            concurrency = min(job.concurrency, settings.eval_max_job_concurrency)
+            queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+            tasks = [asyncio.create_task(self._produce(queue, job_id, versions, concurrency))]
+            tasks += [asyncio.create_task(self._worker(queue, writer)) for _ in range(concurrency)]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            await writer.flush()
+            await self._finish(job_id, "completed")
+        except asyncio.CancelledError:
+            # Keep what was produced; the job is resumed or stays cancelled
+            await writer.flush()
+            raise
+        except Exception as e:
+            logger.exception("Evaluation job %s failed", job_id)
+            try:
+                await writer.flush()
+            finally:
+                await self._finish(job_id, "failed", str(e))
+        finally:
+            self.results_written += writer.written
+            self._jobs.pop(job_id, None)
+
+    async def _missing_pairs(
+        self,
+        job_id: UUID,
+        versions: List[ResolvedAgentVersion],
+    ) -> AsyncIterator[Tuple[EvalJobItem, ResolvedAgentVersion]]:
+        after = -1
+        while True:
+            async with async_session() as db:
+                result = await db.execute(
+                    select(EvalJobItem)
+                    .where(EvalJobItem.job_id == job_id, EvalJobItem.position > after)
+                    .order_by(EvalJobItem.position)
+                    .limit(_ITEM_PAGE_SIZE)
+                )
+                items = result.scalars().all()
+                if not items:
+                    return
+                # Stop calling the provider for versions deleted while the job runs
+                live = await db.execute(
+                    select(func.count(AgentVersion.id))
+                    .join(Agent, Agent.id == AgentVersion.agent_id)
+                    .where(AgentVersion.id.in_([version.id for version in versions]), *_LIVE_VERSION)
+                )
+                if live.scalar() != len(versions):
+                    raise ValueError("One or more agent versions of this job were deleted")
+                done = await db.execute(
+                    select(EvalResult.item_id, EvalResult.agent_version_id)
+                    .where(EvalResult.item_id.in_([item.id for item in items]))
+                )
+                finished = {(row.item_id, row.agent_version_id) for row in done}
+            for item in items:
+                for version in versions:
+                    if (item.id, version.id) not in finished:
+                        yield item, version
+            after = items[-1].position
+
+    async def _produce(
+        self,
+        queue: asyncio.Queue,
+        job_id: UUID,
+        versions: List[ResolvedAgentVersion],
+        workers: int,
+    ) -> None:
+        async for pair in self._missing_pairs(job_id, versions):
+            await queue.put(pair)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _worker(self, queue: asyncio.Queue, writer: _ResultWriter) -> None:
+        while True:
+            pair = await queue.get()
+            if pair is None:
+                return
+            await writer.add(await self._evaluate(*pair))
+
+    async def _evaluate(self, item: EvalJobItem, agent_version: ResolvedAgentVersion) -> dict:
+        row = {
+            "job_id": item.job_id,
+            "item_id": item.id,
+            "agent_version_id": agent_version.id,
+            "output": None,
+            "error": None,
+            "tokens_used": None,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+        }
+        prompt_text = agent_version.system_prompt
+        if agent_version.prompt_variables:
+            prompt_text = render_compiled(agent_version.prompt_segments, item.variables or {}, strict=False)
+        # Same message building and LLM call path as /api/chat, without history
+        window = HistoryWindow()
+        messages = LangChainService.build_messages(prompt_text, window, item.input)
+
+        async with self._llm_slots:
+            self.calls_in_flight += 1
+            started = time.perf_counter()
+            try:
+                while True:
+                    try:
+                        result = await LangChainService.complete(
+                            agent_version, prompt_text, window, item.input, messages
+                        )
+                        break
+                    except ProviderOverloadedError as e:
+                        # Background work yields to interactive traffic instead of failing
+                        await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                row.update(status="failed", error=str(e))
+            else:
+                row.update(
+                    status="succeeded",
+                    output=result["response"],
+                    tokens_used=result["tokens_used"],
+                    prompt_tokens=result["prompt_tokens"],
+                    completion_tokens=result["completion_tokens"],
+                )
+            finally:
+                self.calls_in_flight -= 1
+        row["latency_ms"] = int((time.perf_counter() - started) * 1000)
+        row["created_at"] = datetime.utcnow()
+        return row
+
+    async def _finish(self, job_id: UUID, status: str, error: Optional[str] = None) -> None:
+        async with async_session() as db:
+            # A job cancelled meanwhile keeps its status
+            await db.execute(
+                update(EvalJob)
+                .where(EvalJob.id == job_id, EvalJob.status == "running")
+                .values(status=status, error=error, finished_at=func.now(), lease_expires_at=None)
+            )
+            await db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running_jobs": len(self._jobs),
+            "calls_in_flight": self.calls_in_flight,
+            "results_written": self.results_written,
+        }
+
+
+eval_jobs = EvalJobRunner(
+    interval=settings.eval_poll_seconds,
+    lease_seconds=settings.eval_lease_seconds,
+    max_running_jobs=settings.eval_max_running_jobs,
+    max_inflight_calls=settings.eval_max_inflight_calls,
+    batch_size=settings.eval_result_batch_size,
+)
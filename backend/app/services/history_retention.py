@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+from sqlalchemy import delete, select, text
+from app.config import settings
+from app.database import async_session
+from app.models import ChatSession, Project
+from app.services.background import PeriodicWorker
+from app.services.session_cache import session_cache
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r"^chat_history_p(\d{4})(\d{2})$")
+# Serialises maintenance across API processes (pg_try_advisory_xact_lock key)
+_LOCK_KEY = 0x63686174  # "chat"
+
+
+# Session aggregates lose what the removed rows contributed; token totals
+# that were never reported (NULL) stay NULL
+_SUBTRACT_SESSIONS = """
+    UPDATE chat_sessions s SET
+        message_count = s.message_count - g.messages,
+        total_tokens = s.total_tokens - COALESCE(g.tokens, 0),
+        total_prompt_tokens = s.total_prompt_tokens - COALESCE(g.prompt_tokens, 0),
+        total_completion_tokens = s.total_completion_tokens - COALESCE(g.completion_tokens, 0)
+    FROM (
+        SELECT session_id, count(*) AS messages, sum(tokens_used) AS tokens,
+               sum(prompt_tokens) AS prompt_tokens, sum(completion_tokens) AS completion_tokens
+        FROM {source}
+        GROUP BY session_id
+    ) g
+    WHERE s.session_id = g.session_id
+"""
+
+# Before a month is dropped: only sessions that continue after it need adjusting
+_SUBTRACT_PARTITION = _SUBTRACT_SESSIONS.format(source="""(
+            SELECT * FROM "{partition}" h WHERE h.session_id IN (
+                SELECT session_id FROM chat_sessions
+                WHERE project_id = ANY(:projects) AND last_message_at >= :upper
+            )
+        ) AS removed""")
+
+# One batch of a partial month: delete and adjust in one statement; returns rows deleted
+_DELETE_BATCH = """
+    WITH removed AS (
+        DELETE FROM "{partition}"
+        WHERE id IN (SELECT id FROM "{partition}" WHERE project_id = ANY(:projects) LIMIT :batch)
+        RETURNING session_id, tokens_used, prompt_tokens, completion_tokens
+    ), adjusted AS (""" + _SUBTRACT_SESSIONS.format(source="removed").rstrip() + """
+        RETURNING 1
+    )
+    SELECT count(*) FROM removed
+"""
+
+# Sessions that lost their oldest messages start at their oldest remaining one
+_RESET_FIRST_MESSAGE = text("""
+    UPDATE chat_sessions s SET first_message_at = COALESCE((
+        SELECT min(h.created_at) FROM chat_history h WHERE h.session_id = s.session_id
+    ), s.first_message_at)
+    WHERE s.project_id = ANY(:projects) AND s.first_message_at < :upper AND s.last_message_at >= :upper
+""")
+
+
+def _month_bounds(name: str) -> Optional[Tuple[datetime, datetime]]:
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    lower = datetime(year, month, 1, tzinfo=timezone.utc)
+    upper = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return lower, upper
+
+
+class HistoryMaintenance(PeriodicWorker):
+    """Keeps chat_history's monthly partitions created ahead of time and
+    applies per-project retention (projects.history_retention_days).
+
+    A month whose rows all belong to projects past their retention is dropped
+    (or detached and renamed chat_history_archive_pYYYYMM when
+    CHAT_HISTORY_RETENTION_ACTION=detach) as a whole. A month still needed by
+    another project only loses the expired projects' rows, deleted from that
+    one partition ``deletion_batch_size`` rows per transaction with a pause in
+    between, like a deletion job; on a large multi-tenant month this takes a
+    while, and an interrupted run carries on at the next interval. Sessions
+    reaching past a removed month keep their later messages, and their
+    chat_sessions counts, token totals and first_message_at are adjusted in
+    the same transactions. Rows that landed in chat_history_default because
+    their month's partition was missing are moved into it once it is created.
+    """
+
+    name = "chat-history-maintenance"
+    run_on_stop = False
+
+    def __init__(self, interval: float, batch_size: int, batch_pause: float):
+        super().__init__(interval)
+        self.batch_size = max(batch_size, 1)
+        self.batch_pause = batch_pause
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.partitions_detached = 0
+        self.rows_deleted = 0
+        self.last_run_at: Optional[datetime] = None
+
+    async def _loop(self) -> None:
+        # Run at startup too, so a deployment that was down for a while gets its partitions
+        while True:
+            await self._tick()
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    async def _lock(db) -> bool:
+        return (await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}
+        )).scalar()
+
+    async def run_once(self) -> None:
+        async with async_session() as db:
+            if not await self._lock(db):
+                # Another process is doing it
+                return
+            # Detach/drop need a brief exclusive lock on chat_history; never queue behind long readers
+            await db.execute(text("SET LOCAL lock_timeout = '5s'"))
+            created = (await db.execute(
+                text("SELECT ensure_chat_history_partitions(:today, :ahead)"),
+                {"today": datetime.utcnow().date(), "ahead": settings.chat_history_partition_months_ahead},
+            )).scalar()
+            self.partitions_created += created or 0
+            removed, partial = await self._apply_retention(db)
+            await db.commit()
+        for project_id in removed:
+            session_cache.invalidate_project(project_id)
+        for name, upper, expired in partial:
+            if not await self._delete_expired_rows(name, upper, expired):
+                break
+        self.last_run_at = datetime.utcnow()
+
+    async def _apply_retention(self, db) -> Tuple[Set[UUID], List[Tuple[str, datetime, List[UUID]]]]:
+        """Drop or detach fully expired months.
+
+        Returns the projects that lost history, and (partition, upper bound,
+        expired projects) of the months that only lose some projects' rows.
+        """
+        result = await db.execute(
+            select(Project.id, Project.history_retention_days)
+            .where(Project.history_retention_days.is_not(None))
+        )
+        now = datetime.now(timezone.utc)
+        cutoffs: Dict[UUID, datetime] = {
+            row.id: now - timedelta(days=row.history_retention_days) for row in result
+        }
+        if not cutoffs:
+            return set(), []
+        latest_cutoff = max(cutoffs.values())
+
+        result = await db.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'chat_history'::regclass"
+        ))
+        partitions: List[Tuple[str, datetime, datetime]] = []
+        for name in result.scalars():
+            bounds = _month_bounds(name)
+            # Only months entirely older than some project's cutoff can be affected
+            if bounds is not None and bounds[1] <= latest_cutoff:
+                partitions.append((name, *bounds))
+
+        removed: Set[UUID] = set()
+        partial: List[Tuple[str, datetime, List[UUID]]] = []
+        for name, lower, upper in sorted(partitions, key=lambda p: p[1]):
+            # chat_sessions brackets every message of a session, so it tells
+            # which projects have rows in the month without scanning it
+            result = await db.execute(
+                select(ChatSession.project_id).distinct().where(
+                    ChatSession.first_message_at < upper,
+                    ChatSession.last_message_at >= lower,
+                )
+            )
+            present = set(result.scalars())
+            if not present:
+                # No sessions may also mean history the sessions table never
+                # covered; only an empty month is safe to drop without owners
+                has_rows = (await db.execute(text(f'SELECT 1 FROM "{name}" LIMIT 1'))).first()
+                if has_rows is None:
+                    await self._remove_partition(db, name, lower)
+                continue
+            expired = [p for p in present if p in cutoffs and upper <= cutoffs[p]]
+            if len(expired) == len(present):
+                # Later messages of sessions reaching past this month stay
+                await db.execute(
+                    text(_SUBTRACT_PARTITION.format(partition=name)), {"projects": expired, "upper": upper}
+                )
+                await self._remove_partition(db, name, lower)
+                await self._finish_month(db, upper, expired)
+                removed.update(expired)
+            elif expired:
+                # Other projects still keep this month; delete within this partition only
+                partial.append((name, upper, expired))
+        return removed, partial
+
+    async def _delete_expired_rows(self, name: str, upper: datetime, expired: List[UUID]) -> bool:
+        """Delete the expired projects' rows of one partition in batches.
+
+        Returns False if another process took over maintenance meanwhile.
+        """
+        while True:
+            async with async_session() as db:
+                if not await self._lock(db):
+                    return False
+                deleted = (await db.execute(
+                    text(_DELETE_BATCH.format(partition=name)),
+                    {"projects": expired, "batch": self.batch_size},
+                )).scalar() or 0
+                if deleted < self.batch_size:
+                    await self._finish_month(db, upper, expired)
+                await db.commit()
+            self.rows_deleted += deleted
+            if deleted < self.batch_size:
+                for project_id in expired:
+                    session_cache.invalidate_project(project_id)
+                return True
+            # Leave room for chat traffic, autovacuum and replicas between batches
+            await asyncio.sleep(self.batch_pause)
+
+    async def _finish_month(self, db, upper: datetime, expired: List[UUID]) -> None:
+        # Sessions whose last message is gone with this month go with it
+        await db.execute(
+            delete(ChatSession).where(
+                ChatSession.project_id.in_(expired),
+                ChatSession.last_message_at < upper,
+            )
+        )
+        await db.execute(_RESET_FIRST_MESSAGE, {"projects": expired, "upper": upper})
+
+    async def _remove_partition(self, db, name: str, lower: datetime) -> None:
+        await db.execute(text(f'ALTER TABLE chat_history DETACH PARTITION "{name}"'))
+        if settings.chat_history_retention_action == "detach":
+            archive = f"chat_history_archive_p{lower:%Y%m}"
+            await db.execute(text(f'ALTER TABLE "{name}" RENAME TO "{archive}"'))
+            self.partitions_detached += 1
+            logger.info("Detached chat history partition %s as %s", name, archive)
+        else:
+            await db.execute(text(f'DROP TABLE "{name}"'))
+            self.partitions_dropped += 1
+            logger.info("Dropped chat history partition %s", name)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "partitions_created": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "partitions_detached": self.partitions_detached,
+            "rows_deleted": self.rows_deleted,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+history_maintenance = HistoryMaintenance(
+    interval=settings.chat_history_maintenance_seconds,
+    batch_size=settings.deletion_batch_size,
+    batch_pause=settings.deletion_batch_pause_ms / 1000,
+)
@@ -1,19 +1,141 @@
-from typing import Optional, List, AsyncGenerator, Tuple, Dict
+from typing import Optional, List, AsyncGenerator, Tuple, Dict, Union
 from uuid import UUID
+import asyncio
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from app.models import AgentVersion, ChatHistory
-from app.utils.encryption import decrypt_api_key
+from app.models import ChatHistory
+from app.services.agent_cache import ResolvedAgentVersion
+from app.services.chat_history import HistoryRequest, HistoryWindow, load_history_window, load_history_windows
+from app.services.chat_sessions import record_messages_bulk
+from app.services.usage_rollups import record_usage
+from app.services.chat_writer import chat_writer, session_delta
+from app.services.llm_clients import llm_clients
+from app.services.provider_limiter import provider_limits, ProviderOverloadedError
+from app.services.response_cache import response_cache, response_cache_key, response_cache_scope
+from app.services.similarity_cache import similarity_cache
+from app.services.session_cache import session_cache
+
+
+def _parse_usage(response) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Return (tokens_used, prompt_tokens, completion_tokens) reported by a message or chunk."""
+    usage = None
+    if hasattr(response, 'usage_metadata') and response.usage_metadata:
+        usage = response.usage_metadata
+    if not usage and hasattr(response, 'response_metadata') and response.response_metadata:
+        usage = response.response_metadata.get('token_usage') or response.response_metadata.get('usage')
+    if not usage:
+        return None, None, None
+
+    tokens_used = usage.get('total_tokens') or usage.get('total')
+    prompt_tokens = usage.get('prompt_tokens') or usage.get('input_tokens')
+    completion_tokens = usage.get('completion_tokens') or usage.get('output_tokens')
+
+    # Calculate tokens_used from prompt + completion if available
+    if prompt_tokens is not None and completion_tokens is not None:
+        calculated_tokens = prompt_tokens + completion_tokens
+        # Use calculated value if total_tokens is not available or seems incorrect
+        if tokens_used is None or tokens_used == 0 or tokens_used != calculated_tokens:
+            tokens_used = calculated_tokens
+    return tokens_used, prompt_tokens, completion_tokens
+
+
+async def release_connection(db: AsyncSession) -> None:
+    """End the session's read transaction so its pooled connection is returned.
+
+    The session stays usable (expire_on_commit is off) and checks a connection
+    out again on its next statement, so nothing is held while the LLM answers.
+    """
+    if db.in_transaction():
+        await db.commit()
+
+
+@dataclass
+class BatchChatItem:
+    agent_version: ResolvedAgentVersion
+    message: str
+    session_id: Optional[UUID] = None  # None starts a new session
+    system_prompt: Optional[str] = None
+
 
 class LangChainService:
+    @staticmethod
+    def build_messages(prompt_text: str, window: HistoryWindow, message: str) -> List[BaseMessage]:
+        messages: List[BaseMessage] = [SystemMessage(content=prompt_text)]
+        for role, content in window.messages:
+            if role == "user":
+                messages.append(HumanMessage(content=content))
+            elif role == "assistant":
+                messages.append(AIMessage(content=content))
+        # Add the new user message
+        messages.append(HumanMessage(content=message))
+        return messages
+
+    @staticmethod
+    async def invoke(agent_version: ResolvedAgentVersion, messages: List[BaseMessage]) -> dict:
+        """Call the LLM without touching the database."""
+        llm = llm_clients.get_chat_model(agent_version)
+        try:
+            async with provider_limits.acquire(agent_version, messages) as permit:
+                response = await llm.ainvoke(messages)
+                tokens_used, prompt_tokens, completion_tokens = _parse_usage(response)
+                permit.record_usage(tokens_used)
+        except ProviderOverloadedError:
+            raise
+        except Exception as e:
+            raise Exception(f"LLM Error: {str(e)}")
+        return {
+            "response": response.content,
+            "tokens_used": tokens_used,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+
+    @staticmethod
+    async def complete(
+        agent_version: ResolvedAgentVersion,
+        prompt_text: str,
+        window: HistoryWindow,
+        message: str,
+        messages: List[BaseMessage]
+    ) -> dict:
+        """invoke() behind the response caches when the version allows it.
+
+        The near-duplicate tier (if enabled) is consulted first, then the
+        exact-match cache. The result carries ``cached``; answers served from a
+        cache (or shared with an identical in-flight call) report zero tokens
+        since none were spent.
+        """
+        if not response_cache.cacheable(agent_version):
+            return {**await LangChainService.invoke(agent_version, messages), "cached": False}
+        scope = response_cache_scope(agent_version.id, prompt_text, window.messages)
+        result = similarity_cache.get(scope, message) if similarity_cache.enabled else None
+        cached = result is not None
+        if not cached:
+            result, cached = await response_cache.get_or_compute(
+                response_cache_key(scope, message),
+                agent_version.id,
+                lambda: LangChainService.invoke(agent_version, messages)
+            )
+            if similarity_cache.enabled:
+                similarity_cache.put(scope, message, result)
+        if cached:
+            return {
+                "response": result["response"],
+                "tokens_used": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached": True,
+            }
+        return {**result, "cached": False}
+
     @staticmethod
     async def get_chat_response(
         db: AsyncSession,
-        agent_version: AgentVersion,
+        agent_version: ResolvedAgentVersion,
         message: str,
         project_id: UUID,
         session_id: Optional[UUID] = None,
@@ -23,152 +145,69 @@ class LangChainService:
         """Process a chat message using LangChain"""
         
         # Generate session ID if not provided
-        if session_id is None:
+        new_session = session_id is None
+        if new_session:
             session_id = uuid.uuid4()
         
-        # Decrypt the API key
-        api_key = decrypt_api_key(agent_version.api_key_encrypted)
-        
-        # Configure LLM
-        llm_config = {
-            "model": agent_version.model_name,
-            "api_key": api_key,
-            "temperature": float(agent_version.temperature),
-            "max_tokens": agent_version.max_tokens,
-            "stream_usage": True,  # Enable token usage tracking for both HTTP and streaming
-        }
-        
-        if agent_version.base_url:
-            llm_config["base_url"] = agent_version.base_url
-
-        # Penalties and sampling params should be passed explicitly (avoid model_kwargs warnings)
-        llm_config["top_p"] = float(agent_version.top_p) if agent_version.top_p is not None else None
-        llm_config["frequency_penalty"] = float(agent_version.frequency_penalty or 0)
-        llm_config["presence_penalty"] = float(agent_version.presence_penalty or 0)
-        if agent_version.stop_sequences:
-            llm_config["stop"] = agent_version.stop_sequences
-
-        # Remove None values to keep payload clean
-        llm_config = {k: v for k, v in llm_config.items() if v is not None}
-        
-        llm = ChatOpenAI(**llm_config)
-        
-        # Get conversation history for this session
-        result = await db.execute(
-            select(ChatHistory)
-            .where(
-                ChatHistory.session_id == session_id,
-                ChatHistory.project_id == project_id
-            )
-            .order_by(ChatHistory.created_at)
-        )
-        history = result.scalars().all()
-        
-        # Build messages list
+        # Build messages list from the windowed conversation history
         prompt_text = system_prompt or agent_version.system_prompt
-        messages = [SystemMessage(content=prompt_text)]
-        
-        for msg in history:
-            if msg.role == "user":
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant":
-                messages.append(AIMessage(content=msg.content))
-        
-        # Add the new user message
-        messages.append(HumanMessage(content=message))
-        
-        # Save user message to history
+        window = HistoryWindow()
+        if not new_session:
+            window = await load_history_window(db, project_id, session_id, agent_version, prompt_text, message)
+        messages = LangChainService.build_messages(prompt_text, window, message)
         now = datetime.utcnow()
-        user_chat = ChatHistory(
-            project_id=project_id,
-            agent_version_id=agent_version.id,
-            project_api_key_id=project_api_key_id,
-            session_id=session_id,
-            role="user",
-            content=message,
-            created_at=now
-        )
-        db.add(user_chat)
+        await release_connection(db)
         
-        # Get response from LLM
-        try:
-            response = await llm.ainvoke(messages)
-            response_content = response.content
-            tokens_used = None
-            prompt_tokens = None
-            completion_tokens = None
-            
-            # Try to get token usage if available
-            usage = None
-            if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                usage = response.usage_metadata
-            if not usage and hasattr(response, 'response_metadata') and response.response_metadata:
-                usage = response.response_metadata.get('token_usage') or response.response_metadata.get('usage')
-            if usage:
-                tokens_used = usage.get('total_tokens') or usage.get('total')
-                prompt_tokens = usage.get('prompt_tokens') or usage.get('input_tokens')
-                completion_tokens = usage.get('completion_tokens') or usage.get('output_tokens')
-                
-                # Calculate tokens_used from prompt + completion if available
-                if prompt_tokens is not None and completion_tokens is not None:
-                    calculated_tokens = prompt_tokens + completion_tokens
-                    # Use calculated value if total_tokens is not available or seems incorrect
-                    if tokens_used is None or tokens_used == 0 or tokens_used != calculated_tokens:
-                        tokens_used = calculated_tokens
-        except Exception as e:
-            # Save error and re-raise
-            await db.rollback()
-            raise Exception(f"LLM Error: {str(e)}")
+        # Get response from LLM (no connection held)
+        result = await LangChainService.complete(agent_version, prompt_text, window, message, messages)
+        response_content = result["response"]
+        tokens_used = result["tokens_used"]
+        prompt_tokens = result["prompt_tokens"]
+        completion_tokens = result["completion_tokens"]
         
-        # Save assistant response to history
-        assistant_chat = ChatHistory(
-            project_id=project_id,
-            agent_version_id=agent_version.id,
-            project_api_key_id=project_api_key_id,
-            session_id=session_id,
-            role="assistant",
-            content=response_content,
-            tokens_used=tokens_used,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            created_at=datetime.utcnow()
-        )
-        db.add(assistant_chat)
-        await db.commit()
-
-        # Hitung total token sesi (akumulasi) bila tersedia
-        total_tokens = None
-        total_prompt_tokens = None
-        total_completion_tokens = None
-        if session_id:
-            # Total tokens
-            total_result = await db.execute(
-                select(func.sum(ChatHistory.tokens_used)).where(
-                    ChatHistory.session_id == session_id,
-                    ChatHistory.project_id == project_id
-                )
-            )
-            total_tokens = total_result.scalar()
-            
-            # Total prompt tokens
-            prompt_result = await db.execute(
-                select(func.sum(ChatHistory.prompt_tokens)).where(
-                    ChatHistory.session_id == session_id,
-                    ChatHistory.project_id == project_id,
-                    ChatHistory.prompt_tokens.isnot(None)
-                )
-            )
-            total_prompt_tokens = prompt_result.scalar()
-            
-            # Total completion tokens
-            completion_result = await db.execute(
-                select(func.sum(ChatHistory.completion_tokens)).where(
-                    ChatHistory.session_id == session_id,
-                    ChatHistory.project_id == project_id,
-                    ChatHistory.completion_tokens.isnot(None)
-                )
+        # Save both turns in one short transaction (or hand them to the write-behind queue)
+        common = {
+            "project_id": project_id,
+            "agent_version_id": agent_version.id,
+            "project_api_key_id": project_api_key_id,
+            "session_id": session_id,
+        }
+        completed_at = datetime.utcnow()
+        # Hitung total token sesi (akumulasi) dari agregat sesi, bukan SUM() per giliran
+        totals = await chat_writer.persist(
+            db,
+            [
+                {**common, "role": "user", "content": message, "created_at": now},
+                {
+                    **common,
+                    "role": "assistant",
+                    "content": response_content,
+                    "tokens_used": tokens_used,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "created_at": completed_at,
+                },
+            ],
+            session_delta(
+                project_id=project_id,
+                agent_version_id=agent_version.id,
+                session_id=session_id,
+                message_count=2,
+                first_message_at=now,
+                last_message_at=completed_at,
+                tokens_used=tokens_used,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
             )
-            total_completion_tokens = completion_result.scalar()
+        )
+        turn = (("user", message), ("assistant", response_content))
+        if new_session:
+            session_cache.put(project_id, session_id, list(turn))
+        else:
+            session_cache.append(project_id, session_id, *turn)
+        total_tokens = totals["total_tokens"]
+        total_prompt_tokens = totals["total_prompt_tokens"]
+        total_completion_tokens = totals["total_completion_tokens"]
         
         return {
             "response": response_content,
@@ -180,13 +219,15 @@ class LangChainService:
             "total_prompt_tokens": total_prompt_tokens,
             "total_completion_tokens": total_completion_tokens,
             "model_name": agent_version.model_name,
-            "version_number": agent_version.version_number
+            "version_number": agent_version.version_number,
+            "history_turns_dropped": window.turns_dropped,
+            "cached": result["cached"]
         }
 
     @staticmethod
     async def stream_chat_response(
         db: AsyncSession,
-        agent_version: AgentVersion,
+        agent_version: ResolvedAgentVersion,
         message: str,
         project_id: UUID,
         session_id: Optional[UUID] = None,
@@ -196,76 +237,55 @@ class LangChainService:
         """Stream a chat response token-by-token using LangChain."""
 
         # Generate session ID if not provided
-        if session_id is None:
+        new_session = session_id is None
+        if new_session:
             session_id = uuid.uuid4()
 
-        # Decrypt the API key
-        api_key = decrypt_api_key(agent_version.api_key_encrypted)
-
-        # Configure LLM (streaming)
-        llm_config = {
-            "model": agent_version.model_name,
-            "api_key": api_key,
-            "temperature": float(agent_version.temperature),
-            "max_tokens": agent_version.max_tokens,
-            "streaming": True,
-            "stream_usage": True,
-        }
-
-        if agent_version.base_url:
-            llm_config["base_url"] = agent_version.base_url
-
-        llm_config["top_p"] = float(agent_version.top_p) if agent_version.top_p is not None else None
-        llm_config["frequency_penalty"] = float(agent_version.frequency_penalty or 0)
-        llm_config["presence_penalty"] = float(agent_version.presence_penalty or 0)
-        if agent_version.stop_sequences:
-            llm_config["stop"] = agent_version.stop_sequences
-
-        llm_config = {k: v for k, v in llm_config.items() if v is not None}
-
-        llm = ChatOpenAI(**llm_config)
+        llm = llm_clients.get_chat_model(agent_version, streaming=True)
 
-        # Get conversation history for this session
-        result = await db.execute(
-            select(ChatHistory)
-            .where(
-                ChatHistory.session_id == session_id,
-                ChatHistory.project_id == project_id
-            )
-            .order_by(ChatHistory.created_at)
-        )
-        history = result.scalars().all()
-
-        # Build messages list
+        # Build messages list from the windowed conversation history
         prompt_text = system_prompt or agent_version.system_prompt
-        messages = [SystemMessage(content=prompt_text)]
-
-        for msg in history:
-            if msg.role == "user":
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant":
-                messages.append(AIMessage(content=msg.content))
+        window = HistoryWindow()
+        if not new_session:
+            window = await load_history_window(db, project_id, session_id, agent_version, prompt_text, message)
+        messages = LangChainService.build_messages(prompt_text, window, message)
 
-        messages.append(HumanMessage(content=message))
-
-        # Save user message to history before streaming
+        # Save user message to history before streaming (not awaited with write-behind)
         now = datetime.utcnow()
-        user_chat = ChatHistory(
-            project_id=project_id,
-            agent_version_id=agent_version.id,
-            project_api_key_id=project_api_key_id,
-            session_id=session_id,
-            role="user",
-            content=message,
-            created_at=now
+        await chat_writer.persist(
+            db,
+            [{
+                "project_id": project_id,
+                "agent_version_id": agent_version.id,
+                "project_api_key_id": project_api_key_id,
+                "session_id": session_id,
+                "role": "user",
+                "content": message,
+                "created_at": now,
+            }],
+            session_delta(
+                project_id=project_id,
+                agent_version_id=agent_version.id,
+                session_id=session_id,
+                message_count=1,
+                first_message_at=now,
+                last_message_at=now,
+            ),
+            wait=False
         )
-        db.add(user_chat)
-        await db.commit()
+        if new_session:
+            session_cache.put(project_id, session_id, [("user", message)])
+        else:
+            session_cache.append(project_id, session_id, ("user", message))
+        # With write-behind the turn was only queued; the history read's
+        # transaction must not keep a connection for the whole stream
+        await release_connection(db)
 
         response_meta = {
             "session_id": session_id,
             "model_name": agent_version.model_name,
             "version_number": agent_version.version_number,
+            "history_turns_dropped": window.turns_dropped,
         }
 
         stats: Dict[str, Optional[int]] = {
@@ -278,76 +298,211 @@ class LangChainService:
         async def token_stream() -> AsyncGenerator[str, None]:
             response_content = ""
             try:
-                async for chunk in llm.astream(messages):
-                    token = getattr(chunk, "content", None)
-                    if token:
-                        response_content += token
-                        yield token
-
-                    usage = None
-                    if hasattr(chunk, "usage_metadata") and chunk.usage_metadata:
-                        usage = chunk.usage_metadata
-                    if not usage and hasattr(chunk, "response_metadata") and chunk.response_metadata:
-                        usage = chunk.response_metadata.get("token_usage") or chunk.response_metadata.get("usage")
-                    if usage:
-                        stats["prompt_tokens"] = usage.get("prompt_tokens") or usage.get("input_tokens")
-                        stats["completion_tokens"] = usage.get("completion_tokens") or usage.get("output_tokens")
-                        stats["tokens_used"] = usage.get("total_tokens") or usage.get("total")
-                        
-                        # Calculate tokens_used from prompt + completion if available
-                        if stats["prompt_tokens"] is not None and stats["completion_tokens"] is not None:
-                            calculated_tokens = stats["prompt_tokens"] + stats["completion_tokens"]
-                            # Use calculated value if total_tokens is not available or seems incorrect
-                            if stats["tokens_used"] is None or stats["tokens_used"] == 0 or stats["tokens_used"] != calculated_tokens:
-                                stats["tokens_used"] = calculated_tokens
+                # The provider slot (but no DB connection) is held for as long as the stream is open
+                async with provider_limits.acquire(agent_version, messages) as permit:
+                    async for chunk in llm.astream(messages):
+                        token = getattr(chunk, "content", None)
+                        if token:
+                            response_content += token
+                            yield token
+
+                        tokens_used, prompt_tokens, completion_tokens = _parse_usage(chunk)
+                        if tokens_used is not None or prompt_tokens is not None or completion_tokens is not None:
+                            stats["tokens_used"] = tokens_used
+                            stats["prompt_tokens"] = prompt_tokens
+                            stats["completion_tokens"] = completion_tokens
+                    permit.record_usage(stats["tokens_used"])
+            except ProviderOverloadedError:
+                raise
             except Exception as e:
-                await db.rollback()
                 raise Exception(f"LLM Error: {str(e)}")
 
-            # Save assistant response to history (no token usage for streaming)
-            assistant_chat = ChatHistory(
-                project_id=project_id,
-                agent_version_id=agent_version.id,
-                project_api_key_id=project_api_key_id,
-                session_id=session_id,
-                role="assistant",
-                content=response_content,
-                tokens_used=stats["tokens_used"],
-                prompt_tokens=stats["prompt_tokens"],
-                completion_tokens=stats["completion_tokens"],
-                created_at=datetime.utcnow()
+            # Persist on a session of its own: the request's session may already
+            # be closed once the response has started streaming
+            completed_at = datetime.utcnow()
+            totals = await chat_writer.persist(
+                None,
+                [{
+                    "project_id": project_id,
+                    "agent_version_id": agent_version.id,
+                    "project_api_key_id": project_api_key_id,
+                    "session_id": session_id,
+                    "role": "assistant",
+                    "content": response_content,
+                    "tokens_used": stats["tokens_used"],
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "created_at": completed_at,
+                }],
+                session_delta(
+                    project_id=project_id,
+                    agent_version_id=agent_version.id,
+                    session_id=session_id,
+                    message_count=1,
+                    first_message_at=completed_at,
+                    last_message_at=completed_at,
+                    tokens_used=stats["tokens_used"],
+                    prompt_tokens=stats["prompt_tokens"],
+                    completion_tokens=stats["completion_tokens"],
+                )
             )
-            db.add(assistant_chat)
-            await db.commit()
+            session_cache.append(project_id, session_id, ("assistant", response_content))
 
             if stats["tokens_used"] is not None:
-                # Total tokens
-                total_result = await db.execute(
-                    select(func.sum(ChatHistory.tokens_used)).where(
-                        ChatHistory.session_id == session_id,
-                        ChatHistory.project_id == project_id
-                    )
-                )
-                stats["total_tokens"] = total_result.scalar()
-                
-                # Total prompt tokens
-                prompt_result = await db.execute(
-                    select(func.sum(ChatHistory.prompt_tokens)).where(
-                        ChatHistory.session_id == session_id,
-                        ChatHistory.project_id == project_id,
-                        ChatHistory.prompt_tokens.isnot(None)
-                    )
-                )
-                stats["total_prompt_tokens"] = prompt_result.scalar()
-                
-                # Total completion tokens
-                completion_result = await db.execute(
-                    select(func.sum(ChatHistory.completion_tokens)).where(
-                        ChatHistory.session_id == session_id,
-                        ChatHistory.project_id == project_id,
-                        ChatHistory.completion_tokens.isnot(None)
-                    )
-                )
-                stats["total_completion_tokens"] = completion_result.scalar()
+                stats["total_tokens"] = totals["total_tokens"]
+                stats["total_prompt_tokens"] = totals["total_prompt_tokens"]
+                stats["total_completion_tokens"] = totals["total_completion_tokens"]
 
         return token_stream(), response_meta, stats
+
+    @staticmethod
+    async def get_batch_responses(
+        db: AsyncSession,
+        items: List[BatchChatItem],
+        project_id: UUID,
+        project_api_key_id: Optional[UUID] = None,
+        concurrency: int = 8
+    ) -> List[Union[dict, Exception]]:
+        """Process independent chat messages with bounded LLM concurrency.
+
+        History windows of all continued sessions are loaded up front in one
+        query on the shared session, which then returns its connection; only
+        the LLM calls fan out. Successful turns are persisted with one bulk
+        chat_history insert, one chat_sessions upsert and a single commit; if
+        that fails, each turn is retried on its own, so only the turns that
+        still cannot be saved come back as errors. Returns one response dict
+        or exception per item, in order. Session ids must be unique within a
+        batch.
+        """
+        history_requests = [
+            HistoryRequest(
+                session_id=item.session_id,
+                agent_version=item.agent_version,
+                system_prompt=item.system_prompt or item.agent_version.system_prompt,
+                message=item.message
+            )
+            for item in items if item.session_id is not None
+        ]
+        windows = dict(zip(
+            (r.session_id for r in history_requests),
+            await load_history_windows(db, project_id, history_requests)
+        ))
+        prepared = []
+        for item in items:
+            session_id = item.session_id or uuid.uuid4()
+            prompt_text = item.system_prompt or item.agent_version.system_prompt
+            window = windows.get(item.session_id) or HistoryWindow()
+            messages = LangChainService.build_messages(prompt_text, window, item.message)
+            prepared.append((item, session_id, prompt_text, window, messages, datetime.utcnow()))
+        await release_connection(db)
+
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def run(item: BatchChatItem, prompt_text: str, window: HistoryWindow, messages: List[BaseMessage]):
+            async with semaphore:
+                result = await LangChainService.complete(
+                    item.agent_version, prompt_text, window, item.message, messages
+                )
+            result["completed_at"] = datetime.utcnow()
+            return result
+
+        outcomes = await asyncio.gather(
+            *(run(item, prompt_text, window, messages) for item, _, prompt_text, window, messages, _ in prepared),
+            return_exceptions=True
+        )
+
+        # session_id -> (chat_history rows, chat_sessions row) of each answered item
+        turns: Dict[UUID, Tuple[List[dict], dict]] = {}
+        for (item, session_id, _, _, _, started_at), outcome in zip(prepared, outcomes):
+            if isinstance(outcome, BaseException):
+                continue
+            common = {
+                "project_id": project_id,
+                "agent_version_id": item.agent_version.id,
+                "project_api_key_id": project_api_key_id,
+                "session_id": session_id,
+            }
+            history_rows = [
+                {**common, "role": "user", "content": item.message, "created_at": started_at},
+                {
+                    **common,
+                    "role": "assistant",
+                    "content": outcome["response"],
+                    "tokens_used": outcome["tokens_used"],
+                    "prompt_tokens": outcome["prompt_tokens"],
+                    "completion_tokens": outcome["completion_tokens"],
+                    "created_at": outcome["completed_at"],
+                },
+            ]
+            turns[session_id] = (history_rows, {
+                "session_id": session_id,
+                "project_id": project_id,
+                "agent_version_id": item.agent_version.id,
+                "message_count": 2,
+                "total_tokens": outcome["tokens_used"],
+                "total_prompt_tokens": outcome["prompt_tokens"],
+                "total_completion_tokens": outcome["completion_tokens"],
+                "first_message_at": started_at,
+                "last_message_at": outcome["completed_at"],
+            })
+
+        totals: Dict[UUID, Dict[str, Optional[int]]] = {}
+        failed: Dict[UUID, Exception] = {}
+        try:
+            totals = await LangChainService._persist_turns(db, list(turns.values()))
+        except Exception:
+            # Retry one turn at a time so a single bad row only fails its own item
+            for session_id, turn in turns.items():
+                try:
+                    totals.update(await LangChainService._persist_turns(db, [turn]))
+                except Exception as e:
+                    failed[session_id] = Exception(f"Failed to save chat history: {str(e)}")
+
+        results: List[Union[dict, Exception]] = []
+        for (item, session_id, _, window, _, _), outcome in zip(prepared, outcomes):
+            if isinstance(outcome, BaseException):
+                results.append(outcome)
+                continue
+            if session_id in failed:
+                results.append(failed[session_id])
+                continue
+            turn = (("user", item.message), ("assistant", outcome["response"]))
+            if item.session_id is None:
+                session_cache.put(project_id, session_id, list(turn))
+            else:
+                session_cache.append(project_id, session_id, *turn)
+            session_totals = totals[session_id]
+            results.append({
+                "response": outcome["response"],
+                "session_id": session_id,
+                "tokens_used": outcome["tokens_used"],
+                "prompt_tokens": outcome["prompt_tokens"],
+                "completion_tokens": outcome["completion_tokens"],
+                "total_tokens": session_totals["total_tokens"],
+                "total_prompt_tokens": session_totals["total_prompt_tokens"],
+                "total_completion_tokens": session_totals["total_completion_tokens"],
+                "model_name": item.agent_version.model_name,
+                "version_number": item.agent_version.version_number,
+                "history_turns_dropped": window.turns_dropped,
+                "cached": outcome["cached"]
+            })
+        return results
+
+    @staticmethod
+    async def _persist_turns(
+        db: AsyncSession,
+        turns: List[Tuple[List[dict], dict]]
+    ) -> Dict[UUID, Dict[str, Optional[int]]]:
+        """Save (chat_history rows, chat_sessions row) pairs in one transaction."""
+        if not turns:
+            return {}
+        history_rows = [row for rows, _ in turns for row in rows]
+        try:
+            await db.execute(insert(ChatHistory), history_rows)
+            await record_usage(db, history_rows)
+            totals = await record_messages_bulk(db, [session_row for _, session_row in turns])
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return totals
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+import httpx
+from langchain_openai import ChatOpenAI
+from app.config import settings
+from app.utils.encryption import decrypt_api_key
+
+DEFAULT_PROVIDER = "default"
+
+
+def _fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives its request's budget slot back once closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], Awaitable[None]]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                await self._release()
+
+
+_TIMEOUT = httpx.Timeout(
+    settings.llm_request_timeout_seconds, connect=10.0, pool=settings.llm_pool_timeout_seconds
+)
+
+
+class _BudgetedTransport(httpx.AsyncBaseTransport):
+    """Transport of one provider pool.
+
+    Every request (until its response body is closed) holds a slot of the
+    registry-wide budget, so sockets in use across all pools never exceed
+    ``llm_max_total_connections``. Waiting for a slot is bounded by the
+    request's pool timeout and raises httpx.PoolTimeout, like a full httpx
+    pool would. Once retired, the sockets are closed as
+    soon as no request is in flight; a model still holding the pool's client
+    opens a fresh transport and it is closed again after that request.
+    """
+
+    def __init__(self, budget: asyncio.Semaphore, limits: httpx.Limits):
+        self._budget = budget
+        self._limits = limits
+        self._inner: Optional[httpx.AsyncHTTPTransport] = None
+        self.in_flight = 0
+        self.retired = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Never unbounded, even for a request sent without a pool timeout
+        pool_timeout = request.extensions.get("timeout", {}).get("pool") or settings.llm_pool_timeout_seconds
+        try:
+            await asyncio.wait_for(self._budget.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(
+                f"No LLM connection slot freed up within {pool_timeout}s", request=request
+            ) from None
+        self.in_flight += 1
+        try:
+            if self._inner is None:
+                self._inner = httpx.AsyncHTTPTransport(limits=self._limits)
+            response = await self._inner.handle_async_request(request)
+        except BaseException:
+            await self._release()
+            raise
+        response.stream = _ReleasingStream(response.stream, self._release)
+        return response
+
+    async def _release(self) -> None:
+        self.in_flight -= 1
+        self._budget.release()
+        if self.retired and self.in_flight == 0:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        inner, self._inner = self._inner, None
+        if inner is not None:
+            await inner.aclose()
+
+
+class LLMClientRegistry:
+    """Reusable ChatOpenAI instances backed by one keep-alive pool per provider.
+
+    Chat models are keyed on (base_url, key fingerprint, model, sampling params)
+    and evicted LRU or after sitting idle. Every model for the same base_url
+    shares a single httpx pool. Requests in flight across all pools share one
+    budget of ``llm_max_total_connections``; past ``max_pools`` the least
+    recently used pool without requests in flight is closed, never a busy one.
+    """
+
+    def __init__(self):
+        self._clients: "OrderedDict[Tuple, Tuple[ChatOpenAI, float]]" = OrderedDict()
+        self._pools: "OrderedDict[str, Tuple[httpx.AsyncClient, _BudgetedTransport, float]]" = OrderedDict()
+        self._budget = asyncio.Semaphore(settings.llm_max_total_connections)
+        self._closing: Set[asyncio.Task] = set()
+        self.created = 0
+        self.reused = 0
+
+    @property
+    def max_pools(self) -> int:
+        return max(settings.llm_max_total_connections // settings.llm_max_connections_per_provider, 1)
+
+    def get_chat_model(self, agent_version, streaming: bool = False) -> ChatOpenAI:
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        api_key = decrypt_api_key(agent_version.api_key_encrypted)
+        llm_config = {
+            "model": agent_version.model_name,
+            "temperature": float(agent_version.temperature),
+            "max_tokens": agent_version.max_tokens,
+            # Penalties and sampling params should be passed explicitly (avoid model_kwargs warnings)
+            "top_p": float(agent_version.top_p) if agent_version.top_p is not None else None,
+            "frequency_penalty": float(agent_version.frequency_penalty or 0),
+            "presence_penalty": float(agent_version.presence_penalty or 0),
+            "stop": list(agent_version.stop_sequences) if agent_version.stop_sequences else None,
+        }
+        base_url = agent_version.base_url or None
+        key = (
+            base_url,
+            _fingerprint(api_key),
+            streaming,
+            tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in llm_config.items()),
+        )
+
+        entry = self._clients.get(key)
+        if entry is not None:
+            self._clients[key] = (entry[0], now)
+            self._clients.move_to_end(key)
+            self._touch_pool(base_url, now)
+            self.reused += 1
+            return entry[0]
+
+        llm_config.update({
+            "api_key": api_key,
+            "base_url": base_url,
+            "streaming": streaming or None,
+            "stream_usage": True,  # Enable token usage tracking for both HTTP and streaming
+            "http_async_client": self._get_pool(base_url, now),
+            # Without it the OpenAI client sends every request with no timeouts at all
+            "timeout": _TIMEOUT,
+        })
+        # Remove None values to keep payload clean
+        llm = ChatOpenAI(**{k: v for k, v in llm_config.items() if v is not None})
+
+        self._clients[key] = (llm, now)
+        while len(self._clients) > settings.llm_client_cache_size:
+            self._clients.popitem(last=False)
+        self.created += 1
+        return llm
+
+    def _get_pool(self, base_url: Optional[str], now: float) -> httpx.AsyncClient:
+        provider = base_url or DEFAULT_PROVIDER
+        entry = self._pools.get(provider)
+        if entry is not None:
+            self._touch_pool(base_url, now)
+            return entry[0]
+
+        if len(self._pools) >= self.max_pools:
+            # Busy pools stay; if all are busy the budget still caps the sockets in use
+            idle = [p for p, (_, transport, _) in self._pools.items() if transport.in_flight == 0]
+            for victim in idle[:len(self._pools) - self.max_pools + 1]:
+                self._drop_pool(victim)
+
+        transport = _BudgetedTransport(
+            self._budget,
+            httpx.Limits(
+                max_connections=settings.llm_max_connections_per_provider,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            ),
+        )
+        pool = httpx.AsyncClient(
+            transport=transport,
+            timeout=_TIMEOUT,
+        )
+        self._pools[provider] = (pool, transport, now)
+        return pool
+
+    def _touch_pool(self, base_url: Optional[str], now: float) -> None:
+        provider = base_url or DEFAULT_PROVIDER
+        entry = self._pools.get(provider)
+        if entry is not None:
+            self._pools[provider] = (entry[0], entry[1], now)
+            self._pools.move_to_end(provider)
+
+    def _drop_pool(self, provider: str) -> None:
+        _, transport, _ = self._pools.pop(provider)
+        base_url = None if provider == DEFAULT_PROVIDER else provider
+        for key in [k for k in self._clients if k[0] == base_url]:
+            del self._clients[key]
+        transport.retired = True
+        if transport.in_flight == 0:
+            # Nothing is using its sockets; close them now rather than on a timer
+            task = asyncio.get_running_loop().create_task(transport.aclose())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def _evict_idle(self, now: float) -> None:
+        cutoff = now - settings.llm_client_idle_seconds
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if last_used > cutoff:
+                break
+            del self._clients[key]
+        for provider, (_, transport, last_used) in list(self._pools.items()):
+            if last_used > cutoff:
+                break
+            if transport.in_flight == 0:
+                self._drop_pool(provider)
+
+    async def aclose(self) -> None:
+        pools = [pool for pool, _, _ in self._pools.values()]
+        self._pools.clear()
+        self._clients.clear()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        for pool in pools:
+            await pool.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._clients),
+            "pools": len(self._pools),
+            "max_pools": self.max_pools,
+            "in_flight": sum(transport.in_flight for _, transport, _ in self._pools.values()),
+            "max_total_connections": settings.llm_max_total_connections,
+            "created": self.created,
+            "reused": self.reused,
+        }
+
+
+llm_clients = LLMClientRegistry()
@@ -0,0 +1,259 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional
+from langchain_core.messages import BaseMessage
+from app.config import settings
+from app.services.llm_clients import DEFAULT_PROVIDER
+from app.utils.token_counter import count_message_tokens
+
+# Limiters kept for distinct providers (idle ones are dropped beyond this)
+_MAX_PROVIDERS = 1000
+
+
+class ProviderOverloadedError(Exception):
+    """Raised when a call could not get a provider slot within the max queue wait."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"LLM provider is overloaded, retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def provider_key(agent_version) -> str:
+    """Limits are shared per model profile, else per base_url."""
+    if agent_version.model_profile_id is not None:
+        return f"profile:{agent_version.model_profile_id}"
+    return agent_version.base_url or DEFAULT_PROVIDER
+
+
+def _is_overload(error: BaseException) -> bool:
+    # openai.APIStatusError carries status_code; timeouts and dropped connections count too
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutException")
+
+
+class _Permit:
+    def __init__(self, reserved_tokens: int):
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None
+
+    def record_usage(self, tokens_used: Optional[int]) -> None:
+        self.used_tokens = tokens_used
+
+
+class ProviderLimiter:
+    """AIMD concurrency limit plus a tokens-per-minute bucket for one provider.
+
+    The in-flight limit grows by ~1 per window of successful calls and is
+    halved (at most once per ``backoff_cooldown``) on 429/5xx/timeouts. Calls
+    over the limit wait FIFO for up to ``max_wait`` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int,
+        min_in_flight: int,
+        tokens_per_minute: int,
+        max_wait: float,
+        backoff_factor: float,
+        backoff_cooldown: float = 1.0,
+    ):
+        self.name = name
+        self.max_in_flight = max(max_in_flight, 1)
+        self.min_in_flight = min(max(min_in_flight, 1), self.max_in_flight)
+        self.limit = float(self.max_in_flight)
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self.backoff_factor = backoff_factor
+        self.backoff_cooldown = backoff_cooldown
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._tokens = float(tokens_per_minute)
+        self._tokens_updated = time.monotonic()
+        self._last_backoff = 0.0
+        self.acquired = 0
+        self.queued = 0
+        self.rejected = 0
+        self.backoffs = 0
+        self.max_queue_depth = 0
+        self.peak_in_flight = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self._waiters
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + (now - self._tokens_updated) * self.tokens_per_minute / 60,
+        )
+        self._tokens_updated = now
+
+    async def _take_tokens(self, tokens: int, deadline: float) -> None:
+        while True:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+            wait = (tokens - self._tokens) * 60 / self.tokens_per_minute
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                self.rejected += 1
+                raise ProviderOverloadedError(self.name, wait)
+            await asyncio.sleep(wait)
+
+    async def _take_slot(self, deadline: float) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout=max(deadline - time.monotonic(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release_slot()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise ProviderOverloadedError(self.name, self.max_wait) from None
+            raise
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                waiter.set_result(None)
+
+    def _on_success(self) -> None:
+        self.limit = min(self.limit + 1 / self.limit, float(self.max_in_flight))
+        self._wake()
+
+    def _on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self._last_backoff < self.backoff_cooldown:
+            return
+        self._last_backoff = now
+        self.limit = max(self.limit * self.backoff_factor, float(self.min_in_flight))
+        self.backoffs += 1
+
+    @asynccontextmanager
+    async def acquire(self, tokens: int = 0) -> AsyncIterator[_Permit]:
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        if self.tokens_per_minute > 0:
+            tokens = min(tokens, self.tokens_per_minute)
+            await self._take_tokens(tokens, deadline)
+        else:
+            tokens = 0
+        try:
+            await self._take_slot(deadline)
+        except BaseException:
+            self._tokens += tokens
+            raise
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        permit = _Permit(tokens)
+        try:
+            yield permit
+        except BaseException as e:
+            if _is_overload(e):
+                self._on_overload()
+            raise
+        else:
+            self._on_success()
+        finally:
+            if tokens and permit.used_tokens is not None:
+                # Refund (or charge) the difference between the estimate and actual usage
+                self._tokens += tokens - permit.used_tokens
+            self._release_slot()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "limit": round(self.limit, 2),
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "acquired": self.acquired,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "backoffs": self.backoffs,
+            "wait_avg_ms": round(self.wait_seconds / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "wait_max_ms": round(self.max_wait_seconds * 1000, 2),
+            "tokens_available": round(self._tokens) if self.tokens_per_minute > 0 else None,
+        }
+
+
+class ProviderLimits:
+    """One ProviderLimiter per provider, configured from settings.
+
+    ``llm_provider_limits`` overrides the defaults per provider key (a base_url
+    or ``profile:<model profile id>``).
+    """
+
+    def __init__(self):
+        self._limiters: "OrderedDict[str, ProviderLimiter]" = OrderedDict()
+
+    def _get(self, name: str) -> ProviderLimiter:
+        limiter = self._limiters.get(name)
+        if limiter is not None:
+            self._limiters.move_to_end(name)
+            return limiter
+
+        overrides = settings.llm_provider_limits.get(name, {})
+        limiter = ProviderLimiter(
+            name,
+            max_in_flight=int(overrides.get("max_in_flight", settings.llm_provider_max_in_flight)),
+            min_in_flight=int(overrides.get("min_in_flight", settings.llm_provider_min_in_flight)),
+            tokens_per_minute=int(overrides.get("tokens_per_minute", settings.llm_provider_tokens_per_minute)),
+            max_wait=float(overrides.get("max_queue_seconds", settings.llm_provider_max_queue_seconds)),
+            backoff_factor=settings.llm_provider_backoff_factor,
+        )
+        self._limiters[name] = limiter
+        if len(self._limiters) > _MAX_PROVIDERS:
+            for stale in [k for k, v in self._limiters.items() if v.idle][: len(self._limiters) - _MAX_PROVIDERS]:
+                del self._limiters[stale]
+        return limiter
+
+    def acquire(self, agent_version, messages: List[BaseMessage]):
+        limiter = self._get(provider_key(agent_version))
+        tokens = 0
+        if limiter.tokens_per_minute > 0:
+            # Reserve prompt + max completion; the surplus is refunded from actual usage
+            tokens = sum(count_message_tokens(str(m.content), agent_version.model_name) for m in messages)
+            tokens += agent_version.max_tokens or 0
+        return limiter.acquire(tokens)
+
+    def in_flight(self) -> int:
+        """LLM calls currently running across all providers."""
+        return sum(limiter.in_flight for limiter in self._limiters.values())
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+provider_limits = ProviderLimits()
@@ -0,0 +1,251 @@
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from app.config import settings
+from app.database import async_session
+from app.models import ApiKeyUsageDaily, Project, ProjectAPIKey
+from app.services.background import PeriodicWorker
+
+# Buckets untouched for this long (and therefore full) are forgotten
+_BUCKET_IDLE_SECONDS = 300
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def configure(self, rate: float, capacity: float) -> None:
+        # Limits changed through the API apply on the next request
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """Take ``cost`` requests; return 0 on success, else seconds until they are available.
+
+        A cost above the burst capacity is admitted from a full bucket and
+        leaves it in debt, so it is paid for by the requests that follow.
+        """
+        # A bucket created during this check is stamped after ``now``
+        elapsed = max(now - self.updated, 0.0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def refund(self, cost: float = 1.0) -> None:
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+@dataclass
+class _Pending:
+    project_id: UUID
+    requests: int = 0
+    tokens: int = 0
+
+
+def _today() -> date:
+    return datetime.utcnow().date()
+
+
+def _seconds_until_tomorrow() -> float:
+    now = datetime.utcnow()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds()
+
+
+class RateLimiter(PeriodicWorker):
+    """Per-key and per-project request rate limits and daily token quotas.
+
+    Requests are admitted from in-memory token buckets and daily counters, so
+    the chat hot path never waits on the database. Every interval the local
+    deltas are added to api_key_usage_daily and the day's totals (including
+    other workers' usage) are read back; a quota can therefore be overshot by
+    at most one interval's worth of traffic, and it survives restarts.
+    """
+
+    name = "rate-limit-reconciler"
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self._buckets: Dict[Tuple[str, UUID], _Bucket] = {}
+        self._pending: Dict[Tuple[UUID, date], _Pending] = {}
+        self._project_pending: Dict[Tuple[UUID, date], int] = {}
+        # Day totals as of the last reconcile: id -> (day, tokens)
+        self._key_totals: Dict[UUID, Tuple[date, int]] = {}
+        self._project_totals: Dict[UUID, Tuple[date, int]] = {}
+        self.rejected_rate = 0
+        self.rejected_quota = 0
+        self.reconciles = 0
+
+    @staticmethod
+    def _rps(value: Optional[float], default: Optional[float]) -> Optional[float]:
+        rps = value if value is not None else default
+        if not rps or rps <= 0:
+            return None
+        return rps / max(settings.rate_limit_worker_count, 1)
+
+    def _take(self, kind: str, owner_id: UUID, rps: Optional[float], now: float, cost: int) -> float:
+        if rps is None:
+            return 0.0
+        capacity = max(rps * settings.rate_limit_burst_seconds, 1.0)
+        bucket = self._buckets.get((kind, owner_id))
+        if bucket is None:
+            bucket = self._buckets[(kind, owner_id)] = _Bucket(rps, capacity)
+        elif bucket.rate != rps or bucket.capacity != capacity:
+            bucket.configure(rps, capacity)
+        return bucket.take(now, cost)
+
+    @staticmethod
+    def _quota(value: Optional[int], default: Optional[int]) -> Optional[int]:
+        return value if value is not None else default
+
+    def _used_today(self, totals: Dict[UUID, Tuple[date, int]], owner_id: UUID, pending: int, today: date) -> int:
+        day, tokens = totals.setdefault(owner_id, (today, 0))
+        return (tokens if day == today else 0) + pending
+
+    def check(self, project: Project, api_key: ProjectAPIKey, cost: int = 1) -> None:
+        """Admit ``cost`` requests (e.g. the items of a batch) or raise RateLimitExceeded."""
+        today = _today()
+        pending = self._pending.get((api_key.id, today))
+        key_quota = self._quota(api_key.daily_token_quota, settings.api_key_default_daily_tokens)
+        key_used = self._used_today(self._key_totals, api_key.id, pending.tokens if pending else 0, today)
+        project_quota = self._quota(project.daily_token_quota, settings.project_default_daily_tokens)
+        project_used = self._used_today(
+            self._project_totals, project.id, self._project_pending.get((project.id, today), 0), today
+        )
+        if key_quota is not None and key_used >= key_quota:
+            self.rejected_quota += 1
+            raise RateLimitExceeded("Daily token quota exceeded for this API key", _seconds_until_tomorrow())
+        if project_quota is not None and project_used >= project_quota:
+            self.rejected_quota += 1
+            raise RateLimitExceeded("Daily token quota exceeded for this project", _seconds_until_tomorrow())
+
+        now = time.monotonic()
+        wait = self._take("key", api_key.id, self._rps(api_key.rate_limit_rps, settings.api_key_default_rps), now, cost)
+        if wait:
+            self.rejected_rate += 1
+            raise RateLimitExceeded("Rate limit exceeded for this API key", wait)
+        wait = self._take("project", project.id, self._rps(project.rate_limit_rps, settings.project_default_rps), now, cost)
+        if wait:
+            bucket = self._buckets.get(("key", api_key.id))
+            if bucket is not None:
+                bucket.refund(cost)
+            self.rejected_rate += 1
+            raise RateLimitExceeded("Rate limit exceeded for this project", wait)
+
+        if pending is None:
+            pending = self._pending[(api_key.id, today)] = _Pending(project_id=project.id)
+        pending.requests += cost
+
+    def record_tokens(self, project_id: UUID, api_key_id: UUID, tokens: Optional[int]) -> None:
+        """Count tokens a key spent against its (and its project's) daily quota."""
+        if not tokens:
+            return
+        today = _today()
+        pending = self._pending.get((api_key_id, today))
+        if pending is None:
+            pending = self._pending[(api_key_id, today)] = _Pending(project_id=project_id)
+        pending.tokens += tokens
+        self._project_pending[(project_id, today)] = self._project_pending.get((project_id, today), 0) + tokens
+
+    async def run_once(self) -> None:
+        today = _today()
+        batch, self._pending = self._pending, {}
+        project_batch, self._project_pending = self._project_pending, {}
+        if not batch and not self._project_totals:
+            return
+        try:
+            async with async_session() as db:
+                if batch:
+                    stmt = insert(ApiKeyUsageDaily).values([
+                        {
+                            "api_key_id": key_id,
+                            "day": day,
+                            "project_id": pending.project_id,
+                            "request_count": pending.requests,
+                            "tokens_used": pending.tokens,
+                        }
+                        for (key_id, day), pending in batch.items()
+                    ])
+                    await db.execute(stmt.on_conflict_do_update(
+                        index_elements=[ApiKeyUsageDaily.api_key_id, ApiKeyUsageDaily.day],
+                        set_={
+                            "request_count": ApiKeyUsageDaily.request_count + stmt.excluded.request_count,
+                            "tokens_used": ApiKeyUsageDaily.tokens_used + stmt.excluded.tokens_used,
+                        },
+                    ))
+                rows = []
+                if self._project_totals:
+                    result = await db.execute(
+                        select(ApiKeyUsageDaily.api_key_id, ApiKeyUsageDaily.project_id, ApiKeyUsageDaily.tokens_used)
+                        .where(
+                            ApiKeyUsageDaily.day == today,
+                            ApiKeyUsageDaily.project_id.in_(list(self._project_totals)),
+                        )
+                    )
+                    rows = result.all()
+                await db.commit()
+        except Exception:
+            # Keep the deltas for the next attempt
+            for key, pending in batch.items():
+                current = self._pending.setdefault(key, _Pending(project_id=pending.project_id))
+                current.requests += pending.requests
+                current.tokens += pending.tokens
+            for key, tokens in project_batch.items():
+                self._project_pending[key] = self._project_pending.get(key, 0) + tokens
+            raise
+
+        key_totals = {row.api_key_id: row.tokens_used for row in rows}
+        project_totals: Dict[UUID, int] = {}
+        for row in rows:
+            project_totals[row.project_id] = project_totals.get(row.project_id, 0) + row.tokens_used
+        self._key_totals = {key_id: (today, key_totals.get(key_id, 0)) for key_id in self._key_totals}
+        self._project_totals = {
+            project_id: (today, project_totals.get(project_id, 0)) for project_id in self._project_totals
+        }
+        self._prune()
+        self.reconciles += 1
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, b in self._buckets.items() if now - b.updated > _BUCKET_IDLE_SECONDS]:
+            del self._buckets[key]
+        # Totals are re-registered by the next check(), so idle keys and projects can go
+        if len(self._key_totals) > settings.auth_cache_size:
+            self._key_totals = {k: v for k, v in self._key_totals.items() if ("key", k) in self._buckets or v[1]}
+        if len(self._project_totals) > settings.auth_cache_size:
+            self._project_totals = {
+                k: v for k, v in self._project_totals.items() if ("project", k) in self._buckets or v[1]
+            }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buckets": len(self._buckets),
+            "tracked_keys": len(self._key_totals),
+            "tracked_projects": len(self._project_totals),
+            "pending_keys": len(self._pending),
+            "rejected_rate": self.rejected_rate,
+            "rejected_quota": self.rejected_quota,
+            "reconciles": self.reconciles,
+        }
+
+
+rate_limits = RateLimiter(interval=settings.rate_limit_reconcile_seconds)
@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+from uuid import UUID
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from app.config import settings
+from app.database import async_session
+from app.models import LLMResponseCacheEntry
+from app.services.agent_cache import ResolvedAgentVersion
+from app.services.background import PeriodicWorker
+from app.services.session_cache import HistoryMessage
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Cached values are LangChainService.invoke() results:
+# {"response", "tokens_used", "prompt_tokens", "completion_tokens"}
+CachedResponse = Dict[str, Optional[object]]
+
+
+def response_cache_scope(
+    agent_version_id: UUID,
+    prompt_text: str,
+    history: Sequence[HistoryMessage],
+) -> str:
+    """sha256 over (version id, rendered system prompt, history digest)."""
+    history_digest = hashlib.sha256()
+    for role, content in history:
+        history_digest.update(role.encode())
+        history_digest.update(b"\x00")
+        history_digest.update(content.encode())
+        history_digest.update(b"\x01")
+    scope = hashlib.sha256()
+    for part in (str(agent_version_id), prompt_text, history_digest.hexdigest()):
+        scope.update(part.encode())
+        scope.update(b"\x00")
+    return scope.hexdigest()
+
+
+def response_cache_key(scope: str, message: str) -> str:
+    """Exact-match key of a message within a scope."""
+    return hashlib.sha256(f"{scope}\x00{message}".encode()).hexdigest()
+
+
+class MemoryResponseCacheBackend:
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, agent_version_id: UUID, value: CachedResponse) -> None:
+        self._cache.set(key, value)
+
+    async def purge(self) -> None:
+        # TTLCache expires and evicts on its own
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "maxsize": self._cache.maxsize}
+
+
+class PostgresResponseCacheBackend:
+    """Shared between API processes; expired and surplus rows are purged periodically."""
+
+    name = "postgres"
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.purged = 0
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        async with async_session() as db:
+            result = await db.execute(
+                select(
+                    LLMResponseCacheEntry.response,
+                    LLMResponseCacheEntry.tokens_used,
+                    LLMResponseCacheEntry.prompt_tokens,
+                    LLMResponseCacheEntry.completion_tokens,
+                ).where(
+                    LLMResponseCacheEntry.cache_key == key,
+                    LLMResponseCacheEntry.expires_at > func.now(),
+                )
+            )
+            row = result.first()
+        return dict(row._mapping) if row is not None else None
+
+    async def set(self, key: str, agent_version_id: UUID, value: CachedResponse) -> None:
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        stmt = insert(LLMResponseCacheEntry).values(
+            cache_key=key,
+            agent_version_id=agent_version_id,
+            response=value["response"],
+            tokens_used=value["tokens_used"],
+            prompt_tokens=value["prompt_tokens"],
+            completion_tokens=value["completion_tokens"],
+            created_at=datetime.utcnow(),
+            expires_at=expires_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LLMResponseCacheEntry.cache_key],
+            set_={
+                "response": stmt.excluded.response,
+                "tokens_used": stmt.excluded.tokens_used,
+                "prompt_tokens": stmt.excluded.prompt_tokens,
+                "completion_tokens": stmt.excluded.completion_tokens,
+                "created_at": stmt.excluded.created_at,
+                "expires_at": stmt.excluded.expires_at,
+            },
+        )
+        async with async_session() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def purge(self) -> None:
+        async with async_session() as db:
+            expired = await db.execute(
+                delete(LLMResponseCacheEntry).where(LLMResponseCacheEntry.expires_at <= func.now())
+            )
+            # Keep only the newest ``maxsize`` entries
+            surplus = (
+                select(LLMResponseCacheEntry.cache_key)
+                .order_by(LLMResponseCacheEntry.created_at.desc())
+                .offset(self.maxsize)
+            )
+            trimmed = await db.execute(
+                delete(LLMResponseCacheEntry).where(LLMResponseCacheEntry.cache_key.in_(surplus.scalar_subquery()))
+            )
+            await db.commit()
+        self.purged += expired.rowcount + trimmed.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        return {"maxsize": self.maxsize, "purged": self.purged}
+
+
+class ResponseCache(PeriodicWorker):
+    """Exact-match cache of LLM answers for deterministic (temperature 0) versions.
+
+    Identical concurrent misses share one in-flight LLM call. The periodic
+    loop only purges backends that need it (Postgres).
+    """
+
+    name = "response-cache-purge"
+
+    def __init__(self, backend, interval: float):
+        super().__init__(interval)
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def cacheable(agent_version: ResolvedAgentVersion) -> bool:
+        return agent_version.response_cache_enabled and agent_version.temperature == 0
+
+    async def run_once(self) -> None:
+        await self.backend.purge()
+
+    async def get_or_compute(
+        self,
+        key: str,
+        agent_version_id: UUID,
+        compute: Callable[[], Awaitable[CachedResponse]],
+    ) -> Tuple[CachedResponse, bool]:
+        """Return (value, served_from_cache)."""
+        try:
+            value = await self.backend.get(key)
+        except Exception:
+            # A cache outage must not fail chat requests
+            logger.exception("Response cache lookup failed")
+            self.errors += 1
+            value = None
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        self.misses += 1
+        task = asyncio.get_running_loop().create_task(self._fill(key, agent_version_id, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a disconnecting leader does not cancel the call its followers wait on
+        return await asyncio.shield(task), False
+
+    async def _fill(
+        self,
+        key: str,
+        agent_version_id: UUID,
+        compute: Callable[[], Awaitable[CachedResponse]],
+    ) -> CachedResponse:
+        value = await compute()
+        try:
+            await self.backend.set(key, agent_version_id, value)
+        except Exception:
+            logger.exception("Response cache store failed")
+            self.errors += 1
+        return value
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "in_flight": len(self._inflight),
+            **self.backend.stats(),
+        }
+
+
+def _make_backend():
+    if settings.response_cache_backend == "postgres":
+        return PostgresResponseCacheBackend(settings.response_cache_size, settings.response_cache_ttl_seconds)
+    if settings.response_cache_backend != "memory":
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {settings.response_cache_backend}")
+    return MemoryResponseCacheBackend(settings.response_cache_size, settings.response_cache_ttl_seconds)
+
+
+response_cache = ResponseCache(_make_backend(), interval=settings.response_cache_purge_seconds)
@@ -0,0 +1,62 @@
+import logging
+from typing import Dict
+from sqlalchemy import text
+from app.config import settings
+from app.database import async_session
+from app.services.background import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+# Serialises flushes across API processes (pg_try_advisory_xact_lock key)
+_LOCK_KEY = 0x73726368  # "srch"
+
+# GIN indexes of every chat_history partition (content_tsv and trigram)
+_PARTITION_GIN_INDEXES = text("""
+    SELECT i.indexrelid
+    FROM pg_inherits h
+    JOIN pg_index i ON i.indrelid = h.inhrelid
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am a ON a.oid = c.relam
+    WHERE h.inhparent = 'chat_history'::regclass AND a.amname = 'gin'
+""")
+
+
+class SearchIndexMaintenance(PeriodicWorker):
+    """Moves new chat_history rows from the GIN pending lists into the
+    search indexes, off the insert path.
+
+    The search indexes use fastupdate, so an insert only appends to the
+    index's pending list. Whichever insert overflows gin_pending_list_limit
+    would otherwise merge the whole list itself; flushing it here every few
+    seconds keeps that cost (and long pending lists slowing searches) away
+    from chat requests. Needs the app's role to own chat_history, as it does
+    when it ran init.sql; autovacuum still flushes the lists otherwise.
+    """
+
+    name = "chat-search-index"
+    run_on_stop = False
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self.pages_flushed = 0
+
+    async def run_once(self) -> None:
+        async with async_session() as db:
+            locked = (await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}
+            )).scalar()
+            if not locked:
+                return
+            indexes = (await db.execute(_PARTITION_GIN_INDEXES)).scalars().all()
+            for index in indexes:
+                flushed = (await db.execute(
+                    text("SELECT gin_clean_pending_list(CAST(:index AS regclass))"), {"index": index}
+                )).scalar()
+                self.pages_flushed += flushed or 0
+            await db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pages_flushed": self.pages_flushed}
+
+
+search_index = SearchIndexMaintenance(interval=settings.chat_search_flush_seconds)
@@ -0,0 +1,176 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+from app.config import settings
+
+HistoryMessage = Tuple[str, str]  # (role, content)
+SessionKey = Tuple[UUID, UUID]  # (project_id, session_id)
+
+# Approximate per-message bookkeeping overhead (tuple + two str headers)
+_MESSAGE_OVERHEAD = 120
+
+
+def _message_size(message: HistoryMessage) -> int:
+    return len(message[1]) + _MESSAGE_OVERHEAD
+
+
+@dataclass
+class CachedSession:
+    messages: List[HistoryMessage] = field(default_factory=list)  # oldest first
+    # Number of older messages that exist in the database but are not cached
+    omitted: int = 0
+    size: int = 0
+    expires_at: float = 0.0
+
+    @property
+    def message_count(self) -> int:
+        return self.omitted + len(self.messages)
+
+
+class SessionHistoryCache:
+    """LRU/TTL cache of recent sessions' messages as compact (role, content) tuples.
+
+    Bounded by a total memory budget (approximate bytes) and a per-session
+    message cap; the oldest messages of an oversized session are dropped and
+    counted in ``omitted``. Entries are appended to as turns are persisted, so
+    an interactive session never re-reads chat_history while it stays warm.
+    Turns persisted by another API process are caught by ``validate``, which
+    compares an entry with the session's message count read on each turn.
+    Invalidations (deleted history) are passed to ``publish`` (set by the
+    cache invalidation bus) so other API processes drop their copy of the
+    session (or project); session_id None means the whole project.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, max_messages_per_session: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_messages_per_session = max_messages_per_session
+        self._entries: "OrderedDict[SessionKey, CachedSession]" = OrderedDict()
+        self._bytes = 0
+        self.publish: Optional[Callable[[UUID, Optional[UUID]], None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, project_id: UUID, session_id: UUID) -> Optional[CachedSession]:
+        key = (project_id, session_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        project_id: UUID,
+        session_id: UUID,
+        messages: List[HistoryMessage],
+        omitted: int = 0,
+    ) -> None:
+        if not self.enabled:
+            return
+        key = (project_id, session_id)
+        self._remove(key)
+        entry = CachedSession(messages=list(messages), omitted=omitted)
+        entry.size = sum(_message_size(m) for m in entry.messages)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._trim(entry)
+        self._touch(entry)
+        self._evict()
+
+    def append(self, project_id: UUID, session_id: UUID, *messages: HistoryMessage) -> None:
+        """Append persisted messages to a cached session (no-op when not cached)."""
+        entry = self._entries.get((project_id, session_id))
+        if entry is None:
+            return
+        for message in messages:
+            entry.messages.append(message)
+            entry.size += _message_size(message)
+            self._bytes += _message_size(message)
+        self._trim(entry)
+        self._touch(entry)
+        self._entries.move_to_end((project_id, session_id))
+        self._evict()
+
+    def validate(self, project_id: UUID, session_id: UUID, message_count: Optional[int]) -> None:
+        """Drop a cached session that no longer ends where the stored history does.
+
+        ``message_count`` is the session's chat_sessions.message_count; it
+        differs from the entry's when another process persisted turns since.
+        """
+        key = (project_id, session_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry.message_count != (message_count or 0):
+            self._remove(key)
+            self.stale += 1
+
+    def invalidate(self, project_id: UUID, session_id: UUID, broadcast: bool = True) -> None:
+        self._remove((project_id, session_id))
+        if broadcast and self.enabled and self.publish is not None:
+            self.publish(project_id, session_id)
+
+    def invalidate_project(self, project_id: UUID, broadcast: bool = True) -> None:
+        for key in [k for k in self._entries if k[0] == project_id]:
+            self._remove(key)
+        if broadcast and self.enabled and self.publish is not None:
+            self.publish(project_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _touch(self, entry: CachedSession) -> None:
+        entry.expires_at = time.monotonic() + self.ttl
+
+    def _trim(self, entry: CachedSession) -> None:
+        overflow = len(entry.messages) - self.max_messages_per_session
+        if overflow > 0:
+            dropped = entry.messages[:overflow]
+            del entry.messages[:overflow]
+            freed = sum(_message_size(m) for m in dropped)
+            entry.size -= freed
+            self._bytes -= freed
+            entry.omitted += overflow
+
+    def _remove(self, key: SessionKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+        }
+
+
+session_cache = SessionHistoryCache(
+    max_bytes=settings.session_cache_max_bytes,
+    ttl=settings.session_cache_ttl_seconds,
+    max_messages_per_session=settings.session_cache_max_messages,
+)
@@ -0,0 +1,69 @@
+import time
+from typing import Dict, Optional
+from app.config import settings
+from app.services.response_cache import CachedResponse
+from app.utils.simhash import SimHashIndex, max_distance_for, np, simhash
+
+
+class SimilarityCache:
+    """Near-duplicate tier in front of the LLM call.
+
+    Serves a cached answer when a message's SimHash is within the configured
+    similarity threshold of a prior message in the same scope (agent version,
+    rendered prompt and history, see ``response_cache_scope``). Per process
+    and in memory only; requires NumPy.
+    """
+
+    def __init__(self, enabled: bool, threshold: float, maxsize: int, ttl: int):
+        self.enabled = enabled and np is not None
+        self.threshold = threshold
+        self.index = SimHashIndex(max_distance_for(threshold), maxsize, ttl)
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.lookup_max_seconds = 0.0
+
+    @staticmethod
+    def _scope_id(scope: str) -> int:
+        return int(scope[:16], 16)
+
+    def get(self, scope: str, message: str) -> Optional[CachedResponse]:
+        started = time.perf_counter()
+        fingerprint = simhash(message)
+        found = self.index.get(self._scope_id(scope), fingerprint) if fingerprint is not None else None
+        elapsed = time.perf_counter() - started
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+        self.lookup_max_seconds = max(self.lookup_max_seconds, elapsed)
+        if found is None:
+            return None
+        self.hits += 1
+        return found[0]
+
+    def put(self, scope: str, message: str, value: CachedResponse) -> None:
+        fingerprint = simhash(message)
+        if fingerprint is not None:
+            self.index.put(self._scope_id(scope), fingerprint, value)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "max_distance": self.index.max_distance,
+            "size": len(self.index),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "lookup_avg_us": round(self.lookup_seconds / self.lookups * 1e6, 1) if self.lookups else 0.0,
+            "lookup_max_us": round(self.lookup_max_seconds * 1e6, 1),
+            "candidates_avg": round(self.index.candidates_scanned / self.lookups, 1) if self.lookups else 0.0,
+            "evictions": self.index.evictions,
+        }
+
+
+similarity_cache = SimilarityCache(
+    enabled=settings.similarity_cache_enabled,
+    threshold=settings.similarity_cache_threshold,
+    maxsize=settings.similarity_cache_size,
+    ttl=settings.similarity_cache_ttl_seconds,
+)
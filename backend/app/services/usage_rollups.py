@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import BigInteger, DateTime, String, column, delete, select, text, values
+from sqlalchemy.dialects.postgresql import UUID as PGUUID, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import async_session
+from app.models import AgentVersion, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day")
+COUNTERS = ("message_count", "request_count", "prompt_tokens", "completion_tokens", "total_tokens")
+# Stands in for "no API key" (dashboard chats) so it can be part of the primary key
+NIL_API_KEY = UUID(int=0)
+
+_REBUILD_HOURS = """
+    INSERT INTO usage_rollups (
+        granularity, bucket_start, agent_version_id, api_key_id, project_id, agent_id,
+        message_count, request_count, prompt_tokens, completion_tokens, total_tokens
+    )
+    SELECT 'hour',
+           date_trunc('hour', h.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           h.agent_version_id,
+           COALESCE(h.project_api_key_id, :nil_key),
+           h.project_id,
+           v.agent_id,
+           count(*),
+           count(*) FILTER (WHERE h.role = 'assistant'),
+           COALESCE(sum(h.prompt_tokens), 0),
+           COALESCE(sum(h.completion_tokens), 0),
+           COALESCE(sum(h.tokens_used), 0)
+    FROM chat_history h
+    JOIN agent_versions v ON v.id = h.agent_version_id
+    WHERE h.created_at >= :lower AND h.created_at < :upper {history_filter}
+    GROUP BY 2, 3, 4, 5, 6
+"""
+
+# Days are summed from the day's hour buckets instead of scanning chat_history again
+_REBUILD_DAY = """
+    INSERT INTO usage_rollups (
+        granularity, bucket_start, agent_version_id, api_key_id, project_id, agent_id,
+        message_count, request_count, prompt_tokens, completion_tokens, total_tokens
+    )
+    SELECT 'day', CAST(:lower AS TIMESTAMPTZ), agent_version_id, api_key_id, project_id, agent_id,
+           sum(message_count), sum(request_count),
+           sum(prompt_tokens), sum(completion_tokens), sum(total_tokens)
+    FROM usage_rollups
+    WHERE granularity = 'hour' AND bucket_start >= :lower AND bucket_start < :upper {project_filter}
+    GROUP BY agent_version_id, api_key_id, project_id, agent_id
+"""
+
+_KEY = ("granularity", "bucket_start", "agent_version_id", "api_key_id")
+_DELTA_COLUMNS = (*_KEY, "project_id", *COUNTERS)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour or day containing ``moment`` (naive means UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    else:
+        moment = moment.astimezone(timezone.utc)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def usage_deltas(rows: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    """Fold chat_history rows into one increment per rollup row.
+
+    Sorted by primary key so concurrent writers lock rollup rows in the same
+    order (and never deadlock on each other).
+    """
+    deltas: Dict[Tuple, Dict[str, object]] = {}
+    for row in rows:
+        api_key_id = row.get("project_api_key_id") or NIL_API_KEY
+        for granularity in GRANULARITIES:
+            start = bucket_start(row["created_at"], granularity)
+            key = (granularity, start, row["agent_version_id"], api_key_id)
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = {
+                    "granularity": granularity,
+                    "bucket_start": start,
+                    "agent_version_id": row["agent_version_id"],
+                    "api_key_id": api_key_id,
+                    "project_id": row["project_id"],
+                    **{counter: 0 for counter in COUNTERS},
+                }
+            delta["message_count"] += 1
+            if row["role"] == "assistant":
+                delta["request_count"] += 1
+            delta["prompt_tokens"] += row.get("prompt_tokens") or 0
+            delta["completion_tokens"] += row.get("completion_tokens") or 0
+            delta["total_tokens"] += row.get("tokens_used") or 0
+    return [deltas[key] for key in sorted(deltas, key=lambda k: (k[0], k[1], str(k[2]), str(k[3])))]
+
+
+async def record_usage(db: AsyncSession, rows: List[Dict[str, object]]) -> None:
+    """Add chat_history rows to the hour and day rollups in one upsert.
+
+    Must run in the same transaction as the chat_history insert it describes.
+    agent_id is looked up from agent_versions by the same statement.
+    """
+    deltas = usage_deltas(rows)
+    if not deltas:
+        return
+    delta = values(
+        column("granularity", String),
+        column("bucket_start", DateTime(timezone=True)),
+        column("agent_version_id", PGUUID(as_uuid=True)),
+        column("api_key_id", PGUUID(as_uuid=True)),
+        column("project_id", PGUUID(as_uuid=True)),
+        *(column(counter, BigInteger) for counter in COUNTERS),
+        name="delta",
+    ).data([tuple(d[name] for name in _DELTA_COLUMNS) for d in deltas])
+    source = (
+        select(*delta.c, AgentVersion.agent_id)
+        .join_from(delta, AgentVersion, AgentVersion.id == delta.c.agent_version_id)
+        # Keeps the lock order of usage_deltas
+        .order_by(*(delta.c[name] for name in _KEY))
+    )
+    stmt = insert(UsageRollup).from_select([*_DELTA_COLUMNS, "agent_id"], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            UsageRollup.granularity,
+            UsageRollup.bucket_start,
+            UsageRollup.agent_version_id,
+            UsageRollup.api_key_id,
+        ],
+        set_={counter: getattr(UsageRollup, counter) + stmt.excluded[counter] for counter in COUNTERS},
+    )
+    await db.execute(stmt)
+
+
+async def _rebuild_day(day: date, project_id: Optional[UUID]) -> int:
+    lower = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    upper = lower + timedelta(days=1)
+    params = {"lower": lower, "upper": upper, "nil_key": NIL_API_KEY}
+    project_filter = history_filter = ""
+    if project_id is not None:
+        params["project_id"] = project_id
+        project_filter = "AND project_id = :project_id"
+        history_filter = "AND h.project_id = :project_id"
+    async with async_session() as db:
+        # Replaces the day's buckets in one transaction. Hour buckets of deleted
+        # versions have no chat_history to rebuild from and are kept as they are.
+        stale = delete(UsageRollup).where(
+            UsageRollup.bucket_start >= lower,
+            UsageRollup.bucket_start < upper,
+            (UsageRollup.granularity == "day")
+            | UsageRollup.agent_version_id.in_(select(AgentVersion.id)),
+        )
+        if project_id is not None:
+            stale = stale.where(UsageRollup.project_id == project_id)
+        await db.execute(stale)
+        hours = await db.execute(text(_REBUILD_HOURS.format(history_filter=history_filter)), params)
+        await db.execute(text(_REBUILD_DAY.format(project_filter=project_filter)), params)
+        await db.commit()
+    return hours.rowcount
+
+
+async def rebuild(
+    start: date,
+    end: date,
+    project_id: Optional[UUID] = None,
+    concurrency: int = 4,
+) -> int:
+    """Recompute the rollups of the UTC days [start, end) from chat_history.
+
+    Each day is one chunk in its own transaction, and up to ``concurrency``
+    chunks run in parallel on separate connections. A day's existing buckets
+    are replaced, so use it for days that no longer receive chats (backfill,
+    repair). Days whose chat_history was already removed by retention would be
+    emptied. Returns the number of hour buckets written.
+    """
+    days = [start + timedelta(days=n) for n in range((end - start).days)]
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(day: date) -> int:
+        async with slots:
+            written = await _rebuild_day(day, project_id)
+            logger.info("Rebuilt usage rollups for %s (%s hour buckets)", day, written)
+            return written
+
+    return sum(await asyncio.gather(*(run(day) for day in days)))
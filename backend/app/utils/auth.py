@@ -1,19 +1,34 @@
+import hashlib
+import math
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, inspect
+from sqlalchemy.orm import make_transient_to_detached
 from app.config import settings
 from app.database import get_db
 from app.models import Project, ProjectAPIKey
+from app.services.api_key_usage import api_key_usage
+from app.services.rate_limits import RateLimitExceeded, rate_limits
+from app.utils.cache import TTLCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+API_KEY_PREFIX = "pm_"
+
+# token digest -> (project columns, api key columns); raw tokens are never stored
+_auth_cache = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl_seconds)
+
+# Set by the cache invalidation bus so other API processes drop the key (or, for
+# api_key_id None, the whole project) too: (project_id, api_key_id) -> None
+publish_invalidation: Optional[Callable[[UUID, Optional[UUID]], None]] = None
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -30,75 +45,148 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-async def get_current_project(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> Project:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    token = credentials.credentials
-    
-    # First, check if it's a JWT token
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        project_id: str = payload.get("sub")
-        if project_id is None:
-            raise credentials_exception
-        
-        result = await db.execute(select(Project).where(Project.id == UUID(project_id)))
-        project = result.scalar_one_or_none()
-        
-        if project is None:
-            raise credentials_exception
-        return project
-    except JWTError:
-        pass
-    
-    # If not JWT, check if it's a project API key
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def _snapshot(obj, exclude: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(obj).mapper.column_attrs
+        if attr.key not in exclude
+    }
+
+async def _restore(db: AsyncSession, model, values: Dict[str, Any]):
+    # Rebuild a clean persistent instance without touching the database
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return await db.merge(obj, load=False)
+
+def invalidate_api_key(project_id: UUID, api_key_id: UUID, broadcast: bool = True) -> None:
+    """Drop a cached API key immediately (toggle/delete), in every API process."""
+    _auth_cache.discard_where(lambda _, value: value[1]["id"] == api_key_id)
+    if broadcast and publish_invalidation is not None:
+        publish_invalidation(project_id, api_key_id)
+
+def invalidate_project(project_id: UUID, broadcast: bool = True) -> None:
+    """Drop every cached API key belonging to a project, in every API process."""
+    _auth_cache.discard_where(lambda _, value: value[0]["id"] == project_id)
+    if broadcast and publish_invalidation is not None:
+        publish_invalidation(project_id, None)
+
+def clear_auth_cache() -> None:
+    """Drop everything (e.g. after invalidations from other processes may have been missed)."""
+    _auth_cache.clear()
+
+async def _resolve_api_key(
+    token: str,
+    db: AsyncSession
+) -> Optional[Tuple[Project, ProjectAPIKey]]:
+    digest = _token_digest(token)
+    cached = _auth_cache.get(digest)
+    if cached is not None:
+        project_values, api_key_values = cached
+        project = await _restore(db, Project, project_values)
+        api_key = await _restore(db, ProjectAPIKey, api_key_values)
+        return project, api_key
+
     result = await db.execute(
-        select(ProjectAPIKey).where(
+        select(ProjectAPIKey, Project)
+        .join(Project, Project.id == ProjectAPIKey.project_id)
+        .where(
             ProjectAPIKey.api_key == token,
-            ProjectAPIKey.is_active == True
+            ProjectAPIKey.is_active == True,
+            Project.deleted_at.is_(None)
         )
     )
-    api_key = result.scalar_one_or_none()
-    
-    if api_key is None:
-        raise credentials_exception
-    
-    # Update last used
-    api_key.last_used_at = datetime.utcnow()
-    await db.commit()
+    row = result.first()
+    if row is None:
+        return None
+
+    api_key, project = row
+    # Never keep the raw token around; the digest is the cache key
+    _auth_cache.set(digest, (_snapshot(project), _snapshot(api_key, exclude=("api_key",))))
+    return project, api_key
+
+async def _authenticate(
+    token: str,
+    db: AsyncSession
+) -> Tuple[Project, Optional[ProjectAPIKey]]:
+    # Project API keys are recognisable up front, so skip the JWT decode for them
+    if not token.startswith(API_KEY_PREFIX):
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+            project_id: str = payload.get("sub")
+            if project_id is None:
+                raise _credentials_exception()
+            
+            result = await db.execute(
+                select(Project).where(Project.id == UUID(project_id), Project.deleted_at.is_(None))
+            )
+            project = result.scalar_one_or_none()
+            
+            if project is None:
+                raise _credentials_exception()
+            return project, None
+        except JWTError:
+            pass
     
-    # Get the project
-    result = await db.execute(select(Project).where(Project.id == api_key.project_id))
-    project = result.scalar_one_or_none()
+    # If not JWT, check if it's a project API key
+    resolved = await _resolve_api_key(token, db)
+    if resolved is None:
+        raise _credentials_exception()
+    project, api_key = resolved
     
-    if project is None:
-        raise credentials_exception
+    # Update last used (written in batches by the background flusher)
+    api_key_usage.record(api_key.id)
     
+    return project, api_key
+
+async def get_current_project(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> Project:
+    project, _ = await _authenticate(credentials.credentials, db)
     return project
 
 
+def enforce_rate_limit(project: Project, api_key: ProjectAPIKey, cost: int = 1) -> None:
+    """Charge ``cost`` requests to the key's and project's limits; 429 with Retry-After when short."""
+    try:
+        rate_limits.check(project, api_key, cost)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.detail,
+            headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+        )
+
+
+async def get_project_with_api_key_unmetered(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+):
+    """Like get_project_with_api_key, but leaves rate limiting to the route.
+
+    For routes whose cost depends on the request body (e.g. /chat/batch),
+    which charge it with enforce_rate_limit in a single call.
+    """
+    # If bearer is JWT, there's no api_key context
+    return await _authenticate(credentials.credentials, db)
+
+
 async def get_project_with_api_key(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
 ):
     """Return (project, api_key) where bearer can be JWT or project API key."""
-    project = await get_current_project(credentials, db)
-
-    # If bearer is API key, fetch it; if JWT, there's no api_key context
-    token = credentials.credentials
-    api_key = None
-    result = await db.execute(
-        select(ProjectAPIKey).where(
-            ProjectAPIKey.api_key == token,
-            ProjectAPIKey.is_active == True
-        )
-    )
-    api_key = result.scalar_one_or_none()
+    project, api_key = await get_project_with_api_key_unmetered(credentials, db)
+    if api_key is not None:
+        enforce_rate_limit(project, api_key)
     return project, api_key
@@ -1,34 +1,101 @@
 import base64
+import hashlib
 import secrets
-from cryptography.fernet import Fernet
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from app.config import settings
+from app.utils.cache import TTLCache
 
-def get_fernet():
-    # Derive a proper key from the encryption key
-    key = settings.encryption_key.encode()
-    # Pad or hash to get 32 bytes for Fernet
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=b'prompt-management-salt',
-        iterations=100000,
+
+class KeyRing:
+    """Derived Fernet keys plus a cache of decrypted provider secrets.
+
+    PBKDF2 runs once per configured key; the first key encrypts, every key
+    decrypts (so old ciphertexts keep working while keys are rotated).
+    Decrypted values are cached by ciphertext digest, never by plaintext.
+    """
+
+    def __init__(self, keys: List[str], cache_size: int, cache_ttl: int):
+        if not keys:
+            raise ValueError("At least one encryption key is required")
+        self._keys = keys
+        self._fernet: Optional[MultiFernet] = None
+        self._lock = threading.Lock()
+        self._secrets = TTLCache(cache_size, cache_ttl)
+        self.derivations = 0
+
+    @property
+    def fernet(self) -> MultiFernet:
+        if self._fernet is None:
+            with self._lock:
+                if self._fernet is None:
+                    fernets = []
+                    for key in self._keys:
+                        fernets.append(Fernet(self._derive(key)))
+                        self.derivations += 1
+                    self._fernet = MultiFernet(fernets)
+        return self._fernet
+
+    @staticmethod
+    def _derive(key: str) -> bytes:
+        # Derive a proper 32-byte Fernet key from the configured secret
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=b'prompt-management-salt',
+            iterations=100000,
+        )
+        return base64.urlsafe_b64encode(kdf.derive(key.encode()))
+
+    def encrypt(self, plaintext: str) -> str:
+        encrypted = self.fernet.encrypt(plaintext.encode())
+        return base64.urlsafe_b64encode(encrypted).decode()
+
+    def decrypt(self, ciphertext: str) -> str:
+        digest = hashlib.sha256(ciphertext.encode()).digest()
+        cached = self._secrets.get(digest)
+        if cached is not None:
+            return cached
+        decrypted = self.fernet.decrypt(base64.urlsafe_b64decode(ciphertext.encode())).decode()
+        self._secrets.set(digest, decrypted)
+        return decrypted
+
+    def rotate(self, ciphertext: str) -> str:
+        """Re-encrypt a stored value under the current primary key."""
+        token = base64.urlsafe_b64decode(ciphertext.encode())
+        return base64.urlsafe_b64encode(self.fernet.rotate(token)).decode()
+
+    def stats(self) -> Dict[str, Union[int, Dict[str, int]]]:
+        return {
+            "keys": len(self._keys),
+            "derivations": self.derivations,
+            "secret_cache": self._secrets.stats(),
+        }
+
+
+@lru_cache()
+def get_keyring() -> KeyRing:
+    previous = [k.strip() for k in settings.encryption_previous_keys.split(",") if k.strip()]
+    return KeyRing(
+        [settings.encryption_key, *previous],
+        cache_size=settings.secret_cache_size,
+        cache_ttl=settings.secret_cache_ttl_seconds,
     )
-    derived_key = base64.urlsafe_b64encode(kdf.derive(key))
-    return Fernet(derived_key)
+
+def get_fernet() -> MultiFernet:
+    return get_keyring().fernet
 
 def encrypt_api_key(api_key: str) -> str:
     """Encrypt an API key for storage"""
-    fernet = get_fernet()
-    encrypted = fernet.encrypt(api_key.encode())
-    return base64.urlsafe_b64encode(encrypted).decode()
+    return get_keyring().encrypt(api_key)
 
 def decrypt_api_key(encrypted_key: str) -> str:
     """Decrypt an API key from storage"""
-    fernet = get_fernet()
-    decrypted = fernet.decrypt(base64.urlsafe_b64decode(encrypted_key.encode()))
-    return decrypted.decode()
+    return get_keyring().decrypt(encrypted_key)
 
 def generate_api_key() -> str:
     """Generate a new API key"""
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence, Tuple
+from uuid import UUID
+
+from app.utils.sse import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - Parquet export is simply unavailable
+    pa = None
+    pq = None
+
+# format -> (media type, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# (name, kind) in output order; kind picks the Parquet type
+Columns = Sequence[Tuple[str, str]]
+
+
+def _plain(value):
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns: Columns):
+        self.names = [name for name, _ in columns]
+
+    def start(self) -> bytes:
+        return b""
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        if orjson is not None:
+            # orjson writes UUIDs and datetimes natively
+            return b"".join(
+                orjson.dumps(dict(zip(self.names, row)), option=orjson.OPT_APPEND_NEWLINE)
+                for row in rows
+            )
+        return "".join(
+            json.dumps(dict(zip(self.names, map(_plain, row))), ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        ).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _CsvEncoder:
+    def __init__(self, columns: Columns):
+        self.names = [name for name, _ in columns]
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def start(self) -> bytes:
+        self._writer.writerow(self.names)
+        return self._take()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        self._writer.writerows(
+            ["" if value is None else _plain(value) for value in row] for row in rows
+        )
+        return self._take()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Sink:
+    """Write-only file for ParquetWriter whose bytes are drained after each row group."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _ParquetEncoder:
+    """One row group per batch, so only the current batch is ever in memory."""
+
+    def __init__(self, columns: Columns):
+        types = {
+            "string": pa.string(),
+            "int": pa.int64(),
+            "timestamp": pa.timestamp("us", tz="UTC"),
+        }
+        self.columns = columns
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def start(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        arrays = []
+        for index, (_, kind) in enumerate(self.columns):
+            values = [row[index] for row in rows]
+            if kind == "string":
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(values)
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(arrays, self.schema)],
+            schema=self.schema,
+        ))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+_ENCODERS = {"ndjson": _NdjsonEncoder, "csv": _CsvEncoder, "parquet": _ParquetEncoder}
+
+
+def format_available(fmt: str) -> bool:
+    return fmt != "parquet" or pq is not None
+
+
+async def encode_rows(
+    batches: AsyncIterator[List[tuple]],
+    fmt: str,
+    columns: Columns,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    """Encode row batches as they arrive; nothing beyond one batch is held.
+
+    Encoding (and gzip) runs in a worker thread so a large export does not
+    stall the event loop for other requests.
+    """
+    encoder = _ENCODERS[fmt](columns)
+    # wbits=31: gzip container, so the output is a regular .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def output(data: bytes, final: bool = False) -> bytes:
+        if compressor is None:
+            return data
+        data = compressor.compress(data)
+        return data + compressor.flush() if final else data
+
+    data = output(encoder.start())
+    if data:
+        yield data
+    async for rows in batches:
+        data = await asyncio.to_thread(lambda: output(encoder.encode(rows)))
+        if data:
+            yield data
+    yield await asyncio.to_thread(lambda: output(encoder.finish(), final=True))
@@ -0,0 +1,40 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: datetime, row_id: UUID) -> str:
+    """Opaque keyset cursor for a (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def encode_ranked_cursor(rank: float, timestamp: datetime, row_id: UUID) -> str:
+    """Keyset cursor for a (rank, timestamp, id) position of ranked results."""
+    # repr() round-trips the float exactly, so the next page starts right after it
+    raw = f"{rank!r}|{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_ranked_cursor(cursor: str) -> Tuple[float, datetime, UUID]:
+    """Inverse of encode_ranked_cursor; raises ValueError for anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, timestamp, row_id = raw.split("|", 2)
+        return float(rank), datetime.fromisoformat(timestamp), UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
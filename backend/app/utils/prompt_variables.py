@@ -1,5 +1,5 @@
 import re
-from typing import Dict, List
+from typing import Dict, List, Sequence
 
 # Regex to capture placeholders like $name or $age
 _VAR_PATTERN = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)")
@@ -12,26 +12,56 @@ def extract_variables(system_prompt: str) -> List[str]:
     return sorted(set(_VAR_PATTERN.findall(system_prompt)))
 
 
-def render_prompt(system_prompt: str, variables: Dict[str, str], *, strict: bool = True) -> str:
-    """Replace $var placeholders with provided values.
+def compile_prompt(system_prompt: str) -> List[str]:
+    """Split a prompt into alternating segments: literal, variable name, literal, ...
 
-    When strict=True (default), missing values raise an error. When strict=False,
-    missing values are kept as-is in the prompt.
+    Even indices are literal text and odd indices are variable names, so the
+    list always has an odd length. Compiled once when a version is created.
     """
     if not system_prompt:
-        return system_prompt
+        return [system_prompt or ""]
+    return _VAR_PATTERN.split(system_prompt)
+
+
+def compiled_variables(segments: Sequence[str]) -> List[str]:
+    """Return the sorted unique variable names of a compiled prompt."""
+    return sorted(set(segments[1::2]))
+
+
+def render_compiled(segments: Sequence[str], variables: Dict[str, str], *, strict: bool = True) -> str:
+    """Render a compiled prompt with a single join over its segments."""
+    if len(segments) == 1:
+        return segments[0]
 
     variables = variables or {}
-    missing = [name for name in extract_variables(system_prompt) if not variables.get(name)]
+    parts = list(segments)
+    missing = []
+    for i in range(1, len(parts), 2):
+        name = parts[i]
+        value = variables.get(name)
+        # Same rules as the original regex renderer: any falsy value (0, False,
+        # []) counts as missing for strict mode, but only None and "" are left
+        # unsubstituted when rendering leniently
+        if not value:
+            missing.append(name)
+        if value in (None, ""):
+            parts[i] = "$" + name
+        else:
+            parts[i] = str(value)
+
     if strict and missing:
         raise ValueError(
-            "Missing variable values for: " + ", ".join(missing)
+            "Missing variable values for: " + ", ".join(sorted(set(missing)))
         )
+    return "".join(parts)
 
-    def _sub(match: re.Match) -> str:
-        name = match.group(1)
-        if name in variables and variables.get(name) not in (None, ""):
-            return str(variables.get(name))
-        return match.group(0)
 
-    return _VAR_PATTERN.sub(_sub, system_prompt)
+def render_prompt(system_prompt: str, variables: Dict[str, str], *, strict: bool = True) -> str:
+    """Replace $var placeholders with provided values.
+
+    When strict=True (default), missing values raise an error. When strict=False,
+    missing values are kept as-is in the prompt.
+    """
+    if not system_prompt:
+        return system_prompt
+    return render_compiled(compile_prompt(system_prompt), variables, strict=strict)
@@ -0,0 +1,167 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - the similarity cache is simply disabled
+    np = None
+
+FINGERPRINT_BITS = 64
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+def _features(normalized: str) -> List[str]:
+    # Words make the fingerprint insensitive to reordering; character trigrams
+    # of each word keep small typos from flipping a whole feature.
+    features: List[str] = []
+    for word in normalized.split(" "):
+        if not word:
+            continue
+        features.append(word)
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+if np is not None:
+    _SHIFTS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash of the normalized text (None without NumPy or features).
+
+    Feature hashes use Python's per-process ``hash``, so fingerprints are only
+    comparable within one process, which is all an in-memory index needs.
+    """
+    if np is None:
+        return None
+    features = _features(normalize_text(text))
+    if not features:
+        return None
+    hashes = np.array([hash(f) for f in features], dtype=np.int64).view(np.uint64)
+    bits = (hashes[:, None] >> _SHIFTS) & np.uint64(1)
+    # Each feature votes +1/-1 per bit position; the sign of the sum is the bit
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(features)
+    set_bits = np.nonzero(votes > 0)[0]
+    return int(np.bitwise_or.reduce(np.uint64(1) << set_bits.astype(np.uint64), initial=np.uint64(0)))
+
+
+def max_distance_for(threshold: float) -> int:
+    """Largest Hamming distance whose similarity (1 - d/64) still meets ``threshold``."""
+    return max(int(FINGERPRINT_BITS * (1 - threshold) + 1e-9), 0)
+
+
+@dataclass
+class _Entry:
+    scope: int
+    fingerprint: int
+    value: Any
+    expires_at: float
+
+
+class SimHashIndex:
+    """Banded LSH index over 64-bit fingerprints with LRU/TTL eviction.
+
+    The fingerprint is split into ``max_distance + 1`` bands; by pigeonhole,
+    two fingerprints within ``max_distance`` bits share at least one band
+    exactly, so a lookup only scores the entries of a few buckets instead of
+    the whole index. ``scope`` (an int) partitions the index, e.g. per agent
+    version and rendered prompt.
+    """
+
+    def __init__(self, max_distance: int, maxsize: int, ttl: float):
+        self.max_distance = min(max(max_distance, 0), 15)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        bands = self.max_distance + 1
+        width, extra = divmod(FINGERPRINT_BITS, bands)
+        self._bands: List[Tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for i in range(bands):
+            bits = width + (1 if i < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int, int], Set[int]] = {}
+        self._next_id = 0
+        self.evictions = 0
+        self.candidates_scanned = 0
+
+    def _bucket_keys(self, scope: int, fingerprint: int) -> List[Tuple[int, int, int]]:
+        return [(scope, i, (fingerprint >> shift) & mask) for i, (shift, mask) in enumerate(self._bands)]
+
+    def get(self, scope: int, fingerprint: int) -> Optional[Tuple[Any, int]]:
+        """Return (value, distance) of the closest live entry within ``max_distance``."""
+        now = time.monotonic()
+        best_id: Optional[int] = None
+        best_distance = self.max_distance + 1
+        expired: List[int] = []
+        seen: Set[int] = set()
+        for key in self._bucket_keys(scope, fingerprint):
+            for entry_id in self._buckets.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    expired.append(entry_id)
+                    continue
+                distance = (entry.fingerprint ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+                    if distance == 0:
+                        break
+            if best_distance == 0:
+                break
+        self.candidates_scanned += len(seen)
+        for entry_id in expired:
+            self._remove(entry_id)
+        if best_id is None:
+            return None
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id].value, best_distance
+
+    def put(self, scope: int, fingerprint: int, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl
+        for entry_id in self._buckets.get(self._bucket_keys(scope, fingerprint)[0], ()):
+            entry = self._entries[entry_id]
+            if entry.fingerprint == fingerprint:
+                entry.value = value
+                entry.expires_at = expires_at
+                self._entries.move_to_end(entry_id)
+                return
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(scope, fingerprint, value, expires_at)
+        for key in self._bucket_keys(scope, fingerprint):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._bucket_keys(entry.scope, entry.fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
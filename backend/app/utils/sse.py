@@ -0,0 +1,94 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON as UTF-8 bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def sse_event(event: str, payload: Any) -> bytes:
+    """One Server-Sent Events frame, ready to be written to the response."""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(payload) + b"\n\n"
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    window_seconds: float,
+    max_chars: int,
+) -> AsyncIterator[str]:
+    """Merge consecutive tokens into chunks, flushed after ``window_seconds``
+    from the first buffered token or once ``max_chars`` are buffered.
+
+    The source is drained by a separate task, so a slow model never delays a
+    due flush and a slow client never stalls the model. With both limits at 0
+    tokens are passed through one by one.
+    """
+    if window_seconds <= 0 and max_chars <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    finished = False
+    error: Optional[BaseException] = None
+    timer: Optional[asyncio.TimerHandle] = None
+    due = asyncio.Event()  # window elapsed, size limit reached or source ended
+
+    async def pump() -> None:
+        nonlocal size, finished, error, timer
+        try:
+            async for token in tokens:
+                if not buffer and window_seconds > 0:
+                    # The window starts with the first token of a chunk
+                    timer = loop.call_later(window_seconds, due.set)
+                buffer.append(token)
+                size += len(token)
+                if 0 < max_chars <= size:
+                    due.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            due.set()
+
+    task = loop.create_task(pump())
+    try:
+        while True:
+            await due.wait()
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if buffer:
+                chunk = "".join(buffer)
+                buffer.clear()
+                size = 0
+                if not finished:
+                    due.clear()
+                yield chunk
+            elif finished:
+                break
+            else:
+                due.clear()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not task.done():
+            # Client went away: stop the source (releases its provider slot)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if error is not None:
+        raise error
@@ -0,0 +1,38 @@
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=64)
+def _encoding(model_name: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name or "")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encoding files unavailable (e.g. offline); fall back to the heuristic
+        return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """Count tokens locally; approximates 4 chars/token when no tokenizer is available."""
+    if not text:
+        return 0
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(text: str, model_name: Optional[str] = None) -> int:
+    return count_tokens(text, model_name) + MESSAGE_OVERHEAD_TOKENS
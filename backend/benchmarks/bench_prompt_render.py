@@ -0,0 +1,72 @@
+"""Microbenchmark: precompiled prompt rendering vs. the previous regex path.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_prompt_render
+
+The "regex" column reproduces what a chat turn used to do: extract_variables
+in the router, then render_prompt scanning the prompt twice more (findall +
+sub). The "compiled" column is the hot path today: a single join over the
+segments stored with the version.
+"""
+import re
+import time
+from typing import Dict
+
+from app.utils.prompt_variables import compile_prompt, render_compiled
+
+_VAR_PATTERN = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)")
+
+
+def _legacy_render(system_prompt: str, variables: Dict[str, str]) -> str:
+    # Router: extract_variables(...) before rendering
+    if not sorted(set(_VAR_PATTERN.findall(system_prompt))):
+        return system_prompt
+    # render_prompt: extract_variables again, then sub()
+    missing = [n for n in sorted(set(_VAR_PATTERN.findall(system_prompt))) if not variables.get(n)]
+    del missing
+
+    def _sub(match: re.Match) -> str:
+        name = match.group(1)
+        if name in variables and variables.get(name) not in (None, ""):
+            return str(variables.get(name))
+        return match.group(0)
+
+    return _VAR_PATTERN.sub(_sub, system_prompt)
+
+
+def _build_prompt(num_vars: int, filler_words: int) -> str:
+    filler = " ".join(["lorem"] * filler_words)
+    return " ".join(f"{filler} $var_{i}" for i in range(num_vars)) + " " + filler
+
+
+def _throughput(fn, duration: float = 1.0) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(50):
+            fn()
+        calls += 50
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return calls / elapsed
+
+
+def main() -> None:
+    print(f"{'prompt':>12} {'vars':>6} {'regex/s':>12} {'compiled/s':>12} {'speedup':>8}")
+    for num_vars, filler_words in ((5, 20), (50, 20), (200, 50), (1000, 50)):
+        prompt = _build_prompt(num_vars, filler_words)
+        variables = {f"var_{i}": f"value-{i}" for i in range(0, num_vars, 2)}
+        segments = compile_prompt(prompt)
+        assert render_compiled(segments, variables, strict=False) == _legacy_render(prompt, variables)
+
+        legacy = _throughput(lambda: _legacy_render(prompt, variables))
+        compiled = _throughput(lambda: render_compiled(segments, variables, strict=False))
+        print(
+            f"{len(prompt):>10}ch {num_vars:>6} {legacy:>12.0f} {compiled:>12.0f} "
+            f"{compiled / legacy:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Microbenchmark: SimHash index lookups at up to a million entries.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_similarity_cache [--entries 1000000]
+
+Fills one index scope with random fingerprints, then times lookups of
+near-duplicates (a few flipped bits, expected hits) and of unrelated
+fingerprints (expected misses). Fingerprinting a message is timed separately
+since it does not depend on the index size.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.utils.simhash import SimHashIndex, max_distance_for, simhash
+
+
+def _flip_bits(fingerprint: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def _timed(fn, samples):
+    durations = []
+    for sample in samples:
+        started = time.perf_counter()
+        fn(sample)
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return statistics.mean(durations) * 1e6, durations[int(len(durations) * 0.99)] * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    max_distance = max_distance_for(args.threshold)
+    index = SimHashIndex(max_distance, maxsize=args.entries, ttl=3600)
+    fingerprints = [rng.getrandbits(64) for _ in range(args.entries)]
+    started = time.perf_counter()
+    for i, fingerprint in enumerate(fingerprints):
+        index.put(1, fingerprint, i)
+    print(f"built {len(index):,} entries in {time.perf_counter() - started:.1f}s (max distance {max_distance})")
+
+    near = [_flip_bits(rng.choice(fingerprints), rng.randint(0, max_distance), rng) for _ in range(args.lookups)]
+    far = [rng.getrandbits(64) for _ in range(args.lookups)]
+
+    index.candidates_scanned = 0
+    hit_mean, hit_p99 = _timed(lambda fp: index.get(1, fp), near)
+    hit_candidates = index.candidates_scanned / len(near)
+    hits = sum(index.get(1, fp) is not None for fp in near)
+    index.candidates_scanned = 0
+    miss_mean, miss_p99 = _timed(lambda fp: index.get(1, fp), far)
+    miss_candidates = index.candidates_scanned / len(far)
+
+    print(f"{'lookup':>10} {'mean us':>9} {'p99 us':>9} {'candidates':>11}")
+    print(f"{'near-dup':>10} {hit_mean:>9.1f} {hit_p99:>9.1f} {hit_candidates:>11.1f}  ({hits}/{len(near)} found)")
+    print(f"{'unrelated':>10} {miss_mean:>9.1f} {miss_p99:>9.1f} {miss_candidates:>11.1f}")
+
+    messages = [f"Please summarise ticket number {i} about the failed invoice export" for i in range(2000)]
+    fp_mean, fp_p99 = _timed(simhash, messages)
+    print(f"{'simhash':>10} {fp_mean:>9.1f} {fp_p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
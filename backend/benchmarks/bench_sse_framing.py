@@ -0,0 +1,126 @@
+"""Benchmark: CPU per streamed token for /chat/stream SSE framing.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_sse_framing [--streams 500] [--tokens 400]
+
+Simulates many concurrent streams fed by a fast model (one token every
+``--interval-ms``), writes every frame to a loopback TCP connection (drained
+by a separate sink process, so only the server side is measured) and reports
+process CPU time per token for:
+
+- ``source``: draining the token streams without writing (the floor every mode pays)
+- ``legacy``: one ``json.dumps`` str frame per token, encoded by the server
+- ``per-token``: one pre-encoded ``sse_event`` frame per token
+- ``coalesce``: tokens merged by ``coalesce_tokens`` (``--coalesce-ms``)
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from app.utils.sse import coalesce_tokens, orjson, sse_event
+
+TOKEN_WORDS = ["The", " quick", " brown", " fox", " jumps", " over", " the", " lazy", " dog", "."]
+
+
+async def _model(tokens: int, interval: float):
+    for i in range(tokens):
+        await asyncio.sleep(interval)
+        yield TOKEN_WORDS[i % len(TOKEN_WORDS)]
+
+
+async def _source(tokens, interval, coalesce_ms):
+    async for _ in _model(tokens, interval):
+        pass
+    yield b""
+
+
+async def _legacy(tokens, interval, coalesce_ms):
+    async for token in _model(tokens, interval):
+        # StreamingResponse encodes str chunks before writing them
+        yield f"event: token\ndata: {json.dumps({'token': token})}\n\n".encode("utf-8")
+
+
+async def _per_token(tokens, interval, coalesce_ms):
+    async for token in _model(tokens, interval):
+        yield sse_event("token", {"token": token})
+
+
+async def _coalesce(tokens, interval, coalesce_ms):
+    async for token in coalesce_tokens(_model(tokens, interval), coalesce_ms / 1000, 0):
+        yield sse_event("token", {"token": token})
+
+
+MODES = {"source": _source, "legacy": _legacy, "per-token": _per_token, "coalesce": _coalesce}
+
+
+def _sink(listener: socket.socket) -> None:
+    async def discard(reader, writer):
+        while await reader.read(65536):
+            pass
+        writer.close()
+
+    async def serve():
+        server = await asyncio.start_server(discard, sock=listener)
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+async def _send(stream, port: int) -> int:
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    frames = 0
+    async for frame in stream:
+        if not isinstance(frame, bytes):
+            frame = frame.encode()
+        writer.write(frame)
+        await writer.drain()
+        frames += 1
+    writer.close()
+    await writer.wait_closed()
+    return frames
+
+
+async def _run(mode, streams, tokens, interval, coalesce_ms, port):
+    started_cpu = time.process_time()
+    started = time.perf_counter()
+    frames = await asyncio.gather(*(
+        _send(MODES[mode](tokens, interval, coalesce_ms), port) for _ in range(streams)
+    ))
+    return time.process_time() - started_cpu, time.perf_counter() - started, sum(frames)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--interval-ms", type=float, default=2.0)
+    parser.add_argument("--coalesce-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    listener = socket.create_server(("127.0.0.1", 0), backlog=args.streams)
+    port = listener.getsockname()[1]
+    sink = multiprocessing.Process(target=_sink, args=(listener,), daemon=True)
+    sink.start()
+
+    total_tokens = args.streams * args.tokens
+    print(f"{args.streams} streams x {args.tokens} tokens, one token every {args.interval_ms}ms "
+          f"(serializer: {'orjson' if orjson is not None else 'json'})")
+    print(f"{'mode':>10} {'cpu s':>7} {'wall s':>7} {'frames':>8} {'cpu us/token':>13} {'framing us/token':>17}")
+    floor = None
+    for mode in MODES:
+        cpu, wall, frames = asyncio.run(
+            _run(mode, args.streams, args.tokens, args.interval_ms / 1000, args.coalesce_ms, port)
+        )
+        per_token = cpu / total_tokens * 1e6
+        if floor is None:
+            floor = per_token
+        print(f"{mode:>10} {cpu:>7.2f} {wall:>7.2f} {frames:>8} {per_token:>13.2f} {per_token - floor:>17.2f}")
+    sink.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,27 @@
-from fastapi import FastAPI
+import secrets
+from typing import Optional
+from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routers import projects, api_keys, agents, chat, model_profiles
+from app.database import pool_usage
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.routers import projects, api_keys, agents, chat, model_profiles, eval_jobs as eval_jobs_router, deletion_jobs, usage
+from app.services.agent_cache import agent_versions
+from app.services.cache_bus import cache_bus
+from app.services.api_key_usage import api_key_usage
+from app.services.chat_writer import chat_writer
+from app.services.deletions import deletion_runner
+from app.services.eval_jobs import eval_jobs
+from app.services.history_retention import history_maintenance
+from app.services.llm_clients import llm_clients
+from app.services.provider_limiter import provider_limits
+from app.services.rate_limits import rate_limits
+from app.services.response_cache import response_cache
+from app.services.search_index import search_index
+from app.services.similarity_cache import similarity_cache
+from app.services.session_cache import session_cache
+from app.utils.encryption import get_keyring
 
 app = FastAPI(
     title="Prompt Management API",
@@ -19,6 +39,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the dashboard read pagination cursors
+    expose_headers=[NEXT_CURSOR_HEADER, "Retry-After"],
 )
 
 # Include routers
@@ -27,6 +49,40 @@ app.include_router(api_keys.router, prefix="/api")
 app.include_router(agents.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
 app.include_router(model_profiles.router, prefix="/api")
+app.include_router(eval_jobs_router.router, prefix="/api")
+app.include_router(deletion_jobs.router, prefix="/api")
+app.include_router(usage.router, prefix="/api")
+
+@app.on_event("startup")
+async def warm_up():
+    # Derive encryption keys once up front so no request pays for PBKDF2
+    get_keyring().fernet
+    # Before anything fills the caches, so no invalidation from other workers is missed
+    cache_bus.start()
+    api_key_usage.start()
+    rate_limits.start()
+    chat_writer.start()
+    history_maintenance.start()
+    search_index.start()
+    # Also resumes evaluation jobs interrupted by a restart
+    eval_jobs.start()
+    # Also resumes deletions interrupted by a restart (once their lease expires)
+    deletion_runner.start()
+    response_cache.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await eval_jobs.stop()
+    await deletion_runner.stop()
+    # Writes every queued chat turn before the process exits
+    await chat_writer.stop()
+    await response_cache.stop()
+    await history_maintenance.stop()
+    await search_index.stop()
+    await api_key_usage.stop()
+    await rate_limits.stop()
+    await cache_bus.stop()
+    await llm_clients.aclose()
 
 @app.get("/")
 async def root():
@@ -40,6 +96,43 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+_metrics_bearer = HTTPBearer(auto_error=False)
+
+
+def require_metrics_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_metrics_bearer)) -> None:
+    if not settings.metrics_token:
+        # Not configured: behave as if the endpoint did not exist
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(credentials.credentials, settings.metrics_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)], include_in_schema=False)
+async def metrics():
+    return {
+        "encryption": get_keyring().stats(),
+        "llm_clients": llm_clients.stats(),
+        "llm_providers": provider_limits.stats(),
+        # LLM calls in flight are not bounded by (and hold none of) the DB pool
+        "db_pool": {**pool_usage.stats(), "llm_in_flight": provider_limits.in_flight()},
+        "agent_versions": agent_versions.stats(),
+        "api_key_usage": api_key_usage.stats(),
+        "rate_limits": rate_limits.stats(),
+        "session_cache": session_cache.stats(),
+        "cache_invalidation": cache_bus.stats(),
+        "chat_writer": chat_writer.stats(),
+        "chat_history_maintenance": history_maintenance.stats(),
+        "chat_search_index": search_index.stats(),
+        "eval_jobs": eval_jobs.stats(),
+        "deletion_jobs": deletion_runner.stats(),
+        "response_cache": response_cache.stats(),
+        "similarity_cache": similarity_cache.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
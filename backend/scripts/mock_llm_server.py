@@ -0,0 +1,130 @@
+"""Local OpenAI-compatible stand-in for end-to-end runs without a real provider.
+
+Run from the backend folder:
+
+    python -m scripts.mock_llm_server --port 9000 --latency-ms 200
+
+then point an agent version's base_url at http://localhost:9000/v1 (any API
+key is accepted). Replies echo the last user message, report token usage and
+support ``stream: true``. ``--fail-rate`` makes a fraction of calls return 500
+and ``--rate-limit-rate`` a fraction return 429, to exercise error handling.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock LLM server")
+config = argparse.Namespace(latency_ms=0, fail_rate=0.0, rate_limit_rate=0.0, chunk_words=1)
+
+
+def _count_tokens(text: str) -> int:
+    return max(len(text.split()), 1)
+
+
+def _reply_for(messages: List[dict]) -> str:
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"echo: {last_user}"
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": "mock_error", "code": status_code}},
+    )
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    roll = random.random()
+    if roll < config.rate_limit_rate:
+        return _error(429, "Rate limit reached (mock)")
+    if roll < config.rate_limit_rate + config.fail_rate:
+        return _error(500, "Internal error (mock)")
+
+    await asyncio.sleep(config.latency_ms / 1000)
+
+    messages = body.get("messages", [])
+    model = body.get("model", "mock-model")
+    reply = _reply_for(messages)
+    prompt_tokens = sum(_count_tokens(str(m.get("content", ""))) for m in messages)
+    completion_tokens = _count_tokens(reply)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def events():
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if chunk_usage is not None:
+                payload["usage"] = chunk_usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        words = reply.split(" ")
+        for i in range(0, len(words), config.chunk_words):
+            piece = " ".join(words[i:i + config.chunk_words])
+            yield chunk({"content": piece if i == 0 else " " + piece})
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield chunk(None, chunk_usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=int, default=0, help="delay before each reply")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--chunk-words", type=int, default=1, help="words per streamed chunk")
+    args = parser.parse_args()
+    for key in ("latency_ms", "fail_rate", "rate_limit_rate", "chunk_words"):
+        setattr(config, key, getattr(args, key))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Rebuild the hour/day usage rollups from raw chat_history.
+
+Run from the backend folder:
+
+    python -m scripts.rebuild_usage_rollups --start 2026-01-01 [--end 2026-02-01]
+        [--project <uuid>] [--concurrency 4]
+
+Days are UTC and ``--end`` is exclusive (default: today, so the current day,
+which is still receiving chats, is left alone). Each day is rebuilt in its own
+transaction and ``--concurrency`` days are processed in parallel. Use it once
+to backfill history written before the rollups existed, or to repair a range.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timezone
+from uuid import UUID
+
+from app.database import engine
+from app.services.usage_rollups import rebuild
+
+
+async def _run(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    try:
+        written = await rebuild(args.start, args.end, args.project, args.concurrency)
+    finally:
+        await engine.dispose()
+    days = (args.end - args.start).days
+    print(f"Rebuilt {days} day(s): {written} hour buckets in {time.perf_counter() - started:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first UTC day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, default=datetime.now(timezone.utc).date(),
+                        help="UTC day after the last one rebuilt (default: today)")
+    parser.add_argument("--project", type=UUID, default=None, help="only this project")
+    parser.add_argument("--concurrency", type=int, default=4, help="days rebuilt in parallel")
+    args = parser.parse_args()
+    if args.start >= args.end:
+        parser.error("--start must be before --end")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
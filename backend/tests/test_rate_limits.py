@@ -0,0 +1,55 @@
+import uuid
+from types import SimpleNamespace
+import pytest
+from app.config import settings
+from app.services.rate_limits import RateLimitExceeded, RateLimiter, _Bucket
+
+
+def _owner(rps):
+    return SimpleNamespace(id=uuid.uuid4(), rate_limit_rps=rps, daily_token_quota=None)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_burst_seconds", 2.0)
+    monkeypatch.setattr(settings, "rate_limit_worker_count", 1)
+    return RateLimiter(interval=60)
+
+
+def test_bucket_admits_up_to_capacity_then_waits():
+    bucket = _Bucket(rate=5, capacity=10)
+    now = bucket.updated
+    assert bucket.take(now, 10) == 0
+    assert bucket.take(now, 1) == pytest.approx(0.2)
+
+
+def test_bucket_admits_cost_above_capacity_from_full_bucket_and_goes_into_debt():
+    bucket = _Bucket(rate=5, capacity=10)
+    now = bucket.updated
+    assert bucket.take(now, 20) == 0
+    assert bucket.tokens == -10
+    # The debt is paid back before anything else is admitted
+    assert bucket.take(now, 1) == pytest.approx(2.2)
+
+
+def test_check_admits_a_batch_larger_than_the_burst(limiter):
+    project, api_key = _owner(None), _owner(5)
+    limiter.check(project, api_key, cost=20)
+    with pytest.raises(RateLimitExceeded):
+        limiter.check(project, api_key)
+
+
+def test_check_rejects_oversized_batch_until_the_bucket_refills(limiter):
+    project, api_key = _owner(None), _owner(5)
+    limiter.check(project, api_key)
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.check(project, api_key, cost=20)
+    assert exc.value.retry_after == pytest.approx(0.2, abs=0.05)
+
+
+def test_project_rejection_refunds_the_key_bucket(limiter):
+    project, api_key = _owner(1), _owner(100)
+    limiter.check(project, api_key, cost=2)
+    with pytest.raises(RateLimitExceeded, match="project"):
+        limiter.check(project, api_key, cost=5)
+    assert limiter._buckets[("key", api_key.id)].tokens == pytest.approx(198, abs=1)
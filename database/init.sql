@@ -9,6 +9,8 @@
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram similarity for GET /api/chat/search?mode=trigram
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- ===========================================
 -- PROJECTS TABLE
@@ -17,8 +19,12 @@ CREATE TABLE IF NOT EXISTS projects (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     name VARCHAR(255) NOT NULL,
     description TEXT,
-    username VARCHAR(100) NOT NULL UNIQUE,
+    username VARCHAR(100) NOT NULL,
     password_hash VARCHAR(255) NOT NULL,
+    rate_limit_rps DOUBLE PRECISION,
+    daily_token_quota BIGINT,
+    history_retention_days INTEGER CHECK (history_retention_days > 0),
+    deleted_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -32,6 +38,8 @@ CREATE TABLE IF NOT EXISTS project_api_keys (
     name VARCHAR(100) NOT NULL,
     api_key VARCHAR(255) NOT NULL UNIQUE,
     is_active BOOLEAN DEFAULT TRUE,
+    rate_limit_rps DOUBLE PRECISION,
+    daily_token_quota BIGINT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     last_used_at TIMESTAMP WITH TIME ZONE
 );
@@ -58,9 +66,9 @@ CREATE TABLE IF NOT EXISTS agents (
     project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
     name VARCHAR(255) NOT NULL,
     description TEXT,
+    deleted_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(project_id, name)
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
 -- ===========================================
@@ -71,6 +79,8 @@ CREATE TABLE IF NOT EXISTS agent_versions (
     agent_id UUID NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
     version_number INTEGER NOT NULL,
     system_prompt TEXT NOT NULL,
+    prompt_segments JSONB,
+    prompt_variables TEXT[],
     model_name VARCHAR(100) NOT NULL,
     api_key_encrypted TEXT NOT NULL,
     model_profile_id UUID REFERENCES model_profiles(id) ON DELETE SET NULL,
@@ -81,7 +91,11 @@ CREATE TABLE IF NOT EXISTS agent_versions (
     frequency_penalty DECIMAL(3,2) DEFAULT 0.0,
     presence_penalty DECIMAL(3,2) DEFAULT 0.0,
     stop_sequences TEXT[],
+    history_max_turns INTEGER,
+    history_max_tokens INTEGER,
+    response_cache_enabled BOOLEAN DEFAULT FALSE,
     is_active BOOLEAN DEFAULT FALSE,
+    deleted_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     notes TEXT,
     UNIQUE(agent_id, version_number)
@@ -90,8 +104,25 @@ CREATE TABLE IF NOT EXISTS agent_versions (
 -- ===========================================
 -- CHAT HISTORY TABLE
 -- ===========================================
+-- Range-partitioned by month on created_at (partitions chat_history_pYYYYMM,
+-- bounds in UTC). The app's maintenance worker keeps future months created and
+-- drops or detaches whole months once every project's retention has passed.
+
+-- A chat_history created before partitioning is moved aside and copied below
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('chat_history') AND relkind = 'r') THEN
+        ALTER TABLE chat_history RENAME TO chat_history_unpartitioned;
+        ALTER TABLE chat_history_unpartitioned RENAME CONSTRAINT chat_history_pkey TO chat_history_unpartitioned_pkey;
+        DROP INDEX IF EXISTS idx_chat_history_project_id;
+        DROP INDEX IF EXISTS idx_chat_history_session_id;
+        DROP INDEX IF EXISTS idx_chat_history_session_created;
+        DROP INDEX IF EXISTS idx_chat_history_agent_version_id;
+    END IF;
+END $$;
+
 CREATE TABLE IF NOT EXISTS chat_history (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
     agent_version_id UUID NOT NULL REFERENCES agent_versions(id) ON DELETE CASCADE,
     project_api_key_id UUID REFERENCES project_api_keys(id) ON DELETE SET NULL,
@@ -101,20 +132,348 @@ CREATE TABLE IF NOT EXISTS chat_history (
     tokens_used INTEGER,
     prompt_tokens INTEGER,
     completion_tokens INTEGER,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Full-text search document ('simple': no stemming, any language); capped
+    -- so an oversized message cannot exceed tsvector's 1 MB limit
+    content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, left(content, 100000))) STORED,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows no monthly partition exists for yet (maintenance fell behind),
+-- so chat inserts never fail; ensure_chat_history_partitions moves them out
+CREATE TABLE IF NOT EXISTS chat_history_default PARTITION OF chat_history DEFAULT;
+
+-- Create the monthly partitions from p_from's month (or the oldest month
+-- waiting in chat_history_default) through p_months_ahead months after the
+-- current one; returns how many were created.
+CREATE OR REPLACE FUNCTION ensure_chat_history_partitions(p_from DATE, p_months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::date;
+    last_month DATE := (date_trunc('month', (now() AT TIME ZONE 'UTC')) + make_interval(months => p_months_ahead))::date;
+    oldest_default TIMESTAMP WITH TIME ZONE;
+    lower_bound TIMESTAMP WITH TIME ZONE;
+    upper_bound TIMESTAMP WITH TIME ZONE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT min(created_at) INTO oldest_default FROM chat_history_default;
+    IF oldest_default IS NOT NULL THEN
+        month_start := least(month_start, date_trunc('month', oldest_default AT TIME ZONE 'UTC')::date);
+    END IF;
+    WHILE month_start <= last_month LOOP
+        partition_name := 'chat_history_p' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(partition_name) IS NULL THEN
+            lower_bound := month_start::timestamp AT TIME ZONE 'UTC';
+            upper_bound := (month_start + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+            -- A new partition may not overlap rows left in the default one: set them aside first
+            CREATE TEMP TABLE chat_history_moving (LIKE chat_history_default);
+            WITH moved AS (
+                DELETE FROM chat_history_default
+                WHERE created_at >= lower_bound AND created_at < upper_bound
+                RETURNING id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+                          tokens_used, prompt_tokens, completion_tokens, created_at
+            )
+            INSERT INTO chat_history_moving (
+                id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+                tokens_used, prompt_tokens, completion_tokens, created_at
+            )
+            SELECT * FROM moved;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF chat_history FOR VALUES FROM (%L) TO (%L)',
+                partition_name, lower_bound, upper_bound
+            );
+            INSERT INTO chat_history (
+                id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+                tokens_used, prompt_tokens, completion_tokens, created_at
+            )
+            SELECT
+                id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+                tokens_used, prompt_tokens, completion_tokens, created_at
+            FROM chat_history_moving;
+            DROP TABLE chat_history_moving;
+            created := created + 1;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    oldest TIMESTAMP WITH TIME ZONE;
+BEGIN
+    IF to_regclass('chat_history_unpartitioned') IS NOT NULL THEN
+        SELECT min(created_at) INTO oldest FROM chat_history_unpartitioned;
+        PERFORM ensure_chat_history_partitions(
+            COALESCE((oldest AT TIME ZONE 'UTC')::date, (now() AT TIME ZONE 'UTC')::date), 3
+        );
+        INSERT INTO chat_history (
+            id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+            tokens_used, prompt_tokens, completion_tokens, created_at
+        )
+        SELECT
+            id, project_id, agent_version_id, project_api_key_id, session_id, role, content,
+            tokens_used, prompt_tokens, completion_tokens, COALESCE(created_at, now())
+        FROM chat_history_unpartitioned;
+        DROP TABLE chat_history_unpartitioned;
+    END IF;
+END $$;
+
+SELECT ensure_chat_history_partitions((now() AT TIME ZONE 'UTC')::date, 3);
+
+-- ===========================================
+-- UPGRADES FOR EXISTING DATABASES
+-- ===========================================
+-- Columns added after the initial schema; safe to re-run.
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS history_max_turns INTEGER;
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS history_max_tokens INTEGER;
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS prompt_segments JSONB;
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS prompt_variables TEXT[];
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS response_cache_enabled BOOLEAN DEFAULT FALSE;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS rate_limit_rps DOUBLE PRECISION;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS daily_token_quota BIGINT;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS history_retention_days INTEGER CHECK (history_retention_days > 0);
+ALTER TABLE project_api_keys ADD COLUMN IF NOT EXISTS rate_limit_rps DOUBLE PRECISION;
+ALTER TABLE project_api_keys ADD COLUMN IF NOT EXISTS daily_token_quota BIGINT;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE agents ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE agent_versions ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+-- Names are unique among live rows only (see the partial indexes below), so a
+-- name is free again as soon as its owner is queued for deletion
+ALTER TABLE projects DROP CONSTRAINT IF EXISTS projects_username_key;
+ALTER TABLE agents DROP CONSTRAINT IF EXISTS agents_project_id_name_key;
+-- Rewrites every chat_history partition once; run it in a quiet period
+ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, left(content, 100000))) STORED;
+
+-- ===========================================
+-- API KEY DAILY USAGE (rate limits / token quotas)
+-- ===========================================
+-- Each API worker counts in memory and adds its deltas here periodically;
+-- the summed rows are what every worker enforces daily quotas against.
+CREATE TABLE IF NOT EXISTS api_key_usage_daily (
+    api_key_id UUID NOT NULL REFERENCES project_api_keys(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    tokens_used BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (api_key_id, day)
 );
 
+-- ===========================================
+-- CHAT SESSIONS TABLE (per-session aggregates)
+-- ===========================================
+-- Maintained in the same transaction as chat_history inserts so per-turn
+-- token totals are an O(1) read instead of SUM() over the whole session.
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id UUID PRIMARY KEY,
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    -- Version of the latest message; NULL once that version is deleted, since
+    -- the session's messages with other versions are still there
+    agent_version_id UUID REFERENCES agent_versions(id) ON DELETE SET NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    total_tokens BIGINT,
+    total_prompt_tokens BIGINT,
+    total_completion_tokens BIGINT,
+    first_message_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_message_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Upgrade: sessions used to be dropped together with their latest version
+ALTER TABLE chat_sessions ALTER COLUMN agent_version_id DROP NOT NULL;
+ALTER TABLE chat_sessions DROP CONSTRAINT IF EXISTS chat_sessions_agent_version_id_fkey;
+ALTER TABLE chat_sessions ADD CONSTRAINT chat_sessions_agent_version_id_fkey
+    FOREIGN KEY (agent_version_id) REFERENCES agent_versions(id) ON DELETE SET NULL;
+
+-- Backfill aggregates for sessions created before chat_sessions existed
+INSERT INTO chat_sessions (
+    session_id, project_id, agent_version_id, message_count,
+    total_tokens, total_prompt_tokens, total_completion_tokens,
+    first_message_at, last_message_at
+)
+SELECT
+    session_id,
+    (ARRAY_AGG(project_id ORDER BY created_at DESC))[1],
+    (ARRAY_AGG(agent_version_id ORDER BY created_at DESC))[1],
+    COUNT(*),
+    SUM(tokens_used),
+    SUM(prompt_tokens),
+    SUM(completion_tokens),
+    MIN(created_at),
+    MAX(created_at)
+FROM chat_history
+GROUP BY session_id
+ON CONFLICT (session_id) DO NOTHING;
+
+-- ===========================================
+-- LLM RESPONSE CACHE (RESPONSE_CACHE_BACKEND=postgres)
+-- ===========================================
+-- Exact-match answers of temperature-0 versions that opted in, keyed by
+-- sha256(version id, rendered prompt, history, message).
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    agent_version_id UUID NOT NULL REFERENCES agent_versions(id) ON DELETE CASCADE,
+    response TEXT NOT NULL,
+    tokens_used INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- ===========================================
+-- EVALUATION JOBS
+-- ===========================================
+-- A job runs every item against every listed agent version in the background.
+-- Progress counters are updated as result batches are written; a job whose
+-- lease expired (process restart) is picked up again and only the missing
+-- (item, version) results are produced.
+CREATE TABLE IF NOT EXISTS eval_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'running', 'completed', 'cancelled', 'failed')),
+    agent_version_ids UUID[] NOT NULL,
+    concurrency INTEGER NOT NULL DEFAULT 4,
+    total_items INTEGER NOT NULL DEFAULT 0,
+    total_results INTEGER NOT NULL DEFAULT 0,
+    succeeded_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS eval_job_items (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    job_id UUID NOT NULL REFERENCES eval_jobs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    input TEXT NOT NULL,
+    variables JSONB,
+    UNIQUE(job_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS eval_results (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    job_id UUID NOT NULL REFERENCES eval_jobs(id) ON DELETE CASCADE,
+    item_id UUID NOT NULL REFERENCES eval_job_items(id) ON DELETE CASCADE,
+    agent_version_id UUID NOT NULL REFERENCES agent_versions(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('succeeded', 'failed')),
+    output TEXT,
+    error TEXT,
+    tokens_used INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(item_id, agent_version_id)
+);
+
+-- ===========================================
+-- DELETION JOBS
+-- ===========================================
+-- Large projects, agents and versions are hidden (deleted_at) and removed in
+-- the background: sessions, then chat_history in bounded batches, then the
+-- row itself. project_id has no foreign key so the job outlives its project.
+CREATE TABLE IF NOT EXISTS deletion_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    project_id UUID NOT NULL,
+    target_type VARCHAR(20) NOT NULL
+        CHECK (target_type IN ('project', 'agent', 'agent_version')),
+    target_id UUID NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending'
+        CHECK (status IN ('pending', 'running', 'completed', 'failed')),
+    estimated_rows BIGINT NOT NULL DEFAULT 0,
+    rows_deleted BIGINT NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- ===========================================
+-- USAGE ROLLUPS
+-- ===========================================
+-- Messages and tokens per agent version and API key, per hour and per UTC day,
+-- upserted in the same transaction as the chat_history rows they count, so
+-- usage reports read buckets instead of summing messages. api_key_id is the
+-- nil UUID for chats without an API key. Keys, agents and versions are not
+-- foreign keys, so past usage survives their deletion.
+-- Backfill: python -m scripts.rebuild_usage_rollups
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    granularity VARCHAR(4) NOT NULL CHECK (granularity IN ('hour', 'day')),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    agent_version_id UUID NOT NULL,
+    api_key_id UUID NOT NULL,
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    agent_id UUID NOT NULL,
+    message_count BIGINT NOT NULL DEFAULT 0,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket_start, agent_version_id, api_key_id)
+);
+
+-- Upgrade: rollups used to be keyed by (and deleted with) the agent version
+ALTER TABLE usage_rollups DROP CONSTRAINT IF EXISTS usage_rollups_agent_version_id_fkey;
+ALTER TABLE usage_rollups ADD COLUMN IF NOT EXISTS agent_id UUID;
+UPDATE usage_rollups u SET agent_id = v.agent_id
+FROM agent_versions v
+WHERE u.agent_id IS NULL AND v.id = u.agent_version_id;
+ALTER TABLE usage_rollups ALTER COLUMN agent_id SET NOT NULL;
+
 -- ===========================================
 -- INDEXES
 -- ===========================================
 CREATE INDEX IF NOT EXISTS idx_project_api_keys_project_id ON project_api_keys(project_id);
 CREATE INDEX IF NOT EXISTS idx_project_api_keys_api_key ON project_api_keys(api_key);
 CREATE INDEX IF NOT EXISTS idx_agents_project_id ON agents(project_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_projects_username_live ON projects(username) WHERE deleted_at IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_agents_project_name_live ON agents(project_id, name) WHERE deleted_at IS NULL;
+-- Chat resolves agents case-insensitively: lower(name) = lower(:agent_name)
+CREATE INDEX IF NOT EXISTS idx_agents_project_lower_name ON agents(project_id, lower(name));
 CREATE INDEX IF NOT EXISTS idx_agent_versions_agent_id ON agent_versions(agent_id);
 CREATE INDEX IF NOT EXISTS idx_agent_versions_is_active ON agent_versions(is_active);
-CREATE INDEX IF NOT EXISTS idx_chat_history_project_id ON chat_history(project_id);
-CREATE INDEX IF NOT EXISTS idx_chat_history_session_id ON chat_history(session_id);
+CREATE INDEX IF NOT EXISTS idx_api_key_usage_daily_project_day ON api_key_usage_daily(project_id, day);
+-- Keyset pagination of /chat/history: (created_at, id) < cursor, newest first
+DROP INDEX IF EXISTS idx_chat_history_project_id;
+CREATE INDEX IF NOT EXISTS idx_chat_history_project_created_id ON chat_history(project_id, created_at DESC, id DESC);
+-- Serves both session lookups and newest-first history tails
+CREATE INDEX IF NOT EXISTS idx_chat_history_session_created ON chat_history(session_id, created_at);
+DROP INDEX IF EXISTS idx_chat_history_session_id;
 CREATE INDEX IF NOT EXISTS idx_chat_history_agent_version_id ON chat_history(agent_version_id);
+-- Search indexes (created on every partition). fastupdate makes an insert
+-- append to a pending list instead of updating the index; the app's
+-- chat-search-index worker merges the lists every CHAT_SEARCH_FLUSH_SECONDS,
+-- and the 16 MB limit leaves it room so inserts rarely have to do it.
+CREATE INDEX IF NOT EXISTS idx_chat_history_content_tsv ON chat_history
+    USING GIN (content_tsv) WITH (fastupdate = on, gin_pending_list_limit = 16384);
+CREATE INDEX IF NOT EXISTS idx_chat_history_content_trgm ON chat_history
+    USING GIN (content gin_trgm_ops) WITH (fastupdate = on, gin_pending_list_limit = 16384);
+-- Keyset pagination of /chat/sessions: (last_message_at, session_id) < cursor
+DROP INDEX IF EXISTS idx_chat_sessions_project_last_message;
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_project_last_message_id ON chat_sessions(project_id, last_message_at DESC, session_id DESC);
+-- Version/agent deletes: ON DELETE CASCADE and deletion job batches
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_agent_version_id ON chat_sessions(agent_version_id);
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires_at ON llm_response_cache(expires_at);
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_version ON llm_response_cache(agent_version_id);
+CREATE INDEX IF NOT EXISTS idx_eval_jobs_project_created ON eval_jobs(project_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_eval_jobs_claimable ON eval_jobs(lease_expires_at) WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS idx_eval_results_job_id ON eval_results(job_id);
+-- ON DELETE CASCADE from agent_versions would otherwise scan eval_results
+CREATE INDEX IF NOT EXISTS idx_eval_results_agent_version_id ON eval_results(agent_version_id);
+CREATE INDEX IF NOT EXISTS idx_usage_rollups_project_bucket ON usage_rollups(project_id, granularity, bucket_start);
+DROP INDEX IF EXISTS idx_usage_rollups_agent_version_id;
+CREATE INDEX IF NOT EXISTS idx_deletion_jobs_project_created ON deletion_jobs(project_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_deletion_jobs_claimable ON deletion_jobs(created_at) WHERE status IN ('pending', 'running');
 
 -- ===========================================
 -- FUNCTIONS